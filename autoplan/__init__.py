@@ -3,31 +3,64 @@
 
 """
 
+from autoplan.batch import BatchResult, run_many
+from autoplan.cache import Cache, DiskCache, InMemoryCache, SqliteCache
 from autoplan.chain import chain
+from autoplan.concurrency import set_global_concurrency_limit
 from autoplan.core import with_planning
 from autoplan.dependency import Dependency
+from autoplan.executors import get_executor_metrics, set_executor
+from autoplan.llm_utils.completion import set_llm_cache
+from autoplan.llm_utils.hedging import HedgingPolicy, set_hedging_policy
+from autoplan.llm_utils.http_clients import aclose_http_clients, set_http_client_options
+from autoplan.llm_utils.retry import RetryPolicy, set_retry_policy
 from autoplan.models import Plan, Step
+from autoplan.rendering import render_step_results
 from autoplan.results import (
     FinalResult,
+    PartialFinalResult,
     PartialPlanResult,
     PlanResult,
     StepResult,
 )
+from autoplan.scheduler import FailurePolicy, StepFailedError
+from autoplan.speculation import Speculator
 from autoplan.tool import tool
 from autoplan.trace import WeaveTracer, set_tracer, trace
 
 __all__ = [
+    "BatchResult",
+    "Cache",
+    "DiskCache",
+    "InMemoryCache",
+    "SqliteCache",
     "Dependency",
+    "FailurePolicy",
     "FinalResult",
     "Step",
     "Plan",
     "PartialPlanResult",
+    "PartialFinalResult",
     "PlanResult",
     "StepResult",
+    "StepFailedError",
+    "Speculator",
     "tool",
     "with_planning",
+    "run_many",
+    "render_step_results",
     "trace",
     "set_tracer",
+    "set_llm_cache",
+    "RetryPolicy",
+    "set_retry_policy",
+    "HedgingPolicy",
+    "set_hedging_policy",
+    "set_http_client_options",
+    "aclose_http_clients",
+    "set_global_concurrency_limit",
+    "set_executor",
+    "get_executor_metrics",
     "WeaveTracer",
     "chain",
 ]
@@ -0,0 +1,94 @@
+from functools import cached_property
+from typing import Any
+
+from pydantic import BaseModel, TypeAdapter
+from pydantic_partial import create_partial_model
+
+from autoplan.cache import make_cache_key
+from autoplan.execution_context import ExecutionContext
+from autoplan.models import Plan, Step, create_plan_class
+from autoplan.tool import Tool
+
+
+class CompiledModel[T: BaseModel]:
+    """
+    The JSON schema and validators of a model used as a structured output, computed once.
+    """
+
+    def __init__(self, model: type[T]):
+        self.model = model
+        self.json_schema = model.model_json_schema()
+        # identifies the schema in cache keys
+        self.schema_hash = make_cache_key(self.json_schema)
+        self.response_format = {
+            "type": "json_schema",
+            "json_schema": {"schema": self.json_schema, "name": model.__name__},
+        }
+        self.adapter: TypeAdapter[T] = TypeAdapter(model)
+
+    @cached_property
+    def partial_model(self) -> type[T]:
+        """
+        A version of the model where all the fields are optional, to validate partially generated outputs.
+        """
+        return create_partial_model(self.model)
+
+
+# compiled models are kept for the life of the process: they reference their model (e.g. through their validators),
+# so it couldn't be collected anyway, and models are classes created once (e.g. the plan class of an application)
+_compiled_models: dict[type[BaseModel], CompiledModel] = {}
+
+
+def compile_model[T: BaseModel](model: type[T]) -> CompiledModel[T]:
+    """
+    Get the compiled version of a model, compiling it the first time.
+    """
+    if model not in _compiled_models:
+        _compiled_models[model] = CompiledModel(model)
+    return _compiled_models[model]
+
+
+class CompiledApplication:
+    """
+    The parts of a `with_planning` application that are the same for every run, built once when it's decorated:
+    the plan class with the application's tools, and the compiled plan and output models.
+    """
+
+    def __init__(
+        self,
+        step_class: type[Step],
+        plan_class: type[Plan],
+        tools: list,
+        tool_classes: list[type[Tool]],
+        output_model: type[BaseModel],
+        generate_plan_llm_model: str,
+        generate_plan_llm_args: dict,
+        combine_steps_llm_model: str,
+        combine_steps_llm_args: dict,
+    ):
+        # the tools as they were passed to `with_planning` (nested applications aren't Tool subclasses)
+        self.tools = tools
+        self.plan_class = create_plan_class(step_class, plan_class, tool_classes)
+        self.output_model = output_model
+        self.plan = compile_model(self.plan_class)
+        self.output = compile_model(output_model)
+        self.generate_plan_llm_model = generate_plan_llm_model
+        self.generate_plan_llm_args = generate_plan_llm_args
+        self.combine_steps_llm_model = combine_steps_llm_model
+        self.combine_steps_llm_args = combine_steps_llm_args
+
+    def create_context(self, application_args: dict[str, Any]) -> ExecutionContext:
+        """
+        Create the context of a run.
+        """
+        # the fields were validated when the application was compiled
+        return ExecutionContext.model_construct(
+            plan_class=self.plan_class,
+            tools=self.tools,
+            output_model=self.output_model,
+            application_args=application_args,
+            generate_plan_llm_model=self.generate_plan_llm_model,
+            generate_plan_llm_args=self.generate_plan_llm_args,
+            combine_steps_llm_model=self.combine_steps_llm_model,
+            combine_steps_llm_args=self.combine_steps_llm_args,
+        )
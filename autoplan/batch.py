@@ -0,0 +1,97 @@
+import asyncio
+from typing import Any, AsyncGenerator, Callable, Iterable
+
+from pydantic import BaseModel, SerializeAsAny
+
+from autoplan.results import FinalResult, Result
+
+
+class BatchResult(Result):
+    """
+    The outcome of running an application on one of the inputs of a batch.
+    """
+
+    # the position of the input in the batch
+    index: int
+    # the arguments of the run (None if the input couldn't be read)
+    input: Any
+    # the final result of the application (None if the run failed)
+    result: SerializeAsAny[BaseModel] | None = None
+    # a description of why the run failed
+    error: str | None = None
+
+
+async def _run_one(
+    app: Callable, index: int, input: dict[str, Any] | Exception
+) -> BatchResult:
+    if isinstance(input, Exception):
+        return BatchResult(
+            index=index, input=None, error=f"{type(input).__name__}: {input}"
+        )
+    if not isinstance(input, dict):
+        return BatchResult(
+            index=index,
+            input=input,
+            error=f"TypeError: expected a dict of the arguments of the application, got {type(input).__name__}",
+        )
+
+    try:
+        async for r in app(**input):
+            if isinstance(r, FinalResult):
+                return BatchResult(index=index, input=input, result=r.result)
+        raise RuntimeError("The application didn't produce a final result")
+    except Exception as e:
+        return BatchResult(index=index, input=input, error=f"{type(e).__name__}: {e}")
+
+
+async def run_many(
+    app: Callable,
+    inputs: Iterable[dict[str, Any] | Exception],
+    concurrency: int = 8,
+) -> AsyncGenerator[BatchResult, None]:
+    """
+    Run a `with_planning` application on many inputs, yielding the results as the runs finish.
+
+    Each input is a dict of the arguments of the application. At most `concurrency` runs are in
+    progress at a time, and inputs are only read when a run can start, so `inputs` can be a lazy
+    iterator over a large file. The runs share everything that is set up once per process: the
+    global concurrency limit (see `set_global_concurrency_limit`), the plan and tool caches, and the
+    HTTP clients used to call the LLMs.
+
+    A failing run doesn't stop the batch: its result has an `error` instead of a `result`. So do invalid
+    inputs: inputs that aren't dicts, and inputs that couldn't be read, given as the exception that
+    reading them raised (e.g. a malformed line of a JSONL file).
+    Closing the generator cancels the runs in progress.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+
+    inputs_iterator = enumerate(inputs)
+    running: set[asyncio.Task[BatchResult]] = set()
+
+    def start_next() -> bool:
+        if (item := next(inputs_iterator, None)) is None:
+            return False
+
+        index, input = item
+        running.add(asyncio.create_task(_run_one(app, index, input)))
+        return True
+
+    try:
+        while len(running) < concurrency and start_next():
+            pass
+
+        while running:
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                running.remove(task)
+                # keep the number of runs in progress constant
+                start_next()
+
+            for task in done:
+                yield task.result()
+    finally:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any
+
+
+def make_cache_key(*parts: Any) -> str:
+    """
+    Create a stable cache key from JSON-serializable parts.
+    """
+    serialized = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+class Cache(ABC):
+    """
+    A key-value store used to skip repeated work (e.g. generating the same plan twice).
+    """
+
+    @abstractmethod
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        Get the value stored for a key, or `default` if it is missing or expired.
+        """
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: float | None = None):
+        """
+        Store a value for a key. `ttl` (in seconds) overrides the default time to live of the cache.
+        """
+
+    @abstractmethod
+    def clear(self):
+        """
+        Remove all the values from the cache.
+        """
+
+
+class InMemoryCache(Cache):
+    """
+    A least-recently-used cache held in memory, local to the process.
+
+    max_size: The maximum number of values to keep.
+    ttl: The default time to live of the values, in seconds (None means values don't expire).
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float | None = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._values: OrderedDict[str, tuple[Any, float | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._values:
+                return default
+
+            value, expires_at = self._values[key]
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._values[key]
+                return default
+
+            self._values.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float | None = None):
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+
+        with self._lock:
+            self._values[key] = (value, expires_at)
+            self._values.move_to_end(key)
+
+            while len(self._values) > self.max_size:
+                self._values.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def __len__(self):
+        return len(self._values)
+
+
+class SqliteCache(Cache):
+    """
+    A cache stored in a sqlite database on disk, which can be shared by several processes.
+
+    Values are pickled, so only share the database between processes that trust each other.
+
+    path: The path of the database file.
+    ttl: The default time to live of the values, in seconds (None means values don't expire).
+    max_size: The maximum number of values to keep, evicting the least recently used ones (None means no limit).
+    """
+
+    def __init__(
+        self, path: str, ttl: float | None = None, max_size: int | None = None
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._connection: sqlite3.Connection | None = None
+        self._pid: int | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # connections can't be shared with forked worker processes, so each process opens its own
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=30, check_same_thread=False, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    expires_at REAL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)"
+            )
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                return default
+
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return default
+
+            if self.max_size is not None:
+                connection.execute(
+                    "UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+
+        return pickle.loads(value)
+
+    def set(self, key: str, value: Any, ttl: float | None = None):
+        now = time.time()
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = now + ttl if ttl is not None else None
+        data = pickle.dumps(value)
+
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, data, expires_at, now),
+            )
+
+            if self.max_size is not None:
+                connection.execute(
+                    """
+                    DELETE FROM cache WHERE key IN (
+                        SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (self.max_size,),
+                )
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM cache")
+
+
+class DiskCache(Cache):
+    """
+    A content-addressed cache on disk, storing each value in its own file named after its key.
+
+    The directory can be shared by several processes: files are written atomically, so readers
+    never see partially written values. Values are pickled, so only share the directory between
+    processes that trust each other.
+
+    directory: The directory to store the values in.
+    ttl: The default time to live of the values, in seconds (None means values don't expire).
+    """
+
+    def __init__(self, directory: str, ttl: float | None = None):
+        self.directory = directory
+        self.ttl = ttl
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        # shard the files so a single directory doesn't get too large
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        path = self._path(key)
+
+        try:
+            with open(path, "rb") as f:
+                expires_at, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return default
+
+        if expires_at is not None and expires_at <= time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return default
+
+        return value
+
+    def set(self, key: str, value: Any, ttl: float | None = None):
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        path = self._path(key)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "wb") as f:
+            pickle.dump((expires_at, value), f)
+        os.replace(temporary_path, path)
+
+    def clear(self):
+        for root, _, files in os.walk(self.directory):
+            for file in files:
+                os.remove(os.path.join(root, file))
@@ -0,0 +1,133 @@
+import asyncio
+from collections import deque
+from typing import Callable
+
+from autoplan.results import PartialFinalResult, PartialPlanResult
+
+
+def _is_partial_result(item) -> bool:
+    return isinstance(item, (PartialPlanResult, PartialFinalResult))
+
+
+class ResultChannel[T]:
+    """
+    A bounded channel passing the results of a run from its producers to its consumer.
+
+    Snapshots (by default, partially generated plans and final results) are coalesced: a new snapshot
+    replaces the one still waiting to be consumed, so producing them never blocks. Other items are never dropped:
+    `put` waits while `max_size` of them are waiting to be consumed, slowing down the producer instead.
+    The memory used by the channel is therefore bounded, however slow the consumer is.
+
+    The producer closes the channel once it is done, optionally with an error, which is raised to the
+    consumer after the remaining items. The channel is consumed with `async for`.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 64,
+        is_snapshot: Callable[[T], bool] = _is_partial_result,
+    ):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+
+        self.max_size = max_size
+        self._is_snapshot = is_snapshot
+        self._items: deque[T] = deque()
+        # the number of items that aren't snapshots
+        self._size = 0
+        self._has_snapshot = False
+        self._closed = False
+        self._error: BaseException | None = None
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+    def _update(self):
+        if self._items or self._closed:
+            self._readable.set()
+        else:
+            self._readable.clear()
+
+        if self._size < self.max_size or self._closed:
+            self._writable.set()
+        else:
+            self._writable.clear()
+
+    def full(self) -> bool:
+        return self._size >= self.max_size
+
+    def put_nowait(self, item: T):
+        """
+        Put an item on the channel, raising `asyncio.QueueFull` if it has no room for it.
+
+        Snapshots always fit, since they replace the snapshot waiting to be consumed.
+        """
+        if self._closed:
+            raise RuntimeError("Can't put an item on a closed channel")
+
+        if self._is_snapshot(item):
+            if self._has_snapshot:
+                # only the latest snapshot is worth consuming
+                for index in range(len(self._items) - 1, -1, -1):
+                    if self._is_snapshot(self._items[index]):
+                        del self._items[index]
+                        break
+            self._has_snapshot = True
+        else:
+            if self.full():
+                raise asyncio.QueueFull()
+            self._size += 1
+
+        self._items.append(item)
+        self._update()
+
+    async def put(self, item: T):
+        """
+        Put an item on the channel, waiting for the consumer to make room for it if needed.
+        """
+        while not self._is_snapshot(item) and self.full() and not self._closed:
+            await self._writable.wait()
+
+        self.put_nowait(item)
+
+    def close(self, error: BaseException | None = None):
+        """
+        Close the channel. Only the first call has an effect.
+        """
+        if self._closed:
+            return
+
+        self._closed = True
+        self._error = error
+        self._update()
+
+    async def get(self) -> T:
+        """
+        Get the next item, raising the error the channel was closed with (or `StopAsyncIteration`)
+        once there are no items left.
+        """
+        while not self._items:
+            if self._closed:
+                if self._error is not None:
+                    raise self._error
+                raise StopAsyncIteration()
+            await self._readable.wait()
+
+        item = self._items.popleft()
+
+        if self._is_snapshot(item):
+            self._has_snapshot = False
+        else:
+            self._size -= 1
+
+        self._update()
+        return item
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> T:
+        return await self.get()
+
+    def __len__(self):
+        return len(self._items)
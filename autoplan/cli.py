@@ -1,9 +1,16 @@
+import asyncio
+import importlib
 import importlib.resources as resources
+import json
+import os
+import sys
+import time
 
 import click
 from cookiecutter.main import cookiecutter
 
 import autoplan
+from autoplan.batch import run_many
 
 
 @click.group()
@@ -29,7 +36,85 @@ def generate(name, description, outdir):
     )
 
 
+def _load_application(path: str):
+    module_name, _, attribute = path.partition(":")
+    if not attribute:
+        raise click.BadParameter("expected 'module:function'", param_hint="APP")
+
+    # allow loading applications from the current directory, like `python -m` does
+    sys.path.insert(0, os.getcwd())
+
+    try:
+        return getattr(importlib.import_module(module_name), attribute)
+    except (ImportError, AttributeError) as e:
+        raise click.BadParameter(str(e), param_hint="APP")
+
+
+def _read_inputs(file):
+    for line in file:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                # a malformed line fails its run, not the whole batch
+                yield e
+
+
+async def _run_batch(app, input_file, output_file, concurrency: int):
+    completed = failed = 0
+    start = time.perf_counter()
+
+    async for result in run_many(app, _read_inputs(input_file), concurrency):
+        output_file.write(result.model_dump_json() + "\n")
+        output_file.flush()
+
+        completed += 1
+        failed += result.error is not None
+
+        throughput = completed / (time.perf_counter() - start)
+        click.echo(
+            f"\r{completed} completed, {failed} failed ({throughput:.2f} runs/s)",
+            err=True,
+            nl=False,
+        )
+
+    click.echo(err=True)
+
+
+@cli.command(short_help="Run an application on each input of a JSONL file")
+@click.argument("app")
+@click.option(
+    "--input",
+    "input_file",
+    type=click.File("r"),
+    default="-",
+    help="A JSONL file with the arguments of a run on each line (defaults to stdin).",
+)
+@click.option(
+    "--output",
+    "output_file",
+    type=click.File("w"),
+    default="-",
+    help="The JSONL file to write the results to, in the order they finish (defaults to stdout).",
+)
+@click.option(
+    "--concurrency",
+    type=click.IntRange(min=1),
+    default=8,
+    show_default=True,
+    help="The maximum number of runs in progress at a time.",
+)
+def run(app, input_file, output_file, concurrency):
+    """
+    Run the APP application (e.g. `stock_benchmark.main:run`) on each input of a JSONL file.
+    """
+    asyncio.run(
+        _run_batch(_load_application(app), input_file, output_file, concurrency)
+    )
+
+
 cli.add_command(generate)
+cli.add_command(run)
 
 if __name__ == "__main__":
     cli()
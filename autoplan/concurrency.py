@@ -0,0 +1,68 @@
+import asyncio
+from contextlib import AsyncExitStack, asynccontextmanager
+from weakref import WeakKeyDictionary
+
+
+class ConcurrencyLimiter:
+    """
+    Limits the number of steps that run at the same time.
+
+    A limiter without a limit never blocks. Waiting steps are admitted in FIFO order.
+    The limiter can be shared between event loops (e.g. a tool used by several `asyncio.run` calls),
+    each loop getting its own set of slots.
+    """
+
+    def __init__(self, max_concurrency: int | None = None):
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+
+        self.max_concurrency = max_concurrency
+        self._semaphores: WeakKeyDictionary[
+            asyncio.AbstractEventLoop, asyncio.Semaphore
+        ] = WeakKeyDictionary()
+
+    def _semaphore(self) -> asyncio.Semaphore | None:
+        if self.max_concurrency is None:
+            return None
+
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphores[loop]
+
+    async def __aenter__(self):
+        if semaphore := self._semaphore():
+            await semaphore.acquire()
+
+    async def __aexit__(self, *args):
+        if semaphore := self._semaphore():
+            semaphore.release()
+
+
+_global_limiter = ConcurrencyLimiter()
+
+
+def set_global_concurrency_limit(max_concurrency: int | None):
+    """
+    Set the maximum number of steps that can run at the same time across all the runs in the process.
+    """
+    global _global_limiter
+    _global_limiter = ConcurrencyLimiter(max_concurrency)
+
+
+def get_global_limiter() -> ConcurrencyLimiter:
+    return _global_limiter
+
+
+@asynccontextmanager
+async def limit(*limiters: ConcurrencyLimiter):
+    """
+    Acquire a slot from each of the limiters, in order.
+
+    Limiters should be passed from the most specific to the most general (e.g. tool, run, process),
+    so a step waiting for a narrow limit doesn't hold a slot of a wider one.
+    """
+    async with AsyncExitStack() as stack:
+        for limiter in limiters:
+            await stack.enter_async_context(limiter)
+        yield
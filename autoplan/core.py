@@ -2,23 +2,38 @@ import asyncio
 import functools
 import inspect
 from functools import wraps
-from typing import Callable, Optional, TypeVar
+from typing import Callable, Optional, Sequence, TypeVar, cast
 
 from dotenv import load_dotenv
 from pydantic import BaseModel
 
+from autoplan.application import CompiledApplication
+from autoplan.cache import Cache
+from autoplan.channel import ResultChannel
+from autoplan.concurrency import ConcurrencyLimiter, get_global_limiter, limit
 from autoplan.execution_context import ExecutionContext
 from autoplan.func_utils import with_name
-from autoplan.models import Plan, Step, create_plan_class
-from autoplan.phases.combine_steps import combine_steps
+from autoplan.llm_utils.retry import start_retry_budget
+from autoplan.models import Plan, Step
+from autoplan.phases.combine_steps import combine_steps, reduce_prompt
 from autoplan.phases.generate_plan import generate_plan
+from autoplan.phases.repair_plan import get_steps_to_replace, repair_plan_prompt
+from autoplan.rendering import count_tokens
 from autoplan.results import (
     ExecutionResult,
     FinalResult,
+    PartialFinalResult,
     PartialPlanResult,
     PlanResult,
     StepResult,
 )
+from autoplan.scheduler import (
+    FailurePolicy,
+    StepScheduler,
+    failed_step_result,
+    get_step_dependencies,
+)
+from autoplan.speculation import Speculator
 from autoplan.tool import PriorToolResult, Tool, tool
 from autoplan.trace import trace
 
@@ -39,30 +54,7 @@ CombineStepsPromptGenerator = Callable[
 ]
 
 
-class StepDependencies:
-    def __init__(self):
-        self.step_results_by_index = {}
-
-    def add_step_result(self, step_result: StepResult, index: int):
-        self.step_results_by_index[index] = step_result
-
-    def substitute_with_dependencies(self, step: Step) -> Step | None:
-        args = {}
-        for key, arg in step.tool_call.__dict__.items():
-            if isinstance(arg, PriorToolResult):
-                if arg.step_index_zero_indexed not in self.step_results_by_index:
-                    # early return indicating that the step is not ready to be executed
-                    return None
-
-                # substitute the prior tool result with the result of the step
-                args[key] = self.step_results_by_index[
-                    arg.step_index_zero_indexed
-                ].result
-            else:
-                args[key] = arg
-        return step.model_copy(
-            update={"tool_call": step.tool_call.__class__.model_validate(args)}
-        )
+_WITH_PLANNING_ATTR = "__withplanning__"
 
 
 @trace
@@ -71,72 +63,232 @@ async def _execute[P: Plan, S: Step](
     generate_plan_prompt_generator: GeneratePlanPromptGenerator,
     combine_steps_prompt_generator: CombineStepsPromptGenerator,
     application_args: dict,
-    # using a queue instead of an async generator because Weave doesn't work well with async generators
-    queue: asyncio.Queue,
+    # using a channel instead of an async generator because Weave doesn't work well with async generators
+    queue: ResultChannel,
     generate_plan_temperature: float,
     combine_steps_temperature: float,
+    max_concurrency: int | None = None,
+    pipelined: bool = False,
+    plan_cache: Cache | None = None,
+    deduplicate_steps: bool = True,
+    step_timeout: float | None = None,
+    failure_policy: FailurePolicy = FailurePolicy.SKIP_DEPENDENTS,
+    max_replans: int = 0,
+    speculator: Speculator | None = None,
+    combine_steps_fan_in: int = 8,
+    combine_steps_max_tokens: int | None = None,
 ) -> BaseModel:
+    # the LLM calls of the run (including its tasks) share a retry budget
+    start_retry_budget()
+
     generate_plan_prompt = trace(
         with_name(generate_plan_prompt_generator, "generate_plan_prompt")
     )(context, application_args)
 
-    generate_plan_queue: asyncio.Queue[Plan | None] = asyncio.Queue()
+    # only the latest partial plan matters, so they all coalesce
+    generate_plan_queue: ResultChannel[BaseModel] = ResultChannel(
+        is_snapshot=lambda _: True
+    )
 
-    asyncio.create_task(
+    generate_plan_task = asyncio.create_task(
         generate_plan(
             context,
             generate_plan_prompt,
             generate_plan_temperature,
             generate_plan_queue,
+            plan_cache,
         )
     )
+    # stop waiting for partial plans once planning is over, even if it failed before signaling the end
+    generate_plan_task.add_done_callback(lambda _: generate_plan_queue.close())
 
-    plan: Plan | None = None
+    run_limiter = ConcurrencyLimiter(max_concurrency)
 
-    while True:
-        item = await generate_plan_queue.get()
-        if item is None:
-            break
-        else:
-            plan = item
-            queue.put_nowait(PartialPlanResult(result=item))
-
-    # this is guaranteed by the generate_plan function
-    if plan is None:
-        raise ValueError("No plan was generated")
-    queue.put_nowait(PlanResult(result=plan))
-
-    step_dependencies = StepDependencies()
-
-    async def execute_step_with_result(step: Step, index: int):
-        while True:
-            if subbed_step := step_dependencies.substitute_with_dependencies(step):
-                step = subbed_step
-                result = await _execute_step(context, step)
-                step_result = StepResult(step=step, result=result)
-
-                step_dependencies.add_step_result(step_result, index)
-                queue.put_nowait(step_result)
-                return step_result
-            else:
-                # wait for dependencies to be ready
-                await asyncio.sleep(0.1)
+    def get_limiters(tool_call: Tool) -> list[ConcurrencyLimiter]:
+        limiters = [tool_call.concurrency_limiter]
+
+        # nested applications don't take a run or process slot, since their own steps do
+        # (otherwise they could wait forever on the slots they are holding)
+        if not hasattr(tool_call, _WITH_PLANNING_ATTR):
+            limiters += [run_limiter, get_global_limiter()]
+
+        return limiters
+
+    async def execute_step_with_result(index: int, step: Step) -> StepResult:
+        limiters = get_limiters(step.tool_call)
 
-    tasks = [
-        execute_step_with_result(step, index)
-        for index, step in enumerate(plan.steps or [])
-    ]
-    step_results = await asyncio.gather(*tasks)
+        timeout = step.tool_call.execution_timeout or step_timeout
 
-    combine_steps_prompt = trace(
-        with_name(combine_steps_prompt_generator, "combine_steps_prompt")
-    )(context, plan, [r.result for r in step_results])
+        prefetched = speculation.claim(step.tool_call) if speculation else None
 
-    result = await combine_steps(
-        context, combine_steps_prompt, combine_steps_temperature
+        try:
+            if prefetched is not None:
+                # the call started while the plan was generated, and already holds its slots
+                # (its failures are the step's: running it again would only fail or hang again)
+                async with asyncio.timeout(timeout):
+                    result, cache_hit = await prefetched
+            else:
+                # steps over a limit wait here, from the narrowest limit to the widest
+                async with limit(*limiters):
+                    # the timeout only applies to the execution, not to waiting for a slot
+                    async with asyncio.timeout(timeout):
+                        result = await _execute_step(context, step)
+                cache_hit = step.tool_call._cache_hit
+        except TimeoutError:
+            return failed_step_result(step, f"Timed out after {timeout} seconds")
+        except Exception as e:
+            return failed_step_result(step, e)
+
+        return StepResult(step=step, result=result, cache_hit=cache_hit)
+
+    async def execute_speculative_call(
+        tool_call: Tool,
+    ) -> tuple[BaseModel | str | None, bool | None]:
+        # speculative calls take the same slots as steps, so they can't exceed the limits
+        async with limit(*get_limiters(tool_call)):
+            result = await tool_call()
+        return cast(BaseModel | str | None, result), tool_call._cache_hit
+
+    # start the calls the plan is likely to contain while it's being generated
+    speculation = (
+        speculator.start(application_args, execute_speculative_call)
+        if speculator is not None
+        else None
     )
 
-    queue.put_nowait(FinalResult(result=result))
+    async def report_step_result(step_result: StepResult):
+        # waits while the consumer is behind, holding back the steps that depend on this one
+        await queue.put(step_result)
+
+    def create_scheduler() -> StepScheduler:
+        return StepScheduler(
+            execute_step_with_result,
+            report=report_step_result,
+            deduplicate=deduplicate_steps,
+            failure_policy=failure_policy,
+        )
+
+    scheduler = create_scheduler()
+    dispatched_steps: list[Step] = []
+
+    def dispatch(steps: Sequence[Step]):
+        # each step is only ever dispatched once, in index order
+        for index in range(len(dispatched_steps), len(steps)):
+            dispatched_steps.append(steps[index])
+            scheduler.add_step(index, steps[index])
+
+    try:
+        async for item in generate_plan_queue:
+            # partial plans coalesce when the consumer is behind, so this never waits
+            await queue.put(PartialPlanResult(result=item))
+
+            if pipelined:
+                # the plan is generated in order, so once a step appears all the steps
+                # before it are complete; the last one may still be missing arguments
+                dispatch((getattr(item, "steps", None) or [])[:-1])
+
+        # the complete plan (raises if the plan couldn't be generated)
+        plan: Plan = await generate_plan_task
+        await queue.put(PlanResult(result=plan))
+
+        if speculator is not None and speculation is not None:
+            speculator.record(application_args, plan)
+            speculation.keep(plan)
+
+        steps = plan.steps or []
+        for index, step in enumerate(dispatched_steps):
+            if index >= len(steps) or steps[index] != step:
+                raise ValueError(
+                    f"Step {index} of the plan changed after it was dispatched"
+                )
+
+        dispatch(steps)
+        scheduler.close()
+
+        step_results = await scheduler.wait()
+
+        replaced: set[int] = set()
+
+        for _ in range(max_replans):
+            to_replace = get_steps_to_replace(plan, step_results, replaced)
+            if not to_replace:
+                break
+
+            # ask the planner for new steps replacing the steps that didn't succeed
+            repair = await generate_plan(
+                context,
+                [
+                    *generate_plan_prompt,
+                    repair_plan_prompt(plan, step_results, to_replace),
+                ],
+                generate_plan_temperature,
+                # the partial plans of a repair aren't reported
+                ResultChannel(is_snapshot=lambda _: True),
+            )
+            replaced |= to_replace
+
+            # the new steps are numbered after the existing ones, so the plan's references stay valid
+            plan = plan.model_copy(
+                update={"steps": [*plan.steps, *(repair.steps or [])]}
+            )
+            await queue.put(PlanResult(result=plan))
+
+            # the completed steps keep their results, and only the new steps are executed
+            scheduler = create_scheduler()
+            for index, step_result in enumerate(step_results):
+                scheduler.add_result(index, step_result)
+            for index in range(len(step_results), len(plan.steps)):
+                scheduler.add_step(index, plan.steps[index])
+            scheduler.close()
+
+            step_results = await scheduler.wait()
+
+        results = [r.result for r in step_results]
+        combine_steps_prompt = trace(
+            with_name(combine_steps_prompt_generator, "combine_steps_prompt")
+        )(context, plan, results)
+
+        def report_partial_result(partial: BaseModel):
+            # partial results coalesce when the consumer is behind, so this never waits
+            queue.put_nowait(PartialFinalResult(result=partial))
+
+        if (
+            combine_steps_max_tokens is not None
+            and len(results) > combine_steps_fan_in
+            and count_tokens(
+                "\n".join(combine_steps_prompt), context.combine_steps_llm_model
+            )
+            > combine_steps_max_tokens
+        ):
+            result = await _map_reduce_steps(
+                context,
+                combine_steps_prompt_generator,
+                plan,
+                results,
+                # the instructions of the prompt (its first message) are kept when reducing
+                combine_steps_prompt[:1],
+                combine_steps_temperature,
+                combine_steps_fan_in,
+                report_partial_result,
+            )
+        else:
+            result = await combine_steps(
+                context,
+                combine_steps_prompt,
+                combine_steps_temperature,
+                report_partial_result,
+            )
+    except BaseException:
+        # the run failed or was cancelled, so nothing it started should outlive it
+        generate_plan_task.cancel()
+        await asyncio.gather(generate_plan_task, return_exceptions=True)
+        await scheduler.aclose()
+        raise
+    finally:
+        if speculation is not None:
+            await speculation.aclose()
+
+    await queue.put(FinalResult(result=result))
 
     return ExecutionResult(
         result=result, plan=plan, step_results=[r for r in step_results if r]
@@ -144,12 +296,103 @@ async def _execute[P: Plan, S: Step](
 
 
 @trace
-async def _execute_step(context: ExecutionContext, step: Step):
-    try:
-        return await step.tool_call()
-    except Exception as e:
-        print(f"Error executing step {step}: {e}")
-        return "Error executing step"
+def _sub_plan(plan: Plan, indices: Sequence[int]) -> tuple[Plan, list[int]]:
+    """
+    Get the plan made of some steps of a plan, and of the steps whose results they use (so that
+    every reference points to a step of the sub-plan), with the references renumbered.
+
+    Returns the sub-plan and the indices of its steps in the plan.
+    """
+    steps = plan.steps or []
+
+    included: set[int] = set()
+    pending = list(indices)
+    while pending:
+        index = pending.pop()
+        if index in included or not 0 <= index < len(steps):
+            continue
+        included.add(index)
+        pending.extend(get_step_dependencies(steps[index]))
+
+    order = sorted(included)
+    positions = {index: position for position, index in enumerate(order)}
+
+    def renumber(step: Step) -> Step:
+        references = {
+            key: PriorToolResult(
+                step_index_zero_indexed=positions[arg.step_index_zero_indexed]
+            )
+            for key, arg in step.tool_call.__dict__.items()
+            if isinstance(arg, PriorToolResult)
+            and arg.step_index_zero_indexed in positions
+        }
+        if not references:
+            return step
+        return step.model_copy(
+            update={"tool_call": step.tool_call.model_copy(update=references)}
+        )
+
+    sub_plan = plan.model_copy(update={"steps": [renumber(steps[i]) for i in order]})
+    return sub_plan, order
+
+
+async def _map_reduce_steps(
+    context: ExecutionContext,
+    combine_steps_prompt_generator: CombineStepsPromptGenerator,
+    plan: Plan,
+    results: list,
+    instructions: list[str],
+    temperature: float,
+    fan_in: int,
+    report_partial_result: Callable[[BaseModel], None],
+) -> BaseModel:
+    """
+    Combine the results of the steps hierarchically: groups of `fan_in` steps are combined concurrently,
+    then their partial results are combined by groups of `fan_in` until they fit in a single combination.
+
+    The steps of a group are combined with the steps whose results they use, like a plan of their own.
+    """
+    steps = plan.steps or []
+
+    async def combine_group(start: int) -> BaseModel:
+        group_plan, indices = _sub_plan(
+            plan, range(start, min(start + fan_in, len(steps)))
+        )
+        prompt = combine_steps_prompt_generator(
+            context, group_plan, [results[i] for i in indices]
+        )
+        return await combine_steps(context, prompt, temperature)
+
+    async def reduce(partial_results: list[BaseModel], report=None) -> BaseModel:
+        return await combine_steps(
+            context,
+            [*instructions, reduce_prompt(partial_results)],
+            temperature,
+            report,
+        )
+
+    partial_results = await asyncio.gather(
+        *(combine_group(start) for start in range(0, len(steps), fan_in))
+    )
+
+    while len(partial_results) > fan_in:
+        partial_results = await asyncio.gather(
+            *(
+                reduce(partial_results[start : start + fan_in])
+                for start in range(0, len(partial_results), fan_in)
+            )
+        )
+
+    # only the last combination is the final result, so it's the only one streamed
+    return await reduce(list(partial_results), report_partial_result)
+
+
+@trace
+async def _execute_step(
+    context: ExecutionContext, step: Step
+) -> BaseModel | str | None:
+    # tools return models or strings (see `tool`)
+    return cast(BaseModel | str | None, await step.tool_call())
 
 
 def _from_planned(f, can_use_prior_results: bool = False):
@@ -166,12 +409,10 @@ def _from_planned(f, can_use_prior_results: bool = False):
             if isinstance(r, FinalResult):
                 return r.result
 
+    setattr(inner, _WITH_PLANNING_ATTR, True)
     return inner
 
 
-_WITH_PLANNING_ATTR = "__withplanning__"
-
-
 def with_planning(
     step_class: type[Step],
     plan_class: type[Plan],
@@ -185,6 +426,17 @@ def with_planning(
     generate_plan_llm_args: Optional[dict] = None,
     combine_steps_llm_args: Optional[dict] = None,
     can_use_prior_results: bool | None = None,
+    max_concurrency: int | None = None,
+    pipelined: bool = False,
+    plan_cache: Cache | None = None,
+    deduplicate_steps: bool = True,
+    step_timeout: float | None = None,
+    failure_policy: FailurePolicy = FailurePolicy.SKIP_DEPENDENTS,
+    result_buffer_size: int = 64,
+    max_replans: int = 0,
+    speculator: Speculator | None = None,
+    combine_steps_fan_in: int = 8,
+    combine_steps_max_tokens: int | None = 50_000,
 ):
     """
     Decorator to add planning to a function.
@@ -201,7 +453,34 @@ def with_planning(
     generate_plan_llm_args: The arguments to pass to the generate plan prompt.
     combine_steps_llm_args: The arguments to pass to the combine steps prompt.
     can_use_prior_results: Whether the tool can use the results of prior steps.
+    max_concurrency: The maximum number of steps that can run at the same time in a single run.
+    pipelined: Whether to start executing the steps of the plan while it is still being generated.
+        A step is dispatched once the planner has moved on to the next step, so its arguments can't change.
+        Step results may then be yielded before the `PlanResult`.
+    plan_cache: A cache for generated plans (e.g. `InMemoryCache` or `SqliteCache`), keyed on the prompts,
+        the model, the LLM arguments, the temperature and the plan schema.
+    deduplicate_steps: Whether to execute identical tool calls of a plan only once, reporting the same result
+        for each of the steps making them. Disable it if tools have side effects that must happen once per step.
+    step_timeout: How long each step can run before failing, in seconds (tools can override it with @tool(timeout=...)).
+    failure_policy: What to do with the rest of the plan when a step fails (see `FailurePolicy`).
+        By default, the steps depending on a failed step are skipped.
+    result_buffer_size: How many results can wait for the consumer before the run waits for it to catch up.
+        Partial plans don't count towards it: when the consumer is behind, only the latest one is kept.
+    max_replans: How many times the planner can be asked to replace the steps that didn't succeed (and the steps
+        depending on them) once the plan is executed, instead of combining incomplete results. The results of the
+        other steps are kept and given to the planner, and the new steps are added at the end of the plan, which is
+        reported again as a `PlanResult`. Disabled by default.
+    speculator: Predicts tool calls that the plan is likely to contain, to start them while the plan is generated
+        (see `Speculator`). The results of the predicted calls are used by the steps making the same calls.
+    combine_steps_fan_in: How many step results (and then partial results) are combined by each LLM call when the steps
+        are combined hierarchically.
+    combine_steps_max_tokens: When the prompt combining the steps has more tokens than this, the steps are combined
+        hierarchically instead of in a single call: groups of `combine_steps_fan_in` steps are combined concurrently,
+        with the prompt generated for each group, and the partial results are then combined into the final result,
+        following the first message of the prompt (its instructions). None always combines them in a single call.
     """
+    if combine_steps_fan_in < 2:
+        raise ValueError("combine_steps_fan_in must be at least 2")
 
     def wrapper(func):
         function_return_type = func.__annotations__.get("return")
@@ -220,26 +499,38 @@ def with_planning(
             if not issubclass(tool, Tool):
                 raise ValueError(f"{tool} is not a Tool. Was it decorated with @tool?")
 
+        if not (
+            isinstance(function_return_type, type)
+            and issubclass(function_return_type, BaseModel)
+        ):
+            raise ValueError(
+                f"{func.__name__} must be annotated with the model of its output"
+            )
+
+        # everything that doesn't depend on the arguments of a run is built once
+        application = CompiledApplication(
+            step_class=step_class,
+            plan_class=plan_class,
+            tools=tools,
+            tool_classes=updated_tools,
+            output_model=function_return_type,
+            generate_plan_llm_model=generate_plan_llm_model or "gpt-4o-mini",
+            generate_plan_llm_args=generate_plan_llm_args or {},
+            combine_steps_llm_model=combine_steps_llm_model or "gpt-4o-mini",
+            combine_steps_llm_args=combine_steps_llm_args or {},
+        )
+
         # These annotations will create a trace whose name and arguments come from the decorated function
         @functools.wraps(func)
         async def wrapped(*args, **kwargs):
             arguments = func_signature.bind(*args, **kwargs).arguments
 
-            queue = asyncio.Queue()
-
-            context = ExecutionContext(
-                plan_class=create_plan_class(step_class, plan_class, updated_tools),
-                tools=tools,
-                output_model=function_return_type,
-                application_args=arguments,
-                generate_plan_llm_model=generate_plan_llm_model or "gpt-4o-mini",
-                generate_plan_llm_args=generate_plan_llm_args or {},
-                combine_steps_llm_model=combine_steps_llm_model or "gpt-4o-mini",
-                combine_steps_llm_args=combine_steps_llm_args or {},
-            )
+            queue = ResultChannel(result_buffer_size)
+
+            context = application.create_context(arguments)
 
             # start the execution in the background
-            asyncio.create_task(
+            task = asyncio.create_task(
                 _execute(
                     context,
                     generate_plan_prompt_generator,
@@ -248,16 +539,41 @@ def with_planning(
                     queue,
                     generate_plan_temperature,
                     combine_steps_temperature,
+                    max_concurrency,
+                    pipelined,
+                    plan_cache,
+                    deduplicate_steps,
+                    step_timeout,
+                    failure_policy,
+                    max_replans,
+                    speculator,
+                    combine_steps_fan_in,
+                    combine_steps_max_tokens,
                 )
             )
 
-            # yield each item from the queue as it comes in
-            while True:
-                item = await queue.get()
-                yield item
+            def on_done(task: asyncio.Task):
+                # wake up the consumer, raising the error if the execution failed before the final result
+                queue.close(None if task.cancelled() else task.exception())
+
+            task.add_done_callback(on_done)
+
+            finished = False
+
+            try:
+                # yield each item from the channel as it comes in
+                async for item in queue:
+                    yield item
 
-                if isinstance(item, FinalResult):
-                    return
+                    if isinstance(item, FinalResult):
+                        finished = True
+                        return
+            finally:
+                # the consumer stopped iterating (or the execution failed): cancel everything
+                # the run started, so no planning, steps or combining keep running unobserved
+                if not finished:
+                    task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
 
         # add a marker so we can identify the function as a "with_planning" decorated function
         setattr(wrapped, _WITH_PLANNING_ATTR, True)
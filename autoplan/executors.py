@@ -0,0 +1,241 @@
+import asyncio
+import functools
+import importlib
+import inspect
+import pickle
+import sys
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Literal
+
+from pydantic import BaseModel
+
+ExecutorKind = Literal["thread", "process"]
+
+# arguments smaller than this are cheaper to copy through the process pool's pipe than through shared memory
+SHARED_MEMORY_THRESHOLD = 1024 * 1024
+
+_executors: dict[str, Executor] = {}
+
+# functions that can run in the process pool, by module and qualified name
+_process_functions: dict[tuple[str, str], Callable[..., Any]] = {}
+
+# the number of calls submitted to each pool that haven't finished, and that have finished
+_in_flight: dict[str, int] = {"thread": 0, "process": 0}
+_completed: dict[str, int] = {"thread": 0, "process": 0}
+_metrics_lock = threading.Lock()
+
+
+class ExecutorMetrics(BaseModel):
+    """
+    A snapshot of the load of a pool running tools.
+    """
+
+    # the number of workers of the pool (None if the pool doesn't expose it)
+    max_workers: int | None
+    # the number of calls being executed by a worker
+    running: int
+    # the number of calls waiting for a free worker
+    queued: int
+    # the fraction of the workers that are busy
+    utilization: float | None
+    # the number of calls that have finished since the process started
+    completed: int
+
+
+def set_executor(kind: ExecutorKind, executor: Executor):
+    """
+    Set the pool running the tools decorated with `@tool(executor=kind)` (e.g. to change its size).
+    """
+    _executors[kind] = executor
+
+
+def get_executor_metrics(kind: ExecutorKind) -> ExecutorMetrics:
+    """
+    Get the queue depth and utilization of the thread or process pool running tools.
+    """
+    max_workers = getattr(_executors.get(kind), "_max_workers", None)
+
+    with _metrics_lock:
+        in_flight = _in_flight[kind]
+        completed = _completed[kind]
+
+    # pools start a call as soon as one of their workers is free
+    running = in_flight if max_workers is None else min(in_flight, max_workers)
+
+    return ExecutorMetrics(
+        max_workers=max_workers,
+        running=running,
+        queued=in_flight - running,
+        utilization=running / max_workers if max_workers else None,
+        completed=completed,
+    )
+
+
+def get_executor(kind: ExecutorKind) -> Executor:
+    if kind not in _executors:
+        _executors[kind] = (
+            ThreadPoolExecutor(thread_name_prefix="autoplan")
+            if kind == "thread"
+            else ProcessPoolExecutor()
+        )
+    return _executors[kind]
+
+
+def _call(func: Callable[..., Any], kwargs: dict[str, Any]) -> Any:
+    if inspect.iscoroutinefunction(func):
+        # the function runs on its own event loop, so its blocking calls don't block the application
+        return asyncio.run(func(**kwargs))
+    return func(**kwargs)
+
+
+def _dump_arguments(
+    kwargs: dict[str, Any],
+) -> tuple[bytes, list[tuple[SharedMemory, int]]]:
+    """
+    Pickle the arguments, moving their large buffers (e.g. NumPy arrays) to shared memory.
+
+    Returns the pickled arguments and the shared memory segments holding the buffers, with their sizes.
+    """
+    segments: list[tuple[SharedMemory, int]] = []
+
+    def to_shared_memory(buffer: pickle.PickleBuffer) -> bool:
+        try:
+            view = buffer.raw()
+        except BufferError:
+            # not contiguous, so it can't be copied as is
+            return True
+
+        if view.nbytes < SHARED_MEMORY_THRESHOLD:
+            return True
+
+        segment = SharedMemory(create=True, size=view.nbytes)
+        segments.append((segment, view.nbytes))
+        segment.buf[: view.nbytes] = view
+        # returning False keeps the buffer out of the pickled data
+        return False
+
+    try:
+        data = pickle.dumps(kwargs, protocol=5, buffer_callback=to_shared_memory)
+    except BaseException:
+        _release(segments)
+        raise
+
+    return data, segments
+
+
+def _release(segments: list[tuple[SharedMemory, int]]):
+    for segment, _ in segments:
+        segment.close()
+        segment.unlink()
+
+
+def _attach(name: str) -> SharedMemory:
+    """
+    Attach to a shared memory segment created by the application, which unlinks it after the call.
+    """
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+
+    segment = SharedMemory(name=name)
+    # attaching registers the segment with the resource tracker, which would report it as leaked
+    # once the application unlinks it
+    resource_tracker.unregister(segment._name, "shared_memory")  # pyright: ignore[reportAttributeAccessIssue]
+    return segment
+
+
+def _call_in_process(
+    module: str, qualname: str, data: bytes, segments: list[tuple[str, int]]
+) -> bytes:
+    # importing the module registers its functions in the worker, if it wasn't forked from the application
+    importlib.import_module(module)
+    func = _process_functions[(module, qualname)]
+
+    attached = [_attach(name) for name, _ in segments]
+    kwargs = result = None
+
+    try:
+        kwargs = pickle.loads(
+            data,
+            buffers=[
+                segment.buf[:size] for segment, (_, size) in zip(attached, segments)
+            ],
+        )
+        result = _call(func, kwargs)
+        # the result can reference the arguments, so it is pickled while they are still mapped
+        return pickle.dumps(result, protocol=5)
+    finally:
+        kwargs = result = None
+        for segment in attached:
+            try:
+                segment.close()
+            except BufferError:
+                # the function kept a reference to its arguments, so they are unmapped once it's released
+                pass
+
+
+async def run_in_executor(
+    kind: ExecutorKind, func: Callable[..., Any], kwargs: dict[str, Any]
+) -> Any:
+    """
+    Call a function (synchronous or asynchronous) with keyword arguments in a pool, without blocking the event loop.
+    """
+    if kind == "thread":
+        return await _submit(kind, _call, func, kwargs)
+
+    data, segments = _dump_arguments(kwargs)
+
+    try:
+        result = await _submit(
+            kind,
+            _call_in_process,
+            func.__module__,
+            func.__qualname__,
+            data,
+            [(segment.name, size) for segment, size in segments],
+        )
+    finally:
+        _release(segments)
+
+    return pickle.loads(result)
+
+
+def _submit(kind: ExecutorKind, func: Callable[..., Any], *args) -> asyncio.Future:
+    def on_done(_):
+        with _metrics_lock:
+            _in_flight[kind] -= 1
+            _completed[kind] += 1
+
+    with _metrics_lock:
+        _in_flight[kind] += 1
+
+    try:
+        future = get_executor(kind).submit(func, *args)
+    except BaseException:
+        with _metrics_lock:
+            _in_flight[kind] -= 1
+        raise
+
+    # counted once the pool is done with the call, even if the caller stopped waiting for it
+    future.add_done_callback(on_done)
+    return asyncio.wrap_future(future)
+
+
+def offload(func: Callable[..., Any], kind: ExecutorKind) -> Callable[..., Any]:
+    """
+    Wrap a function so it runs in the thread or process pool when awaited.
+    """
+    if kind == "process":
+        if "<locals>" in func.__qualname__:
+            raise ValueError(
+                f"{func.__qualname__} must be defined at the top level of a module to run in a process"
+            )
+        _process_functions[(func.__module__, func.__qualname__)] = func
+
+    @functools.wraps(func)
+    async def offloaded(**kwargs):
+        return await run_in_executor(kind, func, kwargs)
+
+    return offloaded
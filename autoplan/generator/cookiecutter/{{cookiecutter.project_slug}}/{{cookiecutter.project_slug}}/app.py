@@ -10,6 +10,7 @@ from {{cookiecutter.project_slug}}.main import run
 from {{cookiecutter.project_slug}} import dependencies
 from autoplan import (
     FinalResult,
+    PartialFinalResult,
     PartialPlanResult,
     PlanResult,
     StepResult,
@@ -45,6 +46,15 @@ class StatefulItem:
         self.value = value
 
 
+def summarize(result) -> str:
+    # the fields of a partial result are None until they start being generated
+    return "\n\n".join(
+        str(getattr(result, key))
+        for key in result.model_fields
+        if getattr(result, key) is not None
+    )
+
+
 async def generate(
     [% for input, type in config.inputs.items() %]
     [[input]]: [[type]] | StatefulItem,
@@ -65,8 +75,11 @@ async def generate(
 
     result = None
 
+    # the final result, as it is being generated
+    partial_result = None
+
     async def run_and_populate():
-        nonlocal result
+        nonlocal result, partial_result
         async for r in run([% for input in config.inputs %]
             [[input]],
         [% endfor %]):
@@ -83,11 +96,14 @@ async def generate(
             elif isinstance(r, StepResult):
                 pass
 
+            elif isinstance(r, PartialFinalResult):
+                partial_result = r.result
+
             elif isinstance(r, FinalResult):
                 result = r.result
 
     # start the analysis in the background
-    asyncio.create_task(run_and_populate())
+    task = asyncio.create_task(run_and_populate())
 
     # how often to switch steps in the UI
     step_display_interval = 2
@@ -98,38 +114,46 @@ async def generate(
     # counter to determine if step switching should occur
     counter = 0
 
-    while True:
-        await asyncio.sleep(check_interval)
-
-        if result:
-            summary = ""
+    # the partial result that is currently shown
+    shown_partial_result = None
 
-            for index, key in enumerate(list(result.__fields__.keys())):
-                if index > 0:
-                    summary += "\n\n"
+    try:
+        while True:
+            await asyncio.sleep(check_interval)
 
-                summary += getattr(result, key)
+            if result:
+                yield result.display_title, summarize(result)
+                return
+            elif partial_result is not None:
+                # show the final result as it is written, instead of the steps
+                if partial_result is not shown_partial_result:
+                    shown_partial_result = partial_result
+                    yield (
+                        partial_result.display_title or "Writing the answer...",
+                        summarize(partial_result),
+                    )
+            else:
+                if counter % (step_display_interval / check_interval) == 0:
+                    # show an unseen step
+                    if plan_steps_queue:
+                        step = plan_steps_queue.pop(0)
 
-            yield result.display_title, summary
-            return
-        else:
-            if counter % (step_display_interval / check_interval) == 0:
-                # show an unseen step
-                if plan_steps_queue:
-                    step = plan_steps_queue.pop(0)
+                        objective = step.objective
 
-                    objective = step.objective
+                        # add "ing" to the first word (e.g. "Find" -> "Finding")
+                        words = objective.split()
+                        words[0] = Inflect.present_participle(words[0])
 
-                    # add "ing" to the first word (e.g. "Find" -> "Finding")
-                    words = objective.split()
-                    words[0] = Inflect.present_participle(words[0])
+                        yield (
+                            " ".join(words),
+                            ""
+                        )
 
-                    yield (
-                        " ".join(words),
-                        ""
-                    )
+            counter += 1
 
-        counter += 1
+    finally:
+        # stop the run (planning, steps and combining) if the client disconnects
+        task.cancel()
 
 
 async def download(title_or_link: str) -> StatefulItem:
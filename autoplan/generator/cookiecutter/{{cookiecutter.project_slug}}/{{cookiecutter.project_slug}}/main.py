@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 
-from autoplan import Plan, Step, with_planning
+from autoplan import Plan, Step, render_step_results, with_planning
 from {{cookiecutter.project_slug}}.tools.you_search import you_search
 
 
@@ -44,7 +44,9 @@ def generate_plan(execution_context, application_args) -> list[str]:
 def combine_steps(execution_context, plan: ApplicationPlan, steps: list[ApplicationStep]) -> list[str]:
     return [
         "[[config.combining_steps_prompt]]",
-        str(steps),
+        render_step_results(
+            plan, steps, model=execution_context.combine_steps_llm_model
+        ),
     ]
 
 @with_planning(
@@ -0,0 +1,111 @@
+from typing import Any
+
+import litellm
+from litellm.types.utils import ModelResponse
+from pydantic import BaseModel
+
+from autoplan.application import compile_model
+from autoplan.cache import Cache, make_cache_key
+from autoplan.llm_utils.hedging import hedged_call
+from autoplan.llm_utils.retry import retry_call
+from autoplan.single_flight import SingleFlight
+
+_llm_cache: Cache | None = None
+_llm_cache_ttl: float | None = None
+
+# the LLM calls in flight in the process, shared by the identical calls made before they finish
+_in_flight_llm_calls = SingleFlight()
+
+
+def set_llm_cache(cache: Cache | None, ttl: float | None = None):
+    """
+    Set the cache of the LLM responses of the process (e.g. `InMemoryCache` or `SqliteCache`), or disable it with None.
+
+    Responses are keyed on the model, the messages, the response schema and the other arguments of the call
+    (e.g. the temperature), so a call identical to a previous one gets the same response without calling the LLM.
+    Calls opt out with `cache=False` (e.g. in `generate_plan_llm_args`). `ttl` (in seconds) overrides the default
+    time to live of the cache.
+
+    Identical calls made while one is in flight share its response whether the cache is set or not
+    (see `acompletion`).
+    """
+    global _llm_cache, _llm_cache_ttl
+    _llm_cache = cache
+    _llm_cache_ttl = ttl
+
+
+def get_llm_cache() -> Cache | None:
+    return _llm_cache
+
+
+def llm_cache_key(model: str, messages: list[dict[str, Any]], **kwargs) -> str:
+    return make_cache_key("llm", model, messages, kwargs)
+
+
+def should_coalesce(coalesce: bool | None, kwargs: dict[str, Any]) -> bool:
+    """
+    Whether a call shares the identical call in flight: by default, only deterministic calls (at temperature 0) do,
+    since the others are expected to get different responses.
+    """
+    if coalesce is not None:
+        return coalesce
+    return kwargs.get("temperature") == 0
+
+
+def get_in_flight_llm_calls() -> SingleFlight:
+    return _in_flight_llm_calls
+
+
+def cache_llm_response(key: str, value: Any):
+    if _llm_cache is not None:
+        _llm_cache.set(key, value, ttl=_llm_cache_ttl)
+
+
+async def acompletion(
+    model: str,
+    messages: list[dict[str, Any]],
+    cache: bool = True,
+    coalesce: bool | None = None,
+    hedge: bool = True,
+    **kwargs,
+) -> ModelResponse:
+    """
+    `litellm.acompletion` (without streaming), reusing the responses stored in the LLM cache (see `set_llm_cache`).
+
+    With `coalesce` (by default, at temperature 0), concurrent identical calls share a single request.
+    Calls failing with a transient error are retried according to the retry policy (see `set_retry_policy`),
+    and slow calls are hedged according to the hedging policy (see `set_hedging_policy`) unless `hedge` is disabled.
+    """
+    llm_cache = _llm_cache if cache else None
+
+    # models are keyed on their schema, which changes their responses (their name doesn't identify them)
+    response_format = kwargs.get("response_format")
+    if isinstance(response_format, type) and issubclass(response_format, BaseModel):
+        key = llm_cache_key(
+            model,
+            messages,
+            **{**kwargs, "response_format": compile_model(response_format).schema_hash},
+        )
+    else:
+        key = llm_cache_key(model, messages, **kwargs)
+
+    if llm_cache is not None and (cached := llm_cache.get(key)) is not None:
+        return ModelResponse(**cached)
+
+    async def request(model: str) -> ModelResponse:
+        response = await litellm.acompletion(model=model, messages=messages, **kwargs)
+        # asserts are for type checking, and reflect invariants we expect from the acompletion function
+        assert isinstance(response, ModelResponse)
+        return response
+
+    async def call() -> ModelResponse:
+        response = await retry_call(
+            lambda: hedged_call(model, request) if hedge else request(model)
+        )
+        if llm_cache is not None:
+            cache_llm_response(key, response.model_dump())
+        return response
+
+    if should_coalesce(coalesce, kwargs):
+        return await _in_flight_llm_calls.call(key, call)
+    return await call()
@@ -6,25 +6,15 @@ import httpx
 from dotenv import load_dotenv
 from httpx_sse import aconnect_sse
 from pydantic import BaseModel
-from pydantic_core import from_json
-from pydantic_partial import create_partial_model
-from tenacity import retry, stop_after_attempt
 
+from autoplan.llm_utils.http_clients import get_http_client
+from autoplan.llm_utils.partial_output import PartialOutputParser
+from autoplan.llm_utils.retry import retry_stream
 from autoplan.trace import get_tracer
 
 load_dotenv()
 
 
-def _parse_output[T: BaseModel](output: str, model: type[T]) -> Optional[T]:
-    try:
-        json_content = from_json(output, allow_partial=True)
-        return create_partial_model(model).model_validate(json_content, strict=False)
-    except Exception:
-        # if parsing fails, just return None
-        return None
-
-
-@retry(stop=stop_after_attempt(2))
 async def _create_partial_streaming_completion_openai[T: BaseModel](
     model: str,
     messages: list[Dict[str, str]],
@@ -48,7 +38,8 @@ async def _create_partial_streaming_completion_openai[T: BaseModel](
         response_format (BaseModel): A Pydantic model defining the structure of the expected response.
         url (str, optional): The API endpoint URL. Defaults to OpenAI's chat completions endpoint.
         api_key (str, optional): The API key for authentication. Defaults to the OPENAI_API_KEY environment variable.
-        httpx_client (httpx.AsyncClient, optional): An async HTTP client. Defaults to a new httpx.AsyncClient instance.
+        httpx_client (httpx.AsyncClient, optional): An async HTTP client, which is left open. Defaults to the pooled
+            client of the host (see `get_http_client`), which keeps its connections open between calls.
         **kwargs: Additional keyword arguments to pass to the API request.
 
     Yields:
@@ -81,7 +72,7 @@ async def _create_partial_streaming_completion_openai[T: BaseModel](
         url = "https://api.openai.com/v1/chat/completions"
 
     if httpx_client is None:
-        httpx_client = httpx.AsyncClient(timeout=30.0)
+        httpx_client = get_http_client(url)
 
     tracer = get_tracer()
 
@@ -118,7 +109,7 @@ async def _create_partial_streaming_completion_openai[T: BaseModel](
 
     parsed = None
 
-    async with httpx_client:
+    async def attempt():
         async with aconnect_sse(
             httpx_client,
             "POST",
@@ -129,8 +120,10 @@ async def _create_partial_streaming_completion_openai[T: BaseModel](
             },
             json=body,
         ) as event_source:
-            output = ""
-            seen = set()
+            # errors (e.g. rate limits) are raised, so the call can be retried
+            event_source.response.raise_for_status()
+
+            parser = PartialOutputParser(response_format)
 
             async for event in event_source.aiter_sse():
                 # [DONE] is a special event that indicates the end of the stream
@@ -140,19 +133,18 @@ async def _create_partial_streaming_completion_openai[T: BaseModel](
                 data = json.loads(event.data)
 
                 try:
-                    output += data["choices"][0]["delta"]["tool_calls"][0]["function"][
+                    text = data["choices"][0]["delta"]["tool_calls"][0]["function"][
                         "arguments"
                     ]
                 except KeyError:
-                    pass
+                    continue
 
-                # try parsing the output as our response format
-                parsed = _parse_output(output, response_format)
+                # the parser only returns the instances that changed since the last one
+                if result := parser.feed(text):
+                    yield parser.length, result
 
-                # if we successfully parsed and haven't yielded this instance yet, yield it
-                if parsed and str(parsed) not in seen:
-                    seen.add(str(parsed))
-                    yield parsed
+    async for parsed in retry_stream(attempt):
+        yield parsed
 
     if traced_call:
         traced_call.end(parsed)
@@ -191,8 +183,8 @@ async def _create_partial_streaming_completion_anthropic[T: BaseModel](
     if not url:
         url = "https://api.anthropic.com/v1/messages"
 
-    if not httpx_client:
-        httpx_client = httpx.AsyncClient()
+    if httpx_client is None:
+        httpx_client = get_http_client(url)
 
     # Convert OpenAI-style messages to Anthropic format
     system_message = next((m["content"] for m in messages if m["role"] == "system"), "")
@@ -223,7 +215,7 @@ async def _create_partial_streaming_completion_anthropic[T: BaseModel](
 
     parsed = None
 
-    async with httpx_client:
+    async def attempt():
         async with aconnect_sse(
             httpx_client,
             "POST",
@@ -235,8 +227,12 @@ async def _create_partial_streaming_completion_anthropic[T: BaseModel](
             },
             json=body,
         ) as event_source:
-            output = ""
-            seen = set()
+            # errors (e.g. rate limits) are raised, so the call can be retried
+            event_source.response.raise_for_status()
+
+            parser = PartialOutputParser(response_format)
+            # the length of the previous content blocks, so the positions keep growing across blocks
+            offset = 0
 
             async for event in event_source.aiter_sse():
                 event_data = json.loads(event.data)
@@ -244,33 +240,28 @@ async def _create_partial_streaming_completion_anthropic[T: BaseModel](
                 if event_type == "message_stop":
                     continue
 
-                try:
-                    # Handle different event types
-                    event_type = event_data.get("type")
-
-                    if event_type == "content_block_start":
-                        output = event_data.get("content_block", {}).get("text", "")
-                    elif event_type == "content_block_delta":
-                        delta = event_data.get("delta", {})
-                        if "text" in delta:
-                            output += delta["text"]
-
-                except json.JSONDecodeError:
+                # Handle different event types
+                if event_type == "content_block_start":
+                    # the output starts over with each content block
+                    offset += parser.length
+                    parser = PartialOutputParser(response_format)
+                    text = event_data.get("content_block", {}).get("text", "")
+                elif event_type == "content_block_delta":
+                    text = event_data.get("delta", {}).get("text", "")
+                else:
                     continue
 
-                # try parsing the output as our response format
-                parsed = _parse_output(output, response_format)
+                # the parser only returns the instances that changed since the last one
+                if result := parser.feed(text):
+                    yield offset + parser.length, result
 
-                # if we successfully parsed and haven't yielded this instance yet, yield it
-                if parsed and str(parsed) not in seen:
-                    seen.add(str(parsed))
-                    yield parsed
+    async for parsed in retry_stream(attempt):
+        yield parsed
 
     if traced_call:
         traced_call.end(parsed)
 
 
-@retry(stop=stop_after_attempt(2))
 def create_partial_streaming_completion[T: BaseModel](
     model: str,
     messages: list[Dict[str, str]],
@@ -295,7 +286,8 @@ def create_partial_streaming_completion[T: BaseModel](
         response_format (BaseModel): A Pydantic model defining the structure of the expected response.
         url (str, optional): The API endpoint URL. Defaults to OpenAI's chat completions endpoint.
         api_key (str, optional): The API key for authentication. Defaults to the OPENAI_API_KEY environment variable.
-        httpx_client (httpx.AsyncClient, optional): An async HTTP client. Defaults to a new httpx.AsyncClient instance.
+        httpx_client (httpx.AsyncClient, optional): An async HTTP client, which is left open. Defaults to the pooled
+            client of the host (see `get_http_client`), which keeps its connections open between calls.
         **kwargs: Additional keyword arguments to pass to the API request.
 
     Yields:
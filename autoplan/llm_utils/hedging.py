@@ -0,0 +1,199 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+# the hedges that quiet periods can save up, so a burst of slow requests can't send more than this many at once
+_MAX_HEDGE_BURST = 10.0
+
+_END = object()
+
+
+class HedgingPolicy:
+    """
+    How the LLM calls of the framework are hedged: when a call hasn't responded after the usual latency
+    of its model, a duplicate is sent (to the same model, or to an alternate deployment), the first one
+    to respond is used and the other one is cancelled.
+
+    The latency of a streamed call is its time to first token, and that of other calls the time to their
+    whole response, so the two are observed separately for each model.
+
+    quantile: The quantile of the recent latencies of a model after which calls are hedged
+        (e.g. 0.9 hedges the calls slower than 90% of the recent ones).
+    min_delay: The minimum delay before a hedge, in seconds.
+    max_hedge_rate: The maximum fraction of the calls that are hedged, so a slow provider doesn't get
+        twice the load.
+    min_samples: The number of latencies observed for a model before its calls are hedged.
+    window: The number of recent latencies kept for each model.
+    alternate_models: The model to send the hedge of the calls of a model to (e.g. `{"gpt-4o": "azure/gpt-4o"}`),
+        by default the same model.
+    """
+
+    def __init__(
+        self,
+        quantile: float = 0.9,
+        min_delay: float = 0.1,
+        max_hedge_rate: float = 0.1,
+        min_samples: int = 20,
+        window: int = 200,
+        alternate_models: dict[str, str] | None = None,
+    ):
+        if not 0 < quantile < 1:
+            raise ValueError("quantile must be between 0 and 1")
+
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.max_hedge_rate = max_hedge_rate
+        self.min_samples = min_samples
+        self.window = window
+        self.alternate_models = alternate_models or {}
+        # the recent latencies of the calls to each model, streamed or not
+        self._latencies: dict[tuple[str, bool], deque[float]] = {}
+        self._hedges = 0.0
+
+    def record(self, model: str, latency: float, streamed: bool = False):
+        """
+        Record the latency of a call to `model`, in seconds: its time to first token if it's `streamed`,
+        otherwise the time to its response.
+        """
+        latencies = self._latencies.get((model, streamed))
+        if latencies is None:
+            latencies = self._latencies[model, streamed] = deque(maxlen=self.window)
+        latencies.append(latency)
+
+    def hedge_delay(self, model: str, streamed: bool = False) -> float | None:
+        """
+        How long to wait for a call to `model` (for its first token if it's `streamed`) before hedging it,
+        or None if it isn't hedged (until enough such calls to the model were observed).
+        """
+        latencies = self._latencies.get((model, streamed))
+        if latencies is None or len(latencies) < self.min_samples:
+            return None
+
+        ordered = sorted(latencies)
+        return max(self.min_delay, ordered[int(self.quantile * (len(ordered) - 1))])
+
+    def start_call(self):
+        # each call allows `max_hedge_rate` more hedges
+        self._hedges = min(_MAX_HEDGE_BURST, self._hedges + self.max_hedge_rate)
+
+    def take_hedge(self) -> bool:
+        if self._hedges < 1:
+            return False
+        self._hedges -= 1
+        return True
+
+    def alternate_model(self, model: str) -> str:
+        return self.alternate_models.get(model, model)
+
+
+_hedging_policy: HedgingPolicy | None = None
+
+
+def set_hedging_policy(policy: HedgingPolicy | None):
+    """
+    Hedge the LLM calls of the process (see `HedgingPolicy`), or stop hedging them with None (the default).
+    """
+    global _hedging_policy
+    _hedging_policy = policy
+
+
+def get_hedging_policy() -> HedgingPolicy | None:
+    return _hedging_policy
+
+
+async def hedged_call[T](
+    model: str,
+    call: Callable[[str], Awaitable[T]],
+    discard: Callable[[T], Awaitable[Any]] | None = None,
+    streamed: bool = False,
+) -> T:
+    """
+    Call `call(model)`, calling it again (with the alternate model) if it doesn't respond before the hedge delay
+    of the hedging policy, and return the first response.
+
+    The call that loses is cancelled, or passed to `discard` if it responded at the same time.
+    `streamed` calls respond with their first token, and are timed separately from the others.
+    """
+    policy = _hedging_policy
+    if policy is None:
+        return await call(model)
+
+    policy.start_call()
+    started: dict[asyncio.Task, tuple[str, float]] = {}
+
+    def start(model: str):
+        started[asyncio.ensure_future(call(model))] = (model, time.monotonic())
+
+    start(model)
+    pending = set(started)
+    winner: asyncio.Task | None = None
+
+    try:
+        delay = policy.hedge_delay(model, streamed)
+        if delay is not None:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done and policy.take_hedge():
+                start(policy.alternate_model(model))
+                pending = set(started)
+
+        while winner is None:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if winner is None and task.exception() is None:
+                    winner = task
+                elif task.exception() is None and discard is not None:
+                    await discard(task.result())
+
+            # all the calls failed
+            if winner is None and not pending:
+                raise next(iter(done)).exception()  # pyright: ignore[reportGeneralTypeIssues]
+
+        model, started_at = started[winner]
+        policy.record(model, time.monotonic() - started_at, streamed)
+        return winner.result()
+    finally:
+        now = time.monotonic()
+        for task in pending:
+            task.cancel()
+            # a call that lost would have taken at least this long, which keeps the hedge delay from
+            # only learning from the calls that won (calls cancelled with the caller tell nothing)
+            if winner is not None:
+                model, started_at = started[task]
+                policy.record(model, now - started_at, streamed)
+
+
+async def _aclose(iterator: AsyncIterator):
+    if (aclose := getattr(iterator, "aclose", None)) is not None:
+        await aclose()
+
+
+async def hedged_stream[T](
+    model: str, start: Callable[[str], Awaitable[AsyncIterator[T]]]
+) -> AsyncIterator[T]:
+    """
+    Iterate over the stream `start(model)`, hedging it (see `hedged_call`) until its first item.
+    """
+
+    async def first_item(model: str) -> tuple[AsyncIterator[T], Any]:
+        iterator = aiter(await start(model))
+        try:
+            return iterator, await anext(iterator, _END)
+        except BaseException:
+            await _aclose(iterator)
+            raise
+
+    async def discard(response: tuple[AsyncIterator[T], Any]):
+        await _aclose(response[0])
+
+    iterator, first = await hedged_call(model, first_item, discard, streamed=True)
+    try:
+        if first is _END:
+            return
+        yield first
+        async for item in iterator:
+            yield item
+    finally:
+        await _aclose(iterator)
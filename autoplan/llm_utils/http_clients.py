@@ -0,0 +1,84 @@
+import asyncio
+import importlib.util
+
+import httpx
+
+# the pooled clients of each event loop (connections can't be shared between loops), by host
+_clients: dict[tuple[asyncio.AbstractEventLoop, str], httpx.AsyncClient] = {}
+
+_limits = httpx.Limits(
+    max_connections=100, max_keepalive_connections=20, keepalive_expiry=60
+)
+_timeout = httpx.Timeout(30.0)
+# HTTP/2 requires the optional "h2" package
+_http2 = importlib.util.find_spec("h2") is not None
+
+
+def _forget_closed_loops():
+    # the clients of the loops that were closed without closing them can't be used anymore
+    for key in [key for key in _clients if key[0].is_closed()]:
+        del _clients[key]
+
+
+def set_http_client_options(
+    max_connections_per_host: int = 100,
+    max_keepalive_connections_per_host: int = 20,
+    keepalive_expiry: float = 60,
+    timeout: float = 30.0,
+    http2: bool | None = None,
+):
+    """
+    Set the options of the pooled HTTP clients used to stream LLM responses. Only the clients created
+    afterwards use them, so call `aclose_http_clients` first to apply them to the existing ones.
+
+    max_connections_per_host: The maximum number of connections open to each host.
+    max_keepalive_connections_per_host: The maximum number of idle connections kept open to each host.
+    keepalive_expiry: How long idle connections are kept open, in seconds.
+    timeout: The timeout of the requests, in seconds.
+    http2: Whether to use HTTP/2 with the hosts supporting it (by default, if the "h2" package is installed).
+    """
+    global _limits, _timeout, _http2
+
+    if http2 and importlib.util.find_spec("h2") is None:
+        raise ValueError('HTTP/2 requires the "h2" package (pip install httpx[http2])')
+
+    _limits = httpx.Limits(
+        max_connections=max_connections_per_host,
+        max_keepalive_connections=max_keepalive_connections_per_host,
+        keepalive_expiry=keepalive_expiry,
+    )
+    _timeout = httpx.Timeout(timeout)
+    if http2 is not None:
+        _http2 = http2
+
+
+def get_http_client(url: str) -> httpx.AsyncClient:
+    """
+    Get the pooled client for the host of a URL, which keeps its connections open between requests,
+    so they don't all pay for a new TCP and TLS handshake.
+
+    The client belongs to the registry: don't close it, use `aclose_http_clients` instead.
+    """
+    loop = asyncio.get_running_loop()
+    parsed = httpx.URL(url)
+    key = (loop, f"{parsed.scheme}://{parsed.netloc.decode()}")
+
+    client = _clients.get(key)
+    if client is None or client.is_closed:
+        _forget_closed_loops()
+        client = httpx.AsyncClient(limits=_limits, timeout=_timeout, http2=_http2)
+        _clients[key] = client
+
+    return client
+
+
+async def aclose_http_clients():
+    """
+    Close the pooled clients of the running event loop (e.g. when the application shuts down).
+    """
+    loop = asyncio.get_running_loop()
+
+    for key in [key for key in _clients if key[0] is loop]:
+        await _clients.pop(key).aclose()
+
+    _forget_closed_loops()
@@ -0,0 +1,595 @@
+import collections.abc
+import copy
+import re
+import time
+import types
+from typing import Any, Callable, Optional, Union, get_args, get_origin
+
+from pydantic import BaseModel, TypeAdapter
+from pydantic_core import from_json
+
+from autoplan.application import compile_model
+
+# the characters that can end a string, or escape the next character
+_STRING_SPECIAL = re.compile(r'["\\]')
+# the characters that end a number, or a literal (true, false or null)
+_NUMBER_END = re.compile(r"[^0-9.eE+\-]")
+_LITERAL_END = re.compile(r"[^a-z]")
+_WHITESPACE = " \t\n\r"
+
+# the absence of a value, since None is a value
+_NOTHING: Any = object()
+
+
+def _drop_last_item(value) -> bool:
+    """
+    Remove the innermost item at the end of a partially parsed JSON value (the one still being generated).
+    Returns False if there is nothing left to remove.
+    """
+    if isinstance(value, dict) and value:
+        last = value[next(reversed(value))]
+        if not _drop_last_item(last):
+            value.popitem()
+        return True
+    elif isinstance(value, list) and value:
+        if not _drop_last_item(value[-1]):
+            value.pop()
+        return True
+    return False
+
+
+def _parse_json(output: str, partial_strings: bool = False) -> Any:
+    try:
+        return from_json(
+            output, allow_partial="trailing-strings" if partial_strings else True
+        )
+    except Exception:
+        # if parsing fails, just return None
+        return None
+
+
+def _validate_partial[T: BaseModel](json_content: Any, model: type[T]) -> Optional[T]:
+    partial_model = compile_model(model).partial_model
+
+    while True:
+        try:
+            return partial_model.model_validate(json_content, strict=False)
+        except Exception:
+            # the item being generated may not be valid yet (e.g. a nested object missing required fields),
+            # so drop it and try again with what was generated before it
+            if not _drop_last_item(json_content):
+                return None
+
+
+def _parse_output[T: BaseModel](
+    output: str, model: type[T], partial_strings: bool = False
+) -> Optional[T]:
+    json_content = _parse_json(output, partial_strings)
+    if json_content is None:
+        return None
+
+    return _validate_partial(json_content, model)
+
+
+class _Validator:
+    """
+    Validates a JSON value, dropping the items at its end until it's valid (like `_validate_partial`).
+    """
+
+    def __init__(self, validate: Callable[[Any], Any]):
+        self._validate = validate
+
+    def __call__(self, value: Any) -> tuple[Any, bool]:
+        """
+        Returns the validated value (or `_NOTHING` if nothing of it is valid), and whether it was valid as is.
+        """
+        try:
+            return self._validate(value), True
+        except Exception:
+            pass
+
+        # the value can share items with the parser's state
+        value = copy.deepcopy(value)
+        while _drop_last_item(value):
+            try:
+                return self._validate(value), False
+            except Exception:
+                pass
+        return _NOTHING, False
+
+
+class _Node:
+    """
+    How a value of the output is validated: as a whole, or item by item for the objects of models
+    whose fields are all optional (such as partial models) and for lists, so that the items of a
+    container are only validated once, when they are complete.
+    """
+
+    def __init__(
+        self,
+        validate: _Validator,
+        model: type[BaseModel] | None = None,
+        item: Optional["_Node"] = None,
+    ):
+        self.validate = validate
+        self.model = model
+        self.item = item
+        self._fields: dict[str, tuple[str, "_Node"] | None] = {}
+
+    def field(self, key: str) -> tuple[str, "_Node"] | None:
+        """
+        The name and node of the field of the model for a key of its object (None if it's ignored).
+        """
+        assert self.model is not None
+        if key not in self._fields:
+            self._fields[key] = _field_node(self.model, key)
+        return self._fields[key]
+
+
+def _is_incremental_model(annotation: Any) -> bool:
+    """
+    Whether the objects of a model can be validated field by field: its fields must all be optional,
+    and validated independently of each other.
+    """
+    if not (isinstance(annotation, type) and issubclass(annotation, BaseModel)):
+        return False
+
+    decorators = annotation.__pydantic_decorators__
+    return (
+        annotation.model_config.get("extra") in (None, "ignore")
+        and not annotation.__pydantic_root_model__
+        and not (
+            decorators.validators
+            or decorators.field_validators
+            or decorators.root_validators
+            or decorators.model_validators
+        )
+        and all(
+            not field.is_required()
+            and field.alias is None
+            and field.validation_alias is None
+            for field in annotation.model_fields.values()
+        )
+    )
+
+
+def _node(annotation: Any, validate: _Validator) -> _Node:
+    if get_origin(annotation) in (Union, types.UnionType):
+        # optional values are validated like the others, since null is a scalar
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            annotation = args[0]
+
+    if _is_incremental_model(annotation):
+        return _Node(validate, model=annotation)
+
+    if get_origin(annotation) in (list, collections.abc.Sequence):
+        args = get_args(annotation)
+        item: Any = args[0] if args else Any
+        adapter = TypeAdapter(item)
+        return _Node(
+            validate,
+            item=_node(
+                item, _Validator(lambda v: adapter.validate_python(v, strict=False))
+            ),
+        )
+
+    return _Node(validate)
+
+
+def _field_node(model: type[BaseModel], key: str) -> tuple[str, _Node] | None:
+    field = model.model_fields.get(key)
+    if field is None:
+        return None
+
+    # validating the field alone within its model keeps its constraints
+    validate = _Validator(
+        lambda v: getattr(model.model_validate({key: v}, strict=False), key)
+    )
+
+    if field.metadata or field.discriminator is not None:
+        return key, _Node(validate)
+    return key, _node(field.annotation, validate)
+
+
+class _Container:
+    """
+    An object or a list of the output that is still being generated.
+    """
+
+    def __init__(self, is_object: bool, node: _Node | None):
+        self.is_object = is_object
+        # the node validating the container (None if it's validated as part of a container above it)
+        self.node = node
+        # the model of an object or the node of the items of a list, if its items are validated one by one
+        # (otherwise its JSON value is validated as a whole)
+        self.model = node.model if node is not None and is_object else None
+        self.item = node.item if node is not None and not is_object else None
+        self.incremental = self.model is not None or self.item is not None
+        # the complete items, as JSON values or as validated values
+        self.items: Any = {} if is_object else []
+        # the key of the value being generated (its field in the model, None if it's ignored), and its node
+        self.key: str | None = None
+        self.key_node: _Node | None = None
+
+    def child_node(self) -> _Node | None:
+        """
+        The node validating the value being generated in the container.
+        """
+        return self.key_node if self.is_object else self.item
+
+    def add(self, value: Any):
+        if self.is_object:
+            self.items[self.key] = value
+        else:
+            self.items.append(value)
+
+    def value(self, tail: Any = _NOTHING) -> Any:
+        """
+        The JSON or validated value of the container, with the value being generated.
+        """
+        if not self.is_object:
+            items = list(self.items)
+            if tail is not _NOTHING:
+                items.append(tail)
+            return items
+
+        items = dict(self.items)
+        if tail is not _NOTHING:
+            items[self.key] = tail
+        if self.model is not None:
+            return self.model.model_construct(_fields_set=set(items), **items)
+        return items
+
+
+class _Scalar:
+    """
+    A string, number or literal of the output that is still being generated.
+    """
+
+    def __init__(self, first: str, is_key: bool):
+        self.is_string = first == '"'
+        self.end = (
+            None if self.is_string else _LITERAL_END if first in "tfn" else _NUMBER_END
+        )
+        self.is_key = is_key
+        self.parts = [first]
+
+    def text(self) -> str:
+        if len(self.parts) > 1:
+            self.parts = ["".join(self.parts)]
+        return self.parts[0]
+
+
+class PartialOutputParser[T: BaseModel]:
+    """
+    Parses a structured output as it is streamed, chunk by chunk.
+
+    Parsing the whole output again for every chunk takes time quadratic in the length of the output,
+    so the parser keeps the state of the JSON output between chunks: the objects and lists still being
+    generated, with their complete items, which are only parsed and validated once. The items of
+    partial models and lists are validated one by one, so a partial result only validates the item
+    being generated (e.g. the last step of a plan) and reuses the items validated before it.
+
+    The result is only computed again when a chunk can change it: chunks that only extend a string
+    don't (unless `partial_strings` includes the strings being generated). A partial result is only
+    returned when it changed, and at most every `min_interval` seconds (it is computed again once the
+    interval is over). Partial results are the same as parsing the whole output with
+    `from_json(allow_partial=...)` and dropping the items being generated until it's valid.
+    """
+
+    def __init__(
+        self, model: type[T], partial_strings: bool = False, min_interval: float = 0.0
+    ):
+        self.model = model
+        self.partial_strings = partial_strings
+        self.min_interval = min_interval
+        self._chunks: list[str] = []
+        self._length = 0
+
+        partial_model = compile_model(model).partial_model
+        self._root = _node(
+            partial_model,
+            _Validator(lambda v: partial_model.model_validate(v, strict=False)),
+        )
+        self._containers: list[_Container] = []
+        self._scalar: _Scalar | None = None
+        # whether the next character of the string being generated is escaped
+        self._escaped = False
+        # what the next character of the output can be (besides whitespace)
+        self._expect = "value"
+        # the result once the output stops changing it: when it's complete, or when an item before its end
+        # isn't valid (parsing everything drops it and what follows until the output is valid)
+        self._fixed: Any = _NOTHING
+        # whether the output isn't valid JSON (parsing everything fails from then on)
+        self._invalid = False
+
+        # whether the output changed since the result was last computed
+        self._changed = False
+        self._parsed_at = float("-inf")
+        self._previous: Optional[BaseModel] = None
+
+    @property
+    def output(self) -> str:
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    @property
+    def length(self) -> int:
+        """
+        The length of the output so far (without joining its chunks).
+        """
+        return self._length
+
+    def _fail(self):
+        self._invalid = True
+        self._scalar = None
+
+    def _add(
+        self, json_value: Any, validated: Any = _NOTHING, node: _Node | None = None
+    ):
+        """
+        Add a complete value to the container being generated (or complete the output).
+        """
+        self._expect = "end" if self._containers else "done"
+
+        if not self._containers:
+            if validated is _NOTHING:
+                validated, _ = self._root.validate(json_value)
+            self._fixed = validated
+            return
+
+        container = self._containers[-1]
+        if not container.incremental:
+            container.add(json_value)
+            return
+        if node is None:
+            # an ignored key of a model
+            return
+
+        valid = True
+        if validated is _NOTHING:
+            validated, valid = node.validate(json_value)
+        if validated is not _NOTHING:
+            container.add(validated)
+        if not valid:
+            self._fixed = self._partial_result()
+
+    def _open(self, is_object: bool):
+        if self._containers:
+            node = self._containers[-1].child_node()
+        else:
+            node = self._root
+        self._containers.append(_Container(is_object, node))
+        self._expect = "key_or_close" if is_object else "value_or_close"
+
+    def _close(self):
+        container = self._containers.pop()
+        if container.incremental:
+            self._add(None, container.value(), container.node)
+        else:
+            self._add(container.items, node=container.node)
+
+    def _end_scalar(self, scalar: _Scalar):
+        try:
+            value = from_json(scalar.text())
+        except ValueError:
+            self._fail()
+            return
+
+        if scalar.is_key:
+            container = self._containers[-1]
+            container.key = value
+            if container.model is not None:
+                assert container.node is not None
+                field = container.node.field(value)
+                container.key, container.key_node = field or (None, None)
+            self._expect = "colon"
+        else:
+            node = self._containers[-1].child_node() if self._containers else self._root
+            self._add(value, node=node)
+
+    def _scan(self, text: str) -> bool:
+        """
+        Follow the JSON output through a new chunk, returning whether it can change the result.
+        """
+        changed = False
+        index = 0
+        length = len(text)
+
+        while index < length and not self._invalid and self._fixed is _NOTHING:
+            scalar = self._scalar
+
+            if scalar is not None and scalar.is_string:
+                # strings being generated are part of the result with `partial_strings`
+                grows = self.partial_strings and not scalar.is_key
+
+                if self._escaped:
+                    # the first character was escaped at the end of the previous chunk
+                    self._escaped = False
+                    scalar.parts.append(text[index])
+                    index += 1
+                    changed = changed or grows
+                    continue
+
+                match = _STRING_SPECIAL.search(text, index)
+                if match is None:
+                    scalar.parts.append(text[index:])
+                    changed = changed or grows
+                    break
+
+                position = match.start()
+                if text[position] == "\\":
+                    if position + 1 == length:
+                        self._escaped = True
+                    scalar.parts.append(text[index : position + 2])
+                    index = position + 2
+                    changed = changed or grows
+                    continue
+
+                # the string is complete
+                scalar.parts.append(text[index : position + 1])
+                index = position + 1
+                self._scalar = None
+                self._end_scalar(scalar)
+                changed = changed or not scalar.is_key
+                continue
+
+            if scalar is not None:
+                # values other than strings (e.g. numbers) are parsed while they are generated
+                changed = True
+                assert scalar.end is not None
+                match = scalar.end.search(text, index)
+                if match is None:
+                    scalar.parts.append(text[index:])
+                    break
+
+                scalar.parts.append(text[index : match.start()])
+                index = match.start()
+                self._scalar = None
+                self._end_scalar(scalar)
+                continue
+
+            char = text[index]
+            index += 1
+            if char in _WHITESPACE:
+                continue
+
+            expect = self._expect
+            # keys, colons, commas and the start of strings don't change the result on their own
+            changed = changed or not (
+                expect in ("key", "key_or_close", "colon")
+                or char == ","
+                or (char == '"' and not self.partial_strings)
+            )
+
+            if expect in ("value", "value_or_close"):
+                if char == "{":
+                    self._open(is_object=True)
+                elif char == "[":
+                    self._open(is_object=False)
+                elif char == "]" and expect == "value_or_close":
+                    self._close()
+                elif char in '"-0123456789tfn':
+                    # strings being generated start out empty
+                    self._scalar = _Scalar(char, is_key=False)
+                else:
+                    self._fail()
+            elif expect in ("key", "key_or_close"):
+                if char == '"':
+                    self._scalar = _Scalar(char, is_key=True)
+                elif char == "}" and expect == "key_or_close":
+                    self._close()
+                else:
+                    self._fail()
+            elif expect == "colon":
+                if char == ":":
+                    self._expect = "value"
+                else:
+                    self._fail()
+            elif expect == "end":
+                container = self._containers[-1]
+                if char == ",":
+                    self._expect = "key" if container.is_object else "value"
+                elif char == ("}" if container.is_object else "]"):
+                    self._close()
+                else:
+                    # parsing everything ends the output at an unexpected character after a value
+                    self._scalar = None
+                    self._fixed = self._partial_result()
+
+        return changed
+
+    def _scalar_value(self) -> Any:
+        """
+        The JSON value of the scalar being generated, as far as it can be parsed.
+        """
+        scalar = self._scalar
+        if scalar is None or scalar.is_key:
+            return _NOTHING
+        if scalar.is_string and not self.partial_strings:
+            return _NOTHING
+
+        try:
+            return from_json(
+                scalar.text(),
+                allow_partial="trailing-strings" if scalar.is_string else False,
+            )
+        except ValueError:
+            if scalar.is_string:
+                # an invalid escape sequence
+                self._fail()
+            # otherwise, e.g. a number ending with "." or an incomplete literal
+            return _NOTHING
+
+    def _json_value(self, depth: int) -> Any:
+        """
+        The JSON value of a container being generated, with the values being generated in it.
+        """
+        if depth + 1 < len(self._containers):
+            tail = self._json_value(depth + 1)
+        else:
+            tail = self._scalar_value()
+        return self._containers[depth].value(tail)
+
+    def _validated_value(self, depth: int, node: _Node) -> Any:
+        """
+        The validated value of a container being generated, with the values being generated in it.
+        """
+        container = self._containers[depth]
+        if not container.incremental:
+            return node.validate(self._json_value(depth))[0]
+
+        tail = _NOTHING
+        child_node = container.child_node()
+        if child_node is not None:
+            if depth + 1 < len(self._containers):
+                tail = self._validated_value(depth + 1, child_node)
+            elif (value := self._scalar_value()) is not _NOTHING:
+                tail, _ = child_node.validate(value)
+        return container.value(tail)
+
+    def _partial_result(self) -> Any:
+        if self._fixed is not _NOTHING:
+            return self._fixed
+        if self._containers:
+            return self._validated_value(0, self._root)
+        if (value := self._scalar_value()) is not _NOTHING:
+            return self._root.validate(value)[0]
+        return _NOTHING
+
+    def feed(self, text: str) -> Optional[T]:
+        """
+        Add a chunk of the output, returning the partial result if it changed.
+        """
+        self._chunks.append(text)
+        self._length += len(text)
+
+        if not self._invalid and self._fixed is _NOTHING and self._scan(text):
+            self._changed = True
+        if self._invalid:
+            return None
+
+        now = time.monotonic()
+        if not self._changed or now - self._parsed_at < self.min_interval:
+            return None
+
+        self._changed = False
+        self._parsed_at = now
+
+        parsed = self._partial_result()
+        if self._invalid:
+            return None
+        # complete items are the same objects from one result to the next, so comparing is cheap
+        if parsed is _NOTHING or parsed == self._previous:
+            return None
+
+        self._previous = parsed
+        return parsed
+
+    def result(self) -> T:
+        """
+        Validate the complete output.
+        """
+        return compile_model(self.model).adapter.validate_json(self.output)
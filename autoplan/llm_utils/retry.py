@@ -0,0 +1,194 @@
+import asyncio
+import random
+import time
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Awaitable, Callable
+
+import httpx
+
+# rate limits, timeouts and errors of the provider, which usually don't happen again
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+def _status_code(error: BaseException) -> int | None:
+    status_code = getattr(error, "status_code", None)
+    if isinstance(status_code, int):
+        return status_code
+
+    response = getattr(error, "response", None)
+    status_code = getattr(response, "status_code", None)
+    return status_code if isinstance(status_code, int) else None
+
+
+def _retry_after(error: BaseException) -> float | None:
+    """
+    How long the provider asked to wait before retrying (the Retry-After header of the response), in seconds.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers is None:
+        return None
+
+    try:
+        if (value := headers.get("retry-after-ms")) is not None:
+            return float(value) / 1000
+        if (value := headers.get("retry-after")) is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            # an HTTP date
+            return parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+    How the LLM calls of the framework are retried when they fail with a transient error
+    (a rate limit, a timeout, a 5xx response or a connection error).
+
+    max_attempts: The maximum number of attempts of each call, including the first one.
+    initial_delay: The delay before the first retry, in seconds, doubled (by `multiplier`) for each retry.
+    max_delay: The maximum delay before a retry, in seconds. Calls aren't retried if the provider
+        asks to wait longer (with a Retry-After header).
+    multiplier: How much the delay grows with each retry.
+    jitter: Whether to wait a random delay up to the computed one, so the calls failing together
+        don't all retry together.
+    max_retries_per_run: The maximum number of retries of all the LLM calls of a run, so a failing provider
+        doesn't multiply the load of every run (None means no limit).
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        initial_delay: float = 0.5,
+        max_delay: float = 30.0,
+        multiplier: float = 2.0,
+        jitter: bool = True,
+        max_retries_per_run: int | None = 10,
+    ):
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+
+        self.max_attempts = max_attempts
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.max_retries_per_run = max_retries_per_run
+
+    def is_retryable(self, error: BaseException) -> bool:
+        if isinstance(error, (httpx.TransportError, TimeoutError, ConnectionError)):
+            return True
+
+        # litellm's errors (and httpx.HTTPStatusError) carry the status code of the response
+        return _status_code(error) in RETRYABLE_STATUS_CODES
+
+    def delay(self, error: BaseException, attempt: int) -> float | None:
+        """
+        How long to wait before retrying a call that failed on its `attempt`-th attempt, or None if it
+        shouldn't be retried.
+        """
+        if attempt >= self.max_attempts or not self.is_retryable(error):
+            return None
+
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return max(retry_after, 0.0) if retry_after <= self.max_delay else None
+
+        delay = min(self.max_delay, self.initial_delay * self.multiplier ** (attempt - 1))
+        return random.uniform(0, delay) if self.jitter else delay
+
+
+class _RetryBudget:
+    def __init__(self, retries: int | None):
+        self.retries = retries
+
+    def take(self) -> bool:
+        if self.retries is None:
+            return True
+        if self.retries <= 0:
+            return False
+        self.retries -= 1
+        return True
+
+
+_retry_policy: RetryPolicy | None = RetryPolicy()
+
+# the retries left to the run making the call (None outside of runs)
+_retry_budget: ContextVar[_RetryBudget | None] = ContextVar(
+    "retry_budget", default=None
+)
+
+
+def set_retry_policy(policy: RetryPolicy | None):
+    """
+    Set how the LLM calls of the process are retried, or disable retries with None.
+    """
+    global _retry_policy
+    _retry_policy = policy
+
+
+def get_retry_policy() -> RetryPolicy | None:
+    return _retry_policy
+
+
+def start_retry_budget():
+    """
+    Give the calls made from the current context (e.g. a run, and the tasks it starts) their own retry budget.
+    """
+    _retry_budget.set(
+        _RetryBudget(_retry_policy.max_retries_per_run if _retry_policy else None)
+    )
+
+
+async def _wait_before_retry(error: Exception, attempt: int):
+    """
+    Wait before retrying a failed call, or raise its error if it shouldn't be retried.
+    """
+    delay = _retry_policy.delay(error, attempt) if _retry_policy else None
+    budget = _retry_budget.get()
+
+    if delay is None or (budget is not None and not budget.take()):
+        raise error
+
+    await asyncio.sleep(delay)
+
+
+async def retry_call[T](func: Callable[[], Awaitable[T]]) -> T:
+    """
+    Call `func`, calling it again while it fails with an error that the retry policy retries.
+    """
+    attempt = 1
+    while True:
+        try:
+            return await func()
+        except Exception as e:
+            await _wait_before_retry(e, attempt)
+            attempt += 1
+
+
+async def retry_stream[T](
+    start: Callable[[], AsyncIterator[tuple[float, T]]],
+) -> AsyncIterator[T]:
+    """
+    Iterate over a stream, starting it over while it fails with an error that the retry policy retries.
+
+    Each item of the stream comes with its position (e.g. the length of the output it was parsed from):
+    when the stream starts over, its items are skipped until they get past the last item delivered,
+    so the consumer doesn't get the partial items it already has again.
+    """
+    attempt = 1
+    delivered = float("-inf")
+
+    while True:
+        try:
+            async for position, item in start():
+                if position > delivered:
+                    delivered = position
+                    yield item
+            return
+        except Exception as e:
+            await _wait_before_retry(e, attempt)
+            attempt += 1
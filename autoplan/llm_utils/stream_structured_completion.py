@@ -0,0 +1,130 @@
+import math
+from typing import AsyncGenerator, AsyncIterator, cast
+
+from litellm import acompletion
+from pydantic import BaseModel
+
+from autoplan.application import compile_model
+from autoplan.cache import make_cache_key
+from autoplan.llm_utils.completion import (
+    cache_llm_response,
+    get_in_flight_llm_calls,
+    get_llm_cache,
+    llm_cache_key,
+    should_coalesce,
+)
+from autoplan.llm_utils.hedging import hedged_stream
+from autoplan.llm_utils.partial_output import PartialOutputParser
+from autoplan.llm_utils.retry import retry_stream
+
+# how often the phases of the framework parse the partial plans and results they stream by default, in seconds
+PHASE_PARTIAL_INTERVAL = 0.05
+
+
+def _delta_text(chunk) -> str:
+    """
+    Get the text added by a streamed chunk.
+
+    Depending on the provider, structured outputs are streamed either as content or as the arguments of a tool call.
+    """
+    if not chunk.choices:
+        return ""
+
+    delta = chunk.choices[0].delta
+
+    if delta.content:
+        return delta.content
+
+    if delta.tool_calls and delta.tool_calls[0].function.arguments:
+        return delta.tool_calls[0].function.arguments
+
+    return ""
+
+
+async def stream_structured_completion[T: BaseModel](
+    model: str,
+    messages: list[dict[str, str]],
+    response_format: type[T],
+    partial_strings: bool = False,
+    partial_interval: float = 0.0,
+    cache: bool = True,
+    coalesce: bool | None = None,
+    hedge: bool = True,
+    **kwargs,
+) -> AsyncGenerator[BaseModel, None]:
+    """
+    Stream a structured output from any litellm provider.
+
+    Yields partially filled instances of the response format (see `pydantic_partial`) each time
+    the parsed output changes, then the complete, validated instance of `response_format` as the last item.
+    With `partial_strings`, the strings being generated are included as they grow (e.g. to show text
+    as it is written), instead of only once they are complete. Partial instances are yielded at most every
+    `partial_interval` seconds, which bounds the time spent parsing long outputs.
+
+    If the LLM cache is set (see `set_llm_cache`) and `cache` isn't disabled, a response previously streamed
+    for the same call is reused, yielding only the complete instance. With `coalesce` (by default, at
+    temperature 0), concurrent identical calls share a single stream, each getting all of its items.
+
+    Calls failing with a transient error are retried according to the retry policy (see `set_retry_policy`).
+    If the hedging policy is set (see `set_hedging_policy`) and `hedge` isn't disabled, calls slow to stream
+    their first token are hedged.
+    """
+    compiled = compile_model(response_format)
+
+    llm_cache = get_llm_cache() if cache else None
+    # how partial instances are parsed doesn't change the completion
+    key = llm_cache_key(model, messages, response_format=compiled.schema_hash, **kwargs)
+
+    if llm_cache is not None and (cached := llm_cache.get(key)) is not None:
+        yield compiled.adapter.validate_json(cached)
+        return
+
+    async def open_stream(model: str) -> AsyncIterator:
+        response = await acompletion(
+            model=model,
+            messages=messages,
+            response_format=compiled.response_format,
+            stream=True,
+            **kwargs,
+        )
+        # streamed completions are iterated over, which the return type of acompletion doesn't reflect
+        return cast(AsyncIterator, response)
+
+    async def attempt() -> AsyncGenerator[tuple[float, BaseModel], None]:
+        if hedge:
+            response = hedged_stream(model, open_stream)
+        else:
+            response = await open_stream(model)
+
+        parser = PartialOutputParser(response_format, partial_strings, partial_interval)
+
+        async for chunk in response:
+            text = _delta_text(chunk)
+            if not text:
+                continue
+
+            # the parser only returns the instances that changed since the last one
+            if (parsed := parser.feed(text)) is not None:
+                yield parser.length, parsed
+
+        result = parser.result()
+
+        if llm_cache is not None:
+            cache_llm_response(key, parser.output)
+
+        # the complete instance is always delivered, even if a partial one was parsed from the whole output
+        yield math.inf, result
+
+    def stream() -> AsyncIterator[BaseModel]:
+        # failed streams start over, without delivering the partial instances again
+        return retry_stream(attempt)
+
+    if should_coalesce(coalesce, kwargs):
+        # shared streams deliver their partial instances, so they must be parsed the same way
+        flight_key = make_cache_key(key, partial_strings, partial_interval)
+        items = get_in_flight_llm_calls().stream(flight_key, stream)
+    else:
+        items = stream()
+
+    async for item in items:
+        yield item
@@ -1,8 +1,13 @@
-from litellm import acompletion
-from litellm.types.utils import Choices, ModelResponse
+from typing import Callable
+
 from pydantic import BaseModel
 
+from autoplan.application import compile_model
 from autoplan.execution_context import ExecutionContext
+from autoplan.llm_utils.stream_structured_completion import (
+    PHASE_PARTIAL_INTERVAL,
+    stream_structured_completion,
+)
 from autoplan.trace import trace
 
 
@@ -11,10 +16,15 @@ async def combine_steps(
     context: ExecutionContext,
     prompts: list[str],
     temperature: float,
+    report_partial_result: Callable[[BaseModel], None] | None = None,
 ) -> BaseModel:
     """
     Combine the steps into a final result.
+
+    The result is streamed: partially generated results are passed to `report_partial_result`
+    as they are parsed, before the complete result is returned.
     """
+    output = compile_model(context.output_model)
     messages = []
 
     for index, prompt in enumerate(prompts):
@@ -27,24 +37,40 @@ async def combine_steps(
             }
         )
 
-    response = await acompletion(
+    result = None
+
+    async for result in stream_structured_completion(
         model=context.combine_steps_llm_model,
         messages=messages,
-        **context.combine_steps_llm_args,
-        temperature=temperature,
-        response_format={
-            "type": "json_schema",
-            "json_schema": {
-                "schema": context.output_model.model_json_schema(),
-                "name": context.output_model.__name__,
-            },
+        response_format=context.output_model,
+        # final results are mostly text, which can be shown as it is written
+        partial_strings=True,
+        **{
+            "partial_interval": PHASE_PARTIAL_INTERVAL,
+            **context.combine_steps_llm_args,
         },
-    )
+        temperature=temperature,
+    ):
+        # the last item of the stream is the complete result, which isn't partial
+        if report_partial_result and isinstance(result, output.partial_model):
+            report_partial_result(result)
 
-    # asserts are for type checking, and reflect invariants we expect from the acompletion function
-    assert isinstance(response, ModelResponse)
-    choice = response.choices[0]
-    assert isinstance(choice, Choices)
-    assert choice.message.content
+    assert isinstance(result, context.output_model)
+
+    return result
+
+
+def reduce_prompt(partial_results: list[BaseModel]) -> str:
+    """
+    The prompt asking to combine the partial results of groups of steps into a single result.
+    """
+    lines = [
+        "The results of the steps were combined in parts, each part covering some of the steps. "
+        "Combine these partial results into a single result, keeping the information they hold "
+        "and following the instructions above.",
+        "",
+    ]
+    for index, partial_result in enumerate(partial_results):
+        lines.append(f"- Part {index}: {partial_result.model_dump_json()}")
 
-    return context.output_model.model_validate_json(choice.message.content)
+    return "\n".join(lines)
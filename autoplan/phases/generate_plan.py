@@ -1,12 +1,29 @@
-from asyncio import Queue
+from pydantic import BaseModel
 
+from autoplan.application import compile_model
+from autoplan.cache import Cache, make_cache_key
+from autoplan.channel import ResultChannel
 from autoplan.execution_context import ExecutionContext
-from autoplan.llm_utils.create_partial_streaming_completion import (
-    create_partial_streaming_completion,
+from autoplan.llm_utils.stream_structured_completion import (
+    PHASE_PARTIAL_INTERVAL,
+    stream_structured_completion,
 )
 from autoplan.models import Plan
 from autoplan.trace import trace
-from litellm import acompletion
+
+
+def _plan_cache_key(
+    context: ExecutionContext, messages: list[dict[str, str]], temperature: float
+) -> str:
+    return make_cache_key(
+        "plan",
+        context.generate_plan_llm_model,
+        messages,
+        context.generate_plan_llm_args,
+        temperature,
+        # plans generated for a different set of tools (or plan class) can't be reused
+        compile_model(context.plan_class).schema_hash,
+    )
 
 
 @trace
@@ -14,10 +31,17 @@ async def generate_plan(
     context: ExecutionContext,
     prompts: list[str],
     temperature: float,
-    queue: Queue[Plan | None],
-):
+    queue: ResultChannel[BaseModel],
+    cache: Cache | None = None,
+) -> Plan:
     """
     Generate a plan for achieving the application's goal using steps that use the provided tools.
+
+    The plan is streamed: partially generated plans are put on the channel as they are parsed,
+    followed by the complete plan, and the channel is then closed.
+
+    If a cache is provided, a plan previously generated for the same prompts, model, LLM arguments
+    and plan schema is reused instead of calling the LLM.
     """
     messages = []
 
@@ -30,20 +54,40 @@ async def generate_plan(
                 "content": prompt,
             }
         )
-    response = await acompletion(
-        model=context.generate_plan_llm_model,
-        messages=messages,
-        response_format={
-            "type": "json_schema",
-            "json_schema": {
-                "schema": context.plan_class.model_json_schema(),
-                "name": context.plan_class.__name__,
+
+    cache_key = None
+
+    if cache is not None:
+        cache_key = _plan_cache_key(context, messages, temperature)
+
+        if (cached := cache.get(cache_key)) is not None:
+            plan = compile_model(context.plan_class).adapter.validate_json(cached)
+            queue.put_nowait(plan)
+            queue.close()
+            return plan
+
+    plan = None
+
+    try:
+        async for plan in stream_structured_completion(
+            model=context.generate_plan_llm_model,
+            messages=messages,
+            response_format=context.plan_class,
+            **{
+                "partial_interval": PHASE_PARTIAL_INTERVAL,
+                **context.generate_plan_llm_args,
             },
-        },
-        **context.generate_plan_llm_args,
-        temperature=temperature,
-    )
+            temperature=temperature,
+        ):
+            queue.put_nowait(plan)
+    finally:
+        # always signal the end of the stream, so the consumer doesn't wait forever on failures
+        queue.close()
+
+    # the last item of the stream is the complete plan
+    assert isinstance(plan, context.plan_class)
+
+    if cache is not None and cache_key is not None:
+        cache.set(cache_key, plan.model_dump_json())
 
-    queue.put_nowait(context.plan_class.model_validate_json(response.choices[0].message.content))
-    queue.put_nowait(None)
-    return context.plan_class.model_validate_json(response.choices[0].message.content)
+    return plan
@@ -0,0 +1,71 @@
+from autoplan.models import Plan
+from autoplan.results import StepResult
+from autoplan.scheduler import get_step_dependencies
+
+# results are shown to the planner up to this many characters
+MAX_RESULT_LENGTH = 1000
+
+
+def get_steps_to_replace(
+    plan: Plan, step_results: list[StepResult], replaced: set[int]
+) -> set[int]:
+    """
+    Get the steps that didn't succeed, and the steps depending on them (directly or not),
+    leaving out the steps that were already replaced.
+    """
+    to_replace = {
+        index
+        for index, step_result in enumerate(step_results)
+        if step_result.status != "succeeded"
+    }
+
+    # steps only depend on steps that come before them in a valid plan, but follow the
+    # dependencies until nothing changes to also cover invalid ones
+    while True:
+        dependents = {
+            index
+            for index, step in enumerate(plan.steps)
+            if index not in to_replace and get_step_dependencies(step) & to_replace
+        }
+        if not dependents:
+            break
+        to_replace |= dependents
+
+    return to_replace - replaced
+
+
+def repair_plan_prompt(
+    plan: Plan, step_results: list[StepResult], to_replace: set[int]
+) -> str:
+    """
+    The prompt asking the planner for the steps replacing the steps of a plan that didn't succeed.
+
+    It follows the prompts that generated the plan, and gives the planner the results of the steps,
+    so the new steps can reuse the results that are already known.
+    """
+    lines = [
+        f"Some steps of the plan didn't succeed. Generate a plan with the steps replacing steps {sorted(to_replace)}, "
+        "which failed or depend on steps that didn't succeed. Don't repeat the other steps: their results are known, "
+        "and the new steps can use them with their index.",
+        "",
+        "The steps of the plan and their results:",
+    ]
+
+    for index, (step, step_result) in enumerate(zip(plan.steps, step_results)):
+        if step_result.status == "succeeded" and index not in to_replace:
+            outcome = str(step_result.result)[:MAX_RESULT_LENGTH]
+        else:
+            outcome = step_result.error or step_result.status
+        lines.append(
+            f"- Step {index} ({step_result.status}): {step.tool_call.model_dump_json()} -> {outcome}"
+        )
+
+    offset = len(plan.steps)
+    lines += [
+        "",
+        f"The new steps are added after the existing ones, so the first new step has index {offset}, "
+        f"the second one {offset + 1}, and so on. Use these indices to refer to the results of the new steps.",
+    ]
+
+    return "\n".join(lines)
+
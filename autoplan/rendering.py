@@ -0,0 +1,135 @@
+import json
+from typing import Any, Sequence
+
+from litellm.utils import token_counter
+from pydantic import BaseModel
+from pydantic_core import to_jsonable_python
+
+from autoplan.models import Plan
+from autoplan.tool import TYPE_FIELD
+
+# step results are rendered within this many tokens by default
+DEFAULT_MAX_TOKENS = 4000
+
+# how results are summarized when they don't fit, from the least to the most aggressive:
+# the number of items kept in lists, and the number of characters kept in strings
+_SHRINK_LEVELS = [(20, 2000), (10, 500), (4, 200), (2, 50)]
+
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    """
+    Count the tokens of a text, with the tokenizer of `model` if litellm knows it.
+    """
+    if model is None:
+        return token_counter(text=text)
+    return token_counter(model=model, text=text)
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def _project(value: Any) -> Any:
+    """
+    Convert a result to what the LLM sees of it: models defining `llm_view()` are replaced by
+    what it returns, and the rest is converted to JSON-compatible values.
+    """
+    if isinstance(value, BaseModel):
+        llm_view = getattr(value, "llm_view", None)
+        if callable(llm_view):
+            return _project(llm_view())
+        return {
+            name: _project(getattr(value, name)) for name in type(value).model_fields
+        }
+    if isinstance(value, dict):
+        return {str(key): _project(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [_project(item) for item in value]
+    return to_jsonable_python(value, fallback=str)
+
+
+def _shrink(value: Any, max_items: int, max_chars: int) -> Any:
+    """
+    Summarize a JSON-compatible value, keeping the first and last items of long lists and the
+    beginning of long strings.
+    """
+    if isinstance(value, str) and len(value) > max_chars:
+        return value[:max_chars] + f"... ({len(value) - max_chars} more characters)"
+    if isinstance(value, dict):
+        return {key: _shrink(item, max_items, max_chars) for key, item in value.items()}
+    if isinstance(value, list):
+        items = [_shrink(item, max_items, max_chars) for item in value]
+        if len(items) > max_items:
+            head = max_items - max_items // 2
+            tail = max_items // 2
+            return [
+                *items[:head],
+                f"... ({len(items) - max_items} more items)",
+                *(items[-tail:] if tail else []),
+            ]
+        return items
+    return value
+
+
+def _fit(value: Any, max_tokens: int, model: str | None) -> str:
+    """
+    Render a value within `max_tokens`, summarizing it more and more until it fits.
+    """
+    text = _dumps(value)
+    tokens = count_tokens(text, model)
+    for max_items, max_chars in _SHRINK_LEVELS:
+        if tokens <= max_tokens:
+            return text
+        text = _dumps(_shrink(value, max_items, max_chars))
+        tokens = count_tokens(text, model)
+
+    if tokens <= max_tokens:
+        return text
+
+    # still too large (e.g. many fields), so cut the text itself
+    length = len(text) * max(max_tokens, 0) // tokens
+    return text[:length] + "... (truncated)"
+
+
+def render_step_results(
+    plan: Plan,
+    results: Sequence[Any],
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    model: str | None = None,
+) -> str:
+    """
+    Render the results of the steps of a plan for the prompt combining them, one step per line,
+    as compact JSON.
+
+    What the LLM sees of a result can be declared by its tool (`@tool(render_result=...)`) or by its
+    type (a `llm_view()` method on the model). If the results don't fit in `max_tokens` (counted with
+    the tokenizer of `model`), the largest ones are summarized first: long lists keep their first and
+    last items, and long strings their beginning.
+    """
+    prefixes = []
+    values = []
+    for index, (step, result) in enumerate(zip(plan.steps, results)):
+        tool_call = step.tool_call
+        arguments = tool_call.model_dump(mode="json", exclude={TYPE_FIELD})
+        prefixes.append(f"Step {index}: {tool_call.type}({_dumps(arguments)}) -> ")
+
+        if result is not None and tool_call.render_result is not None:
+            result = tool_call.render_result(result)
+        values.append(_project(result))
+
+    texts = [_dumps(value) for value in values]
+    sizes = [count_tokens(text, model) for text in texts]
+    budget = max_tokens - sum(count_tokens(prefix, model) for prefix in prefixes)
+
+    if sum(sizes) > budget:
+        # share the budget between the results, from the smallest to the largest, so the
+        # results smaller than their share are kept whole and the largest ones are summarized
+        order = sorted(range(len(texts)), key=lambda index: sizes[index])
+        for position, index in enumerate(order):
+            share = budget // (len(order) - position)
+            if sizes[index] > share:
+                texts[index] = _fit(values[index], share, model)
+                sizes[index] = count_tokens(texts[index], model)
+            budget -= sizes[index]
+
+    return "\n".join(prefix + text for prefix, text in zip(prefixes, texts))
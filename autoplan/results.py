@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import BaseModel
 
 from autoplan.models import Plan, Step
@@ -32,6 +34,20 @@ class StepResult(Result):
 
     step: Step
     result: BaseModel | str | None
+    # "failed" if the tool raised or timed out, "skipped" if it didn't run because a step it depends on didn't succeed
+    status: Literal["succeeded", "failed", "skipped"] = "succeeded"
+    # a description of why the step failed or was skipped
+    error: str | None = None
+    # whether the result came from the tool's cache (None if the tool isn't cached)
+    cache_hit: bool | None = None
+
+
+class PartialFinalResult[Output: BaseModel](Result):
+    """
+    An unfinished final result (e.g. a final result that is in the process of being generated).
+    """
+
+    result: Output
 
 
 class FinalResult[Output: BaseModel](Result):
@@ -0,0 +1,405 @@
+import asyncio
+import json
+from enum import StrEnum
+from typing import Awaitable, Callable
+
+from pydantic_core import to_json
+
+from autoplan.models import Step
+from autoplan.results import StepResult
+from autoplan.tool import PriorToolResult
+
+StepExecutor = Callable[[int, Step], Awaitable[StepResult]]
+
+StepReporter = Callable[[StepResult], Awaitable[None]]
+
+
+class FailurePolicy(StrEnum):
+    """
+    What to do with the rest of the plan when a step fails.
+    """
+
+    # run the steps that depend on the failed step anyway, with None as the failed step's result
+    CONTINUE = "continue"
+    # don't run the steps that depend (directly or not) on the failed step, reporting them as skipped
+    SKIP_DEPENDENTS = "skip_dependents"
+    # cancel every other step and fail the run
+    FAIL_FAST = "fail_fast"
+
+
+class StepFailedError(Exception):
+    """
+    Raised when a step fails with the `FailurePolicy.FAIL_FAST` policy.
+    """
+
+    def __init__(self, step_result: StepResult):
+        super().__init__(step_result.error)
+        self.step_result = step_result
+
+
+def failed_step_result(step: Step, error: BaseException | str) -> StepResult:
+    if isinstance(error, BaseException):
+        error = f"{type(error).__name__}: {error}"
+    return StepResult(step=step, result=None, status="failed", error=error)
+
+
+async def _ignore_result(step_result: StepResult):
+    pass
+
+
+def get_step_dependencies(step: Step) -> set[int]:
+    """
+    Get the indices of the steps whose results are used as arguments of the given step.
+    """
+    return {
+        arg.step_index_zero_indexed
+        for arg in step.tool_call.__dict__.values()
+        if isinstance(arg, PriorToolResult)
+    }
+
+
+def substitute_dependencies(step: Step, results: dict[int, StepResult]) -> Step:
+    """
+    Replace the prior tool result references of a step with the results of the referenced steps.
+    """
+    args = {}
+    for key, arg in step.tool_call.__dict__.items():
+        if isinstance(arg, PriorToolResult):
+            args[key] = results[arg.step_index_zero_indexed].result
+        else:
+            args[key] = arg
+    return step.model_copy(
+        update={"tool_call": step.tool_call.__class__.model_validate(args)}
+    )
+
+
+def get_step_signature(step: Step, canonical_indices: dict[int, int]) -> str | None:
+    """
+    Get a signature identifying the tool call of a step, or None if its arguments can't be serialized.
+
+    References to prior results are replaced by the index of the step that actually computes them,
+    so calls using the results of identical steps have the same signature.
+    """
+    arguments = {}
+    for key, arg in step.tool_call.__dict__.items():
+        if isinstance(arg, PriorToolResult):
+            index = arg.step_index_zero_indexed
+            arguments[key] = {"$step": canonical_indices.get(index, index)}
+        else:
+            arguments[key] = arg
+
+    try:
+        serialized = to_json(arguments)
+    except Exception:
+        return None
+
+    return json.dumps(
+        [step.tool_call.__class__.__name__, json.loads(serialized)], sort_keys=True
+    )
+
+
+class StepScheduler:
+    """
+    Executes the steps of a plan as a dependency graph.
+
+    The graph is built from the `PriorToolResult` references of each step when the step is added.
+    A step is started as soon as the last step it depends on completes, so there is no polling
+    and no waiting on steps that are unrelated to it.
+
+    Steps can be added one at a time (e.g. while a plan is still being generated), and the
+    scheduler is closed once all the steps of the plan are known.
+
+    Every step ends with exactly one result, passed to `report` as soon as it is known: the result
+    of executing it, a failure (including invalid dependencies), or a skip decided by the failure policy.
+
+    When `deduplicate` is set, a step whose tool call is identical to a prior step (including
+    references to the results of identical steps) isn't executed again: it waits for the prior step
+    and is reported with the prior step's result.
+    """
+
+    def __init__(
+        self,
+        execute: StepExecutor,
+        report: StepReporter = _ignore_result,
+        deduplicate: bool = False,
+        failure_policy: FailurePolicy = FailurePolicy.SKIP_DEPENDENTS,
+    ):
+        self._execute = execute
+        self._report = report
+        self._deduplicate = deduplicate
+        self._failure_policy = failure_policy
+        # maps the signature of a tool call to the first step making it
+        self._signatures: dict[str, int] = {}
+        # maps each step to the step that computes its result
+        self._canonical_indices: dict[int, int] = {}
+        self._steps: dict[int, Step] = {}
+        self._results: dict[int, StepResult] = {}
+        self._futures: dict[int, asyncio.Future[StepResult]] = {}
+        # number of unfinished dependencies for each step that is not ready yet
+        self._pending: dict[int, int] = {}
+        # steps waiting on the result of a given step
+        self._dependents: dict[int, list[int]] = {}
+        # steps whose result is already decided (executed, failed or skipped)
+        self._settled: set[int] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self._closed = False
+        self._error: StepFailedError | None = None
+
+    def _future(self, index: int) -> asyncio.Future[StepResult]:
+        if index not in self._futures:
+            self._futures[index] = asyncio.get_running_loop().create_future()
+        return self._futures[index]
+
+    def add_step(self, index: int, step: Step):
+        """
+        Add a step to the graph, starting it right away if its dependencies are already available.
+        """
+        if self._closed:
+            raise ValueError("Cannot add steps to a closed scheduler")
+        if index in self._steps:
+            raise ValueError(f"Step {index} was already added")
+
+        self._steps[index] = step
+        self._future(index)
+        self._canonical_indices[index] = index
+
+        if self._error:
+            # the run was aborted, so the step will never run
+            self._future(index).cancel()
+            return
+
+        if self._deduplicate:
+            signature = get_step_signature(step, self._canonical_indices)
+            if signature is not None:
+                self._canonical_indices[index] = self._signatures.setdefault(
+                    signature, index
+                )
+
+        dependencies = self._dependencies(index)
+
+        for dependency in sorted(dependencies):
+            if dependency in self._results and self._blocks_dependents(
+                self._results[dependency]
+            ):
+                self._settle(index, self._blocked_result(index, dependency))
+                return
+
+        unresolved = {
+            dependency for dependency in dependencies if dependency not in self._results
+        }
+
+        if not unresolved:
+            self._start(index)
+            return
+
+        self._pending[index] = len(unresolved)
+        for dependency in unresolved:
+            self._dependents.setdefault(dependency, []).append(index)
+
+    def add_result(self, index: int, step_result: StepResult):
+        """
+        Add a step whose result is already known (e.g. from a previous attempt at the plan),
+        without executing or reporting it. Steps depending on it use that result.
+        """
+        if self._closed:
+            raise ValueError("Cannot add steps to a closed scheduler")
+        if index in self._steps:
+            raise ValueError(f"Step {index} was already added")
+
+        self._steps[index] = step_result.step
+        self._canonical_indices[index] = index
+        self._results[index] = step_result
+        self._settled.add(index)
+        self._future(index).set_result(step_result)
+
+    def close(self):
+        """
+        Mark the graph as complete, failing the steps whose dependencies can never be satisfied.
+        """
+        self._closed = True
+
+        for index in sorted(self._pending):
+            missing = self._dependencies(index) - self._steps.keys()
+            if missing:
+                self._settle(
+                    index,
+                    failed_step_result(
+                        self._steps[index],
+                        f"Step {index} depends on steps {sorted(missing)} that are not part of the plan",
+                    ),
+                )
+
+        # steps that are running or settled can always complete, and so can steps that only
+        # depend on those; anything left over is part of (or depends on) a circular dependency
+        runnable = self._steps.keys() - self._pending.keys()
+        remaining = set(self._pending)
+        while True:
+            ready = {
+                index for index in remaining if self._dependencies(index) <= runnable
+            }
+            if not ready:
+                break
+            runnable |= ready
+            remaining -= ready
+
+        for index in sorted(remaining):
+            self._settle(
+                index,
+                failed_step_result(
+                    self._steps[index],
+                    f"Step {index} is part of (or depends on) a circular dependency",
+                ),
+            )
+
+    def _dependencies(self, index: int) -> set[int]:
+        dependencies = get_step_dependencies(self._steps[index])
+        if self._canonical_indices[index] != index:
+            # also wait for the step's own dependencies, to report its result with its own arguments
+            dependencies.add(self._canonical_indices[index])
+        return dependencies
+
+    def _blocks_dependents(self, step_result: StepResult) -> bool:
+        return step_result.status != "succeeded" and (
+            self._failure_policy != FailurePolicy.CONTINUE
+        )
+
+    def _blocked_result(self, index: int, dependency: int) -> StepResult:
+        """
+        The result of a step that can't run because one of its dependencies didn't succeed.
+        """
+        step = self._steps[index]
+        dependency_result = self._results[dependency]
+
+        if self._canonical_indices[index] == dependency:
+            # the step is identical to the failed one, so it failed in the same way
+            return dependency_result.model_copy(update={"step": step})
+
+        return StepResult(
+            step=step,
+            result=None,
+            status="skipped",
+            error=f"Skipped because step {dependency} {dependency_result.status}",
+        )
+
+    def _start(self, index: int):
+        self._pending.pop(index, None)
+        if not self._error:
+            self._spawn(self._run(index))
+
+    def _settle(self, index: int, step_result: StepResult):
+        """
+        Complete a step with an already known result, without executing it.
+        """
+        self._pending.pop(index, None)
+        self._settled.add(index)
+        if not self._error:
+            self._spawn(self._complete(index, step_result))
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, index: int):
+        self._settled.add(index)
+        step = self._steps[index]
+        canonical_index = self._canonical_indices[index]
+
+        try:
+            step = substitute_dependencies(step, self._results)
+
+            if canonical_index != index:
+                step_result = self._results[canonical_index].model_copy(
+                    update={"step": step}
+                )
+            else:
+                step_result = await self._execute(index, step)
+        except asyncio.CancelledError:
+            self._future(index).cancel()
+            raise
+        except Exception as e:
+            step_result = failed_step_result(step, e)
+
+        await self._complete(index, step_result)
+
+    async def _complete(self, index: int, step_result: StepResult):
+        self._results[index] = step_result
+
+        try:
+            await self._report(step_result)
+        finally:
+            future = self._future(index)
+            if not future.done():
+                future.set_result(step_result)
+
+        if step_result.status == "failed" and (
+            self._failure_policy == FailurePolicy.FAIL_FAST
+        ):
+            self._abort(StepFailedError(step_result))
+            return
+
+        for dependent in self._dependents.pop(index, []):
+            if dependent in self._settled:
+                # the dependent already got a result because of another one of its dependencies
+                continue
+
+            if self._blocks_dependents(step_result):
+                self._settle(dependent, self._blocked_result(dependent, index))
+                continue
+
+            self._pending[dependent] -= 1
+            if self._pending[dependent] == 0:
+                self._start(dependent)
+
+    def _abort(self, error: StepFailedError):
+        self._error = error
+        self.cancel()
+
+        for future in self._futures.values():
+            if not future.done():
+                future.cancel()
+
+    async def wait(self) -> list[StepResult]:
+        """
+        Wait for all the steps to complete, returning their results ordered by step index.
+
+        Raises `StepFailedError` if a step failed with the `FailurePolicy.FAIL_FAST` policy.
+        """
+        if not self._closed:
+            raise ValueError("The scheduler must be closed before waiting for results")
+
+        indices = sorted(self._steps)
+        results = await asyncio.gather(
+            *(self._futures[i] for i in indices), return_exceptions=True
+        )
+
+        if self._error:
+            raise self._error
+
+        step_results = []
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+            step_results.append(result)
+
+        return step_results
+
+    async def aclose(self):
+        """
+        Cancel all the steps that are currently running, and wait for them to stop.
+        """
+        self.cancel()
+        current_task = asyncio.current_task()
+        await asyncio.gather(
+            *(task for task in self._tasks if task is not current_task),
+            return_exceptions=True,
+        )
+
+    def cancel(self):
+        """
+        Cancel all the steps that are currently running.
+        """
+        current_task = asyncio.current_task()
+        for task in list(self._tasks):
+            if task is not current_task:
+                task.cancel()
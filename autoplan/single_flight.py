@@ -0,0 +1,110 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Coroutine
+
+
+class _Flight:
+    """
+    A call in flight, and the callers waiting for it.
+    """
+
+    task: asyncio.Task
+
+    def __init__(self):
+        self.waiters = 0
+        # the items streamed so far, for the callers joining a stream after it started
+        self.items: list[Any] = []
+        self.changed = asyncio.Event()
+        # whether the call was cancelled because nobody needed it anymore
+        self.abandoned = False
+
+    def leave(self):
+        self.waiters -= 1
+        # nobody needs the call anymore
+        if self.waiters == 0 and not self.task.done():
+            self.abandoned = True
+            self.task.cancel()
+
+
+class SingleFlight:
+    """
+    Shares the calls in flight with the identical calls made before they finish, so concurrent identical
+    calls (e.g. the same tool call in many runs) are only made once.
+
+    Calls are identified by a key, and shared within an event loop. A call is cancelled once all the
+    callers waiting for it are cancelled, but not before: cancelling one caller doesn't affect the others.
+    """
+
+    def __init__(self):
+        self._flights: dict[tuple[asyncio.AbstractEventLoop, str], _Flight] = {}
+
+    def __len__(self):
+        return len(self._flights)
+
+    def _start(
+        self, key: str, coroutine: Callable[[_Flight], Coroutine[Any, Any, Any]]
+    ):
+        loop = asyncio.get_running_loop()
+        flight = self._flights.get((loop, key))
+
+        # a finished call may not be forgotten yet, and an abandoned one may not be finished yet,
+        # but neither is in flight anymore (joining the abandoned call would only get it cancelled)
+        if flight is None or flight.task.done() or flight.abandoned:
+            flight = _Flight()
+            flight.task = loop.create_task(coroutine(flight))
+            self._flights[(loop, key)] = flight
+
+            def forget(_):
+                if self._flights.get((loop, key)) is flight:
+                    del self._flights[(loop, key)]
+
+            flight.task.add_done_callback(forget)
+
+        flight.waiters += 1
+        return flight
+
+    async def call[T](self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Call `func`, or wait for the result of the identical call in flight.
+        """
+
+        async def run(_: _Flight) -> T:
+            return await func()
+
+        flight = self._start(key, run)
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.leave()
+
+    async def stream[T](
+        self, key: str, func: Callable[[], AsyncIterator[T]]
+    ) -> AsyncIterator[T]:
+        """
+        Iterate over `func()`, or over the identical stream in flight, starting with the items it already streamed.
+        """
+
+        async def run(flight: _Flight):
+            try:
+                async for item in func():
+                    flight.items.append(item)
+                    flight.changed.set()
+                    flight.changed = asyncio.Event()
+            finally:
+                flight.changed.set()
+
+        flight = self._start(key, run)
+        try:
+            index = 0
+            while True:
+                while index < len(flight.items):
+                    yield flight.items[index]
+                    index += 1
+
+                if flight.task.done():
+                    # raises the error of the stream, if it failed
+                    flight.task.result()
+                    return
+
+                await flight.changed.wait()
+        finally:
+            flight.leave()
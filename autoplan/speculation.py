@@ -0,0 +1,165 @@
+import asyncio
+from collections import Counter, deque
+from typing import Any, Callable, Coroutine, Iterable
+
+from autoplan.models import Plan
+from autoplan.tool import PriorToolResult, Tool
+
+Predictor = Callable[[dict[str, Any]], Iterable[Tool]]
+
+ToolCallExecutor = Callable[[Tool], Coroutine[Any, Any, Any]]
+
+
+def _is_concrete(tool_call: Tool) -> bool:
+    """
+    Whether all the arguments of a tool call are known, without waiting for other steps.
+    """
+    return not any(
+        isinstance(arg, PriorToolResult) for arg in tool_call.__dict__.values()
+    )
+
+
+class Speculator:
+    """
+    Predicts tool calls that the plan of a run is likely to contain, so they can start while the plan is
+    still being generated.
+
+    Calls are predicted by `predict` (given the arguments of the application), or, without it, learned
+    from the plans of the previous runs: a call that appeared in at least `min_frequency` of the last
+    `history_size` plans (and in at least 2 of them) is predicted for the next runs.
+
+    At most `max_calls` calls are started per run, which caps the work wasted on wrong predictions.
+    The calls that the final plan doesn't contain are cancelled as soon as the plan is known.
+    """
+
+    def __init__(
+        self,
+        predict: Predictor | None = None,
+        max_calls: int = 4,
+        history_size: int = 100,
+        min_frequency: float = 0.5,
+    ):
+        self.predict = predict
+        self.max_calls = max_calls
+        self.min_frequency = min_frequency
+        self._history: deque[set[str]] = deque(maxlen=history_size)
+        self._tool_calls: dict[str, Tool] = {}
+        # the number of speculative calls that were used by a step of the plan
+        self.hits = 0
+        # the number of speculative calls that were discarded (the wasted work)
+        self.misses = 0
+
+    def _predict_from_history(self) -> list[Tool]:
+        counts = Counter(key for keys in self._history for key in keys)
+        threshold = max(2, self.min_frequency * len(self._history))
+        return [
+            self._tool_calls[key]
+            for key, count in counts.most_common()
+            if count >= threshold
+        ]
+
+    def predictions(self, application_args: dict[str, Any]) -> list[Tool]:
+        """
+        Get the tool calls to start for a run, most likely first.
+        """
+        if self.predict is not None:
+            predicted = list(self.predict(application_args))
+        else:
+            predicted = self._predict_from_history()
+
+        return [tool_call for tool_call in predicted if _is_concrete(tool_call)][
+            : self.max_calls
+        ]
+
+    def record(self, application_args: dict[str, Any], plan: Plan):
+        """
+        Learn from the final plan of a run.
+        """
+        if self.predict is not None:
+            return
+
+        keys = set()
+        for step in plan.steps or []:
+            if _is_concrete(step.tool_call) and (key := step.tool_call.cache_key()):
+                keys.add(key)
+                self._tool_calls.setdefault(key, step.tool_call)
+
+        self._history.append(keys)
+
+        # forget the calls that are no longer part of the history
+        remembered = set().union(*self._history)
+        for key in self._tool_calls.keys() - remembered:
+            del self._tool_calls[key]
+
+    def start(
+        self, application_args: dict[str, Any], execute: ToolCallExecutor
+    ) -> "Speculation":
+        """
+        Start the predicted tool calls of a run.
+        """
+        speculation = Speculation(self)
+
+        for tool_call in self.predictions(application_args):
+            speculation.start(tool_call, execute)
+
+        return speculation
+
+
+class Speculation:
+    """
+    The speculative tool calls of a run.
+    """
+
+    def __init__(self, speculator: Speculator):
+        self._speculator = speculator
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._discarded: list[asyncio.Task] = []
+
+    def start(self, tool_call: Tool, execute: ToolCallExecutor):
+        key = tool_call.cache_key()
+        if key is None or key in self._tasks:
+            return
+
+        # calls can be predicted for several runs, so each run gets its own copy
+        self._tasks[key] = asyncio.create_task(execute(tool_call.model_copy()))
+
+    def claim(self, tool_call: Tool) -> asyncio.Task | None:
+        """
+        Take the speculative call identical to a tool call of the plan, if one was started.
+        """
+        if not self._tasks:
+            return None
+
+        key = tool_call.cache_key()
+        task = self._tasks.pop(key, None) if key is not None else None
+
+        if task is not None:
+            self._speculator.hits += 1
+        return task
+
+    def keep(self, plan: Plan):
+        """
+        Cancel the speculative calls that the plan doesn't contain.
+        """
+        keys = {
+            step.tool_call.cache_key()
+            for step in plan.steps or []
+            if _is_concrete(step.tool_call)
+        }
+        for key in self._tasks.keys() - keys:
+            self._discard(key)
+
+    async def aclose(self):
+        """
+        Cancel all the speculative calls that weren't claimed, and wait for them to stop.
+        """
+        for key in list(self._tasks):
+            self._discard(key)
+
+        await asyncio.gather(*self._discarded, return_exceptions=True)
+
+    def _discard(self, key: str):
+        task = self._tasks.pop(key)
+        task.cancel()
+        self._discarded.append(task)
+        self._speculator.misses += 1
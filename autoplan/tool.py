@@ -1,12 +1,17 @@
+import hashlib
 import inspect
 import pydoc
 from collections import OrderedDict
 from functools import wraps
-from typing import Any, Callable, Literal, overload
+from typing import Any, Callable, ClassVar, Literal, overload
 
-from pydantic import BaseModel, Field, create_model
+from pydantic import BaseModel, Field, PrivateAttr, create_model
 
+from autoplan.cache import Cache, make_cache_key
+from autoplan.concurrency import ConcurrencyLimiter
 from autoplan.dependency import Dependency
+from autoplan.executors import ExecutorKind, offload
+from autoplan.single_flight import SingleFlight
 from autoplan.trace import trace
 
 
@@ -17,9 +22,39 @@ class Tool(BaseModel):
 
     type: str
 
+    # limits how many steps using this tool can run at the same time
+    concurrency_limiter: ClassVar[ConcurrencyLimiter] = ConcurrencyLimiter()
+
+    # how long a step using this tool can run before failing, in seconds (overrides the run's step timeout)
+    execution_timeout: ClassVar[float | None] = None
+
+    # cache for the results of the tool, invalidated when the source of the tool changes
+    result_cache: ClassVar[Cache | None] = None
+    result_cache_ttl: ClassVar[float | None] = None
+    source_hash: ClassVar[str] = ""
+
+    # converts a result of the tool to what the LLM sees of it when the results are combined
+    render_result: ClassVar[Callable[[Any], Any] | None] = None
+
+    # whether the result of the last call came from the cache (None if the tool isn't cached)
+    _cache_hit: bool | None = PrivateAttr(default=None)
+
     async def __call__(self) -> object:
         pass
 
+    def cache_key(self) -> str | None:
+        """
+        The key of the result of this call in the tool's cache, or None if the arguments can't be serialized.
+        """
+        try:
+            arguments = self.model_dump(mode="json")
+        except Exception:
+            return None
+
+        return make_cache_key(
+            "tool", self.__class__.__name__, self.source_hash, arguments
+        )
+
 
 TYPE_FIELD = "type"
 
@@ -32,8 +67,32 @@ class PriorToolResult(BaseModel):
     step_index_zero_indexed: int
 
 
+_MISSING = object()
+
+# the tool calls in flight in the process, shared by the identical calls of tools with coalesce=True
+_in_flight_calls = SingleFlight()
+
+
+def _source_hash(func: Callable[..., Any]) -> str:
+    func = inspect.unwrap(func)
+    try:
+        source = inspect.getsource(func)
+    except (OSError, TypeError):
+        # e.g. functions created with exec
+        code = getattr(func, "__code__", None)
+        source = code.co_code.hex() if code else func.__qualname__
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
 def _function_to_tool_subclass(
-    func: Callable[..., Any], can_use_prior_results: bool | None = None
+    func: Callable[..., Any],
+    can_use_prior_results: bool | None = None,
+    max_concurrency: int | None = None,
+    cache: Cache | None = None,
+    cache_ttl: float | None = None,
+    timeout: float | None = None,
+    render_result: Callable[[Any], Any] | None = None,
+    coalesce: bool = False,
 ) -> type[Tool]:
     signature = inspect.signature(func)
     fields = OrderedDict()
@@ -62,15 +121,45 @@ def _function_to_tool_subclass(
     model = create_model(name, **fields, __base__=Tool)
     model.__doc__ = doc.strip()
 
+    async def execute(self, kwargs):
+        # identical calls in flight (e.g. in other runs) share a single execution
+        if coalesce and (key := self.cache_key()) is not None:
+            return await _in_flight_calls.call(key, lambda: func(**kwargs))
+        return await func(**kwargs)
+
     async def call(self):
         kwargs = {}
         for name, value in self.model_dump().items():
             if name != TYPE_FIELD:
                 kwargs[name] = getattr(self, name)
 
-        return await func(**kwargs)
+        if self.result_cache is None:
+            return await execute(self, kwargs)
+
+        key = self.cache_key()
+
+        if key is not None:
+            cached = self.result_cache.get(key, _MISSING)
+            if cached is not _MISSING:
+                self._cache_hit = True
+                return cached
+
+        result = await execute(self, kwargs)
+        self._cache_hit = False
+
+        if key is not None:
+            self.result_cache.set(key, result, ttl=self.result_cache_ttl)
+
+        return result
 
     model.__call__ = call
+    model.concurrency_limiter = ConcurrencyLimiter(max_concurrency)
+    model.result_cache = cache
+    model.result_cache_ttl = cache_ttl
+    model.source_hash = _source_hash(func)
+    model.execution_timeout = timeout
+    if render_result is not None:
+        model.render_result = staticmethod(render_result)
 
     return model
 
@@ -80,6 +169,13 @@ def tool(
     f: None = None,
     *,
     can_use_prior_results: bool = False,
+    max_concurrency: int | None = None,
+    cache: Cache | None = None,
+    cache_ttl: float | None = None,
+    timeout: float | None = None,
+    executor: ExecutorKind | None = None,
+    render_result: Callable[[Any], Any] | None = None,
+    coalesce: bool = False,
 ) -> Callable[[Callable[..., Any]], type[Tool]]: ...
 
 
@@ -88,6 +184,13 @@ def tool(
     f: Callable[..., Any],
     *,
     can_use_prior_results: bool = False,
+    max_concurrency: int | None = None,
+    cache: Cache | None = None,
+    cache_ttl: float | None = None,
+    timeout: float | None = None,
+    executor: ExecutorKind | None = None,
+    render_result: Callable[[Any], Any] | None = None,
+    coalesce: bool = False,
 ) -> type[Tool]: ...
 
 
@@ -95,6 +198,13 @@ def tool(
     f: Callable[..., Any] | None = None,
     *,
     can_use_prior_results: bool = False,
+    max_concurrency: int | None = None,
+    cache: Cache | None = None,
+    cache_ttl: float | None = None,
+    timeout: float | None = None,
+    executor: ExecutorKind | None = None,
+    render_result: Callable[[Any], Any] | None = None,
+    coalesce: bool = False,
 ) -> type[Tool] | Callable[[Callable[..., Any]], type[Tool]]:
     """
     Decorator to create a tool from a function.
@@ -114,14 +224,73 @@ def tool(
     def my_tool(arg: str) -> str:
         ...
     then "arg" could be the result of a prior tool, if specified by the plan
+
+    if @tool(max_concurrency=4)
+    def my_tool(arg: str) -> str:
+        ...
+    then at most 4 steps using "my_tool" run at the same time, across all runs in the process,
+    and the other steps wait in the scheduler
+
+    if @tool(cache=InMemoryCache(), cache_ttl=60)
+    def my_tool(arg: str) -> str:
+        ...
+    then the result of "my_tool" is reused for 60 seconds when it's called with the same arguments,
+    until the source of "my_tool" changes
+
+    if @tool(timeout=10)
+    def my_tool(arg: str) -> str:
+        ...
+    then steps using "my_tool" fail if they take more than 10 seconds
+
+    if @tool(executor="process")
+    def my_tool(arg: str) -> str:
+        ...
+    then "my_tool" runs in a pool of processes, so CPU-bound work (e.g. pandas) runs in parallel
+    without blocking the event loop; "my_tool" must be defined at the top level of a module, and
+    large buffers in its arguments (e.g. NumPy arrays) are passed through shared memory.
+    With @tool(executor="thread"), it runs in a pool of threads instead (e.g. for blocking I/O),
+    which is the default for synchronous functions
+
+    if @tool(render_result=lambda data: data.summary)
+    def my_tool(arg: str) -> Data:
+        ...
+    then the results of "my_tool" are rendered for the LLM as their summary by `render_step_results`
+
+    if @tool(coalesce=True)
+    def my_tool(arg: str) -> str:
+        ...
+    then identical calls to "my_tool" made while one is in flight (e.g. by concurrent runs) wait for
+    its result instead of calling "my_tool" again
     """
     if f is None:
         @wraps(tool)
         def decorator(func: Callable[..., Any]) -> type[Tool]:
-            return tool(func, can_use_prior_results=can_use_prior_results)
+            return tool(
+                func,
+                can_use_prior_results=can_use_prior_results,
+                max_concurrency=max_concurrency,
+                cache=cache,
+                cache_ttl=cache_ttl,
+                timeout=timeout,
+                executor=executor,
+                render_result=render_result,
+                coalesce=coalesce,
+            )
         return decorator
     else:
         if not inspect.iscoroutinefunction(f):
-            raise ValueError("Tool functions must be asynchronous")
-        cls = _function_to_tool_subclass(trace(f), can_use_prior_results)
+            # synchronous functions would block the event loop
+            executor = executor or "thread"
+        if executor is not None:
+            f = offload(f, executor)
+        cls = _function_to_tool_subclass(
+            trace(f),
+            can_use_prior_results,
+            max_concurrency,
+            cache,
+            cache_ttl,
+            timeout,
+            render_result,
+            coalesce,
+        )
         return cls
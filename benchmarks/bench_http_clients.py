@@ -0,0 +1,123 @@
+"""
+Compares streaming completions through the pooled HTTP client of the host with creating (and closing)
+a client for each call, as `create_partial_streaming_completion` did before, against a local stand-in
+of the OpenAI streaming API.
+
+Opening a connection to the stand-in takes HANDSHAKE_LATENCY, which simulates the round trips of a
+TCP and TLS handshake with a remote API.
+
+Run with: `poetry run python benchmarks/bench_http_clients.py`
+"""
+
+import asyncio
+import json
+import time
+
+import httpx
+from pydantic import BaseModel
+
+from autoplan import aclose_http_clients
+from autoplan.llm_utils.create_partial_streaming_completion import (
+    _create_partial_streaming_completion_openai,
+)
+
+CALLS = 50
+
+# e.g. 3 round trips of 10 ms for TCP and TLS 1.2
+HANDSHAKE_LATENCY = 0.03
+
+
+class Answer(BaseModel):
+    text: str
+
+
+def _sse_body() -> bytes:
+    events = []
+    for part in ['{"text": "hel', 'lo"}']:
+        delta = {"tool_calls": [{"function": {"arguments": part}}]}
+        events.append(f"data: {json.dumps({'choices': [{'delta': delta}]})}\n\n")
+    events.append("data: [DONE]\n\n")
+    return "".join(events).encode()
+
+
+class StandIn:
+    """
+    An HTTP/1.1 server streaming the same completion for every request, keeping connections alive.
+    """
+
+    def __init__(self):
+        self.connections = 0
+        self.body = _sse_body()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        await asyncio.sleep(HANDSHAKE_LATENCY)
+
+        try:
+            while True:
+                headers = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in headers.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":")[1])
+                await reader.readexactly(length)
+
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: text/event-stream\r\n"
+                    + f"Content-Length: {len(self.body)}\r\n\r\n".encode()
+                    + self.body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+
+async def complete(url: str, httpx_client: httpx.AsyncClient | None = None):
+    answer = None
+    async for answer in _create_partial_streaming_completion_openai(
+        model="gpt-4o-mini",
+        messages=[{"role": "user", "content": "hi"}],
+        response_format=Answer,
+        url=url,
+        api_key="test",
+        httpx_client=httpx_client,
+    ):
+        pass
+    # the server always streams an answer
+    assert answer is not None
+    return answer
+
+
+async def new_client_per_call(url: str):
+    async with httpx.AsyncClient() as client:
+        return await complete(url, client)
+
+
+async def measure(name: str, call, url: str, stand_in: StandIn):
+    stand_in.connections = 0
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        await call(url)
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{name:>20}: {elapsed / CALLS * 1000:7.2f} ms per call, "
+        f"{stand_in.connections} connections for {CALLS} calls"
+    )
+
+
+async def main():
+    stand_in = StandIn()
+    server = await asyncio.start_server(stand_in.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/v1/chat/completions"
+
+    async with server:
+        await measure("new client per call", new_client_per_call, url, stand_in)
+        await measure("pooled client", complete, url, stand_in)
+        await aclose_http_clients()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
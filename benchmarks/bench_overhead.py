@@ -0,0 +1,106 @@
+"""
+Measures the per-run overhead of the framework for an application with many tools, with the LLM
+phases replaced by functions returning immediately, and compares it with the cost of building the
+plan class, its JSON schemas and its partial model on every run, as applications did before they
+were compiled once when decorated.
+
+Run with: `poetry run python benchmarks/bench_overhead.py`
+"""
+
+import asyncio
+import time
+
+from pydantic import BaseModel
+from pydantic_partial import create_partial_model
+
+import autoplan.core
+from autoplan import FinalResult, Plan, Step, tool, with_planning
+from autoplan.application import compile_model
+from autoplan.models import create_plan_class
+
+TOOL_COUNT = 30
+RUNS = 200
+
+
+class Output(BaseModel):
+    answer: str
+
+
+def make_tool(index: int):
+    async def func(query: str, limit: int = 10) -> str:
+        return query
+
+    func.__name__ = f"tool_{index}"
+    func.__doc__ = f"Tool number {index}."
+    return tool(func)
+
+
+tools = [make_tool(index) for index in range(TOOL_COUNT)]
+
+
+async def generate_plan(context, prompts, temperature, queue, *args):
+    # the real phase sends the compiled schema to the LLM
+    compile_model(context.plan_class).response_format
+
+    plan = context.plan_class(
+        rationale="", steps=[{"tool_call": {"type": "tool_0", "query": "a"}}]
+    )
+    queue.put_nowait(plan)
+    queue.close()
+    return plan
+
+
+async def combine_steps(context, prompts, temperature, *args):
+    compile_model(context.output_model).response_format
+    return context.output_model(answer="a")
+
+
+autoplan.core.generate_plan = generate_plan
+autoplan.core.combine_steps = combine_steps
+
+
+@with_planning(
+    step_class=Step,
+    plan_class=Plan,
+    tools=tools,
+    generate_plan_prompt_generator=lambda context, args: [""],
+    combine_steps_prompt_generator=lambda context, plan, results: [],
+)
+async def app(query: str) -> Output:
+    pass
+
+
+def build_per_run():
+    # what each run used to do before reaching the LLM
+    plan_class = create_plan_class(Step, Plan, tools)
+    plan_class.model_json_schema()
+    Output.model_json_schema()
+    create_partial_model(plan_class)
+
+
+async def run_app():
+    async for r in app(query="a"):
+        if isinstance(r, FinalResult):
+            return r.result
+
+
+async def main():
+    # warm up
+    await run_app()
+
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        await run_app()
+    per_run = (time.perf_counter() - start) / RUNS
+
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        build_per_run()
+    rebuilt = (time.perf_counter() - start) / RUNS
+
+    print(f"{'run':>22}: {per_run * 1000:8.3f} ms per run with {TOOL_COUNT} tools")
+    print(f"{'rebuilding per run':>22}: {rebuilt * 1000:8.3f} ms more per run, without compiling")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+"""
+Compares parsing streamed plans with `PartialOutputParser` against parsing the whole output again for
+every chunk, as the streaming completions did before: a plan of about 20k tokens whose steps have long
+rationales, and a dense plan of 800 short steps, where most chunks change the partial plan.
+
+The plans are streamed in chunks of about one token (4 characters), as the LLM APIs stream them.
+
+Run with: `poetry run python benchmarks/bench_partial_output.py`
+"""
+
+import time
+
+from pydantic import Field
+
+from autoplan import Plan, Step, tool
+from autoplan.llm_utils.partial_output import PartialOutputParser, _parse_output
+from autoplan.models import create_plan_class
+from autoplan.rendering import count_tokens
+
+STEPS = 200
+DENSE_STEPS = 800
+CHUNK_SIZE = 4
+
+
+class DetailedStep(Step):
+    rationale: str = Field(description="Why the step is needed.")
+
+
+@tool
+async def search(query: str, limit: int = 10) -> str:
+    return query
+
+
+detailed_plan_class = create_plan_class(DetailedStep, Plan, [search])
+plan_class = create_plan_class(Step, Plan, [search])
+
+detailed_output = detailed_plan_class(
+    rationale="Search for each company, then compare them. " * 20,
+    steps=[
+        {
+            "rationale": f"The results for company {index} are needed to compare it with the others, "
+            "so they are searched with a precise query. " * 3,
+            "tool_call": {"type": "search", "query": f"company {index} revenue"},
+        }
+        for index in range(STEPS)
+    ],
+).model_dump_json()
+
+dense_output = plan_class(
+    rationale="Search for each company.",
+    steps=[
+        {"tool_call": {"type": "search", "query": f"company {index} revenue"}}
+        for index in range(DENSE_STEPS)
+    ],
+).model_dump_json()
+
+
+def split(output: str) -> list[str]:
+    return [output[i : i + CHUNK_SIZE] for i in range(0, len(output), CHUNK_SIZE)]
+
+
+def parse_everything(model, chunks: list[str]):
+    accumulated = ""
+    previous = None
+    results = 0
+    for chunk in chunks:
+        accumulated += chunk
+        parsed = _parse_output(accumulated, model)
+        if parsed is not None and parsed != previous:
+            previous = parsed
+            results += 1
+    return results
+
+
+def parse_incrementally(model, chunks: list[str]):
+    parser = PartialOutputParser(model)
+    results = 0
+    for chunk in chunks:
+        if parser.feed(chunk) is not None:
+            results += 1
+    parser.result()
+    return results
+
+
+def measure(name: str, parse, model, chunks: list[str]):
+    start = time.perf_counter()
+    results = parse(model, chunks)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>20}: {elapsed * 1000:9.1f} ms, {results} partial plans")
+
+
+def main():
+    for name, model, output in [
+        ("detailed plan", detailed_plan_class, detailed_output),
+        ("dense plan", plan_class, dense_output),
+    ]:
+        chunks = split(output)
+        print(f"{name}: {count_tokens(output)} tokens in {len(chunks)} chunks")
+        measure("parse everything", parse_everything, model, chunks)
+        measure("incremental parser", parse_incrementally, model, chunks)
+
+
+if __name__ == "__main__":
+    main()
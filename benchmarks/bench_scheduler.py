@@ -0,0 +1,99 @@
+"""
+Compares the latency of executing a 50-step dependency chain with the event-driven
+`StepScheduler` against the previous implementation, which polled every 100 ms until the
+dependencies of a step were ready.
+
+Run with: `poetry run python benchmarks/bench_scheduler.py`
+"""
+
+import asyncio
+import time
+
+from autoplan.models import Step
+from autoplan.results import StepResult
+from autoplan.scheduler import StepScheduler
+from autoplan.tool import PriorToolResult, tool
+
+CHAIN_LENGTH = 50
+
+# simulated I/O latency of each tool call
+TOOL_LATENCY = 0.005
+
+
+@tool(can_use_prior_results=True)
+async def append(text: str) -> str:
+    await asyncio.sleep(TOOL_LATENCY)
+    return text + "a"
+
+
+def build_chain() -> list[Step]:
+    steps = [Step(tool_call=append(text=""))]
+    for index in range(1, CHAIN_LENGTH):
+        steps.append(
+            Step(
+                tool_call=append(
+                    text=PriorToolResult(step_index_zero_indexed=index - 1)
+                )
+            )
+        )
+    return steps
+
+
+async def run_polling(steps: list[Step]) -> list[StepResult]:
+    # the implementation that StepScheduler replaced
+    results: dict[int, StepResult] = {}
+
+    def substitute(step: Step) -> Step | None:
+        args = {}
+        for key, arg in step.tool_call.__dict__.items():
+            if isinstance(arg, PriorToolResult):
+                if arg.step_index_zero_indexed not in results:
+                    return None
+                args[key] = results[arg.step_index_zero_indexed].result
+            else:
+                args[key] = arg
+        return step.model_copy(
+            update={"tool_call": step.tool_call.__class__.model_validate(args)}
+        )
+
+    async def execute(step: Step, index: int) -> StepResult:
+        while True:
+            if subbed_step := substitute(step):
+                result = StepResult(step=subbed_step, result=await subbed_step.tool_call())
+                results[index] = result
+                return result
+            await asyncio.sleep(0.1)
+
+    return list(
+        await asyncio.gather(*(execute(step, index) for index, step in enumerate(steps)))
+    )
+
+
+async def run_scheduler(steps: list[Step]) -> list[StepResult]:
+    async def execute(index: int, step: Step) -> StepResult:
+        return StepResult(step=step, result=await step.tool_call())
+
+    scheduler = StepScheduler(execute)
+    for index, step in enumerate(steps):
+        scheduler.add_step(index, step)
+    scheduler.close()
+    return await scheduler.wait()
+
+
+async def main():
+    steps = build_chain()
+
+    for name, run in [("polling", run_polling), ("scheduler", run_scheduler)]:
+        start = time.perf_counter()
+        results = await run(steps)
+        elapsed = time.perf_counter() - start
+
+        assert results[-1].result == "a" * CHAIN_LENGTH
+        print(
+            f"{name:>10}: {elapsed * 1000:8.1f} ms for a {CHAIN_LENGTH}-step chain "
+            f"({CHAIN_LENGTH * TOOL_LATENCY * 1000:.0f} ms of tool time)"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
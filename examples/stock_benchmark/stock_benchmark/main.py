@@ -3,7 +3,7 @@ from stock_benchmark.tools.calculate_statistics import calculate_statistics
 from stock_benchmark.tools.combine_ticker_data import combine_ticker_data
 from stock_benchmark.tools.download_ticker import download_ticker
 
-from autoplan import Plan, Step, with_planning
+from autoplan import Plan, Speculator, Step, render_step_results, with_planning
 
 
 class ApplicationStep(Step):
@@ -102,7 +102,9 @@ def combine_steps(
         If the data is empty, tell the user that you couldn't find any information about this query 
         in the stock market databases and you are only trained to answer questions about the stock performance in the markets.
         """,
-        str(steps),
+        render_step_results(
+            plan, steps, model=execution_context.combine_steps_llm_model
+        ),
     ]
 
 
@@ -112,6 +114,8 @@ def combine_steps(
     tools=tools,
     generate_plan_prompt_generator=generate_plan,
     combine_steps_prompt_generator=combine_steps,
+    # the S&P 500 is the baseline of most benchmarks, so it's downloaded while the plan is generated
+    speculator=Speculator(predict=lambda args: [download_ticker(ticker="^GSPC")]),
 )
 async def run(
     description: str,
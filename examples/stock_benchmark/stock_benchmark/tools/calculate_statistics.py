@@ -21,7 +21,8 @@ def sharpe_ratio(returns, N, rf=0):
     return mean / sigma
 
 
-@tool(can_use_prior_results=True)
+# pandas computations are CPU-bound, so they run in a pool of processes instead of blocking the event loop
+@tool(can_use_prior_results=True, executor="process")
 async def calculate_statistics(data: TickerData) -> Statistics:
     """
     Calculate key performance metrics for a ticker or combined ticker data.
@@ -1,6 +1,7 @@
 import yfinance as yf
 from pydantic import BaseModel
 
+from autoplan import InMemoryCache
 from autoplan.tool import tool
 
 
@@ -8,9 +9,22 @@ class TickerData(BaseModel):
     name: str
     closes: list[float]
 
+    def llm_view(self):
+        # the statistics steps use the closes, the final answer only needs an overview of them
+        return {
+            "name": self.name,
+            "months": len(self.closes),
+            "first_close": self.closes[0] if self.closes else None,
+            "last_close": self.closes[-1] if self.closes else None,
+        }
 
-@tool
-async def download_ticker(ticker: str) -> TickerData:
+
+# yfinance throttles clients that send too many requests at once,
+# and monthly data doesn't change much within an hour
+# (yfinance blocks, so the tool is synchronous and runs in the thread pool)
+# concurrent runs often download the same index, which is then only downloaded once
+@tool(max_concurrency=4, cache=InMemoryCache(), cache_ttl=3600, coalesce=True)
+def download_ticker(ticker: str) -> TickerData:
     """
     Given a ticker, download the data from yfinance for the past 5 years in monthly frequency.
     """
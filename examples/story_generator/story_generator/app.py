@@ -81,7 +81,7 @@ async def generate(
                 result = r.result
 
     # start the analysis in the background
-    asyncio.create_task(run_and_populate())
+    task = asyncio.create_task(run_and_populate())
 
     # how often to switch steps in the UI
     step_display_interval = 2
@@ -92,35 +92,40 @@ async def generate(
     # counter to determine if step switching should occur
     counter = 0
 
-    while True:
-        await asyncio.sleep(check_interval)
+    try:
+        while True:
+            await asyncio.sleep(check_interval)
 
-        if result:
-            summary = ""
+            if result:
+                summary = ""
 
-            for index, key in enumerate(list(result.__fields__.keys())):
-                if index > 0:
-                    summary += "\n\n"
+                for index, key in enumerate(list(result.__fields__.keys())):
+                    if index > 0:
+                        summary += "\n\n"
 
-                summary += getattr(result, key)
+                    summary += getattr(result, key)
 
-            yield result.display_title, summary
-            return
-        else:
-            if counter % (step_display_interval / check_interval) == 0:
-                # show an unseen step
-                if plan_steps_queue:
-                    step = plan_steps_queue.pop(0)
+                yield result.display_title, summary
+                return
+            else:
+                if counter % (step_display_interval / check_interval) == 0:
+                    # show an unseen step
+                    if plan_steps_queue:
+                        step = plan_steps_queue.pop(0)
 
-                    objective = step.objective
+                        objective = step.objective
 
-                    # add "ing" to the first word (e.g. "Find" -> "Finding")
-                    words = objective.split()
-                    words[0] = Inflect.present_participle(words[0])
+                        # add "ing" to the first word (e.g. "Find" -> "Finding")
+                        words = objective.split()
+                        words[0] = Inflect.present_participle(words[0])
 
-                    yield (" ".join(words), "")
+                        yield (" ".join(words), "")
 
-        counter += 1
+            counter += 1
+
+    finally:
+        # stop the run (planning, steps and combining) if the client disconnects
+        task.cancel()
 
 
 async def download(title_or_link: str) -> StatefulItem:
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, Field
 from story_generator.tools.you_search import you_search
 
-from autoplan import Plan, Step, with_planning
+from autoplan import Plan, Step, render_step_results, with_planning
 
 
 class CharacterPlanStep(Step):
@@ -36,7 +36,9 @@ def combine_steps(
 ) -> list[str]:
     return [
         "Produce a character name and description",
-        str(steps),
+        render_step_results(
+            plan, steps, model=execution_context.combine_steps_llm_model
+        ),
     ]
 
 
@@ -93,7 +95,9 @@ def combine_steps(
 ) -> list[str]:
     return [
         "How would you combine different story elements into a coherent and engaging narrative?",
-        str(steps),
+        render_step_results(
+            plan, steps, model=execution_context.combine_steps_llm_model
+        ),
     ]
 
 
@@ -2,10 +2,10 @@ import os
 from typing import Dict
 
 import httpx
-from litellm import acompletion
 from pydantic import BaseModel, Field
 
 from autoplan import tool, trace
+from autoplan.llm_utils.completion import acompletion
 
 # using a global client is better than making one for each request
 # see https://www.python-httpx.org/async/
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, Field
 from summarize_documents.tools.you_search import you_search
 
-from autoplan import Plan, Step, with_planning
+from autoplan import Plan, Step, render_step_results, with_planning
 
 
 class ApplicationStep(Step):
@@ -48,7 +48,9 @@ def combine_steps(
 ) -> list[str]:
     return [
         "Combine the individual summaries and context discussions into a cohesive final summary.",
-        str(steps),
+        render_step_results(
+            plan, steps, model=execution_context.combine_steps_llm_model
+        ),
         str(execution_context.application_args),
     ]
 
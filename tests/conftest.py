@@ -0,0 +1,29 @@
+import asyncio
+
+import pytest
+
+import autoplan.core
+
+
+@pytest.fixture
+def use_plan(monkeypatch):
+    """
+    Replace the LLM phases with a planner that returns the steps built by `build_steps(context)`
+    (after `planning_time` seconds) and a combiner that joins the step results.
+    """
+
+    def use(build_steps, planning_time: float = 0.0):
+        async def generate_plan(context, prompts, temperature, queue, *args):
+            await asyncio.sleep(planning_time)
+            plan = context.plan_class(rationale="", steps=build_steps(context))
+            queue.put_nowait(plan)
+            queue.close()
+            return plan
+
+        async def combine_steps(context, prompts, temperature, *args):
+            return context.output_model(answer=",".join(map(str, prompts)))
+
+        monkeypatch.setattr(autoplan.core, "generate_plan", generate_plan)
+        monkeypatch.setattr(autoplan.core, "combine_steps", combine_steps)
+
+    return use
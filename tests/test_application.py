@@ -0,0 +1,71 @@
+import pytest
+from pydantic import BaseModel
+
+import autoplan.core
+from autoplan import FinalResult, Plan, Step, tool, with_planning
+from autoplan.application import compile_model
+
+
+class Output(BaseModel):
+    answer: str
+
+
+@tool
+async def echo(name: str) -> str:
+    return name
+
+
+def test_models_are_compiled_once():
+    compiled = compile_model(Output)
+
+    assert compile_model(Output) is compiled
+    assert compiled.response_format["json_schema"]["name"] == "Output"
+    assert compiled.adapter.validate_json('{"answer": "a"}') == Output(answer="a")
+    assert compiled.partial_model.model_validate({}).answer is None
+
+
+@pytest.mark.asyncio
+async def test_runs_share_the_compiled_plan_class(monkeypatch):
+    plan_classes = []
+
+    async def generate_plan(context, prompts, temperature, queue, *args):
+        plan_classes.append(context.plan_class)
+        plan = context.plan_class(rationale="", steps=[])
+        queue.put_nowait(plan)
+        queue.close()
+        return plan
+
+    async def combine_steps(context, prompts, temperature, *args):
+        return context.output_model(answer="")
+
+    monkeypatch.setattr(autoplan.core, "generate_plan", generate_plan)
+    monkeypatch.setattr(autoplan.core, "combine_steps", combine_steps)
+
+    @with_planning(
+        step_class=Step,
+        plan_class=Plan,
+        tools=[echo],
+        generate_plan_prompt_generator=lambda context, args: [""],
+        combine_steps_prompt_generator=lambda context, plan, results: [],
+    )
+    async def app(query: str) -> Output:
+        pass
+
+    for _ in range(2):
+        assert [r async for r in app("query") if isinstance(r, FinalResult)]
+
+    assert plan_classes[0] is plan_classes[1]
+
+
+def test_applications_must_declare_their_output():
+    with pytest.raises(ValueError, match="output"):
+
+        @with_planning(
+            step_class=Step,
+            plan_class=Plan,
+            tools=[echo],
+            generate_plan_prompt_generator=lambda context, args: [""],
+            combine_steps_prompt_generator=lambda context, plan, results: [],
+        )
+        async def app(query: str):
+            pass
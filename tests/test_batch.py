@@ -0,0 +1,110 @@
+import asyncio
+import json
+
+import pytest
+from click.testing import CliRunner
+from pydantic import BaseModel
+
+from autoplan import Plan, Step, run_many, tool, with_planning
+from autoplan.cli import cli
+
+
+class Output(BaseModel):
+    answer: str
+
+
+calls = {"running": 0, "peak": 0}
+
+
+@tool
+async def echo(name: str) -> str:
+    calls["running"] += 1
+    calls["peak"] = max(calls["peak"], calls["running"])
+    await asyncio.sleep(0.01)
+    calls["running"] -= 1
+
+    if name == "fail":
+        raise RuntimeError("boom")
+    return name
+
+
+def _combine_prompt(context, plan, results):
+    if results == [None]:
+        raise ValueError("no results")
+    return results
+
+
+@with_planning(
+    step_class=Step,
+    plan_class=Plan,
+    tools=[echo],
+    generate_plan_prompt_generator=lambda context, args: [args["query"]],
+    combine_steps_prompt_generator=_combine_prompt,
+)
+async def app(query: str) -> Output:
+    pass
+
+
+@pytest.fixture(autouse=True)
+def planned_echo(use_plan):
+    use_plan(
+        lambda context: [
+            {"tool_call": {"type": "echo", "name": context.application_args["query"]}}
+        ]
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_many_limits_the_runs_in_progress():
+    calls["peak"] = 0
+    inputs = ({"query": str(index)} for index in range(10))
+
+    results = [r async for r in run_many(app, inputs, concurrency=3)]
+
+    assert calls["peak"] == 3
+    assert sorted(r.index for r in results) == list(range(10))
+    assert all(r.result.answer == r.input["query"] for r in results)
+
+
+@pytest.mark.asyncio
+async def test_run_many_reports_failed_runs():
+    inputs = [{"query": "a"}, {"query": "fail"}]
+    results = sorted([r async for r in run_many(app, inputs)], key=lambda r: r.index)
+
+    assert results[0].result.answer == "a"
+    assert results[1].result is None
+    assert results[1].error == "ValueError: no results"
+
+
+def test_run_command_streams_jsonl():
+    inputs = "\n".join(json.dumps({"query": q}) for q in "abc") + "\n"
+
+    output = CliRunner().invoke(
+        cli, ["run", "tests.test_batch:app", "--concurrency", "2"], input=inputs
+    )
+
+    assert output.exit_code == 0, output.output
+    results = [json.loads(line) for line in output.stdout.splitlines()]
+    assert sorted(r["result"]["answer"] for r in results) == ["a", "b", "c"]
+    assert "3 completed, 0 failed" in output.stderr
+
+
+def test_malformed_inputs_fail_their_runs_only():
+    inputs = '{"query": "a"}\n{"query": \n["b"]\n{"query": "c"}\n'
+
+    output = CliRunner().invoke(cli, ["run", "tests.test_batch:app"], input=inputs)
+
+    assert output.exit_code == 0, output.output
+    results = sorted(
+        (json.loads(line) for line in output.stdout.splitlines()),
+        key=lambda r: r["index"],
+    )
+    assert [r["result"] and r["result"]["answer"] for r in results] == [
+        "a",
+        None,
+        None,
+        "c",
+    ]
+    assert results[1]["error"].startswith("JSONDecodeError")
+    assert results[2]["error"].startswith("TypeError")
+    assert "4 completed, 2 failed" in output.stderr
@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+from autoplan import InMemoryCache, SqliteCache
+from autoplan.cache import make_cache_key
+
+
+def test_make_cache_key_is_stable():
+    assert make_cache_key({"a": 1, "b": [1, 2]}) == make_cache_key({"b": [1, 2], "a": 1})
+    assert make_cache_key("a") != make_cache_key("b")
+
+
+def test_in_memory_cache_evicts_least_recently_used():
+    cache = InMemoryCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_in_memory_cache_expires_values():
+    cache = InMemoryCache(ttl=0.01)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=60)
+
+    time.sleep(0.02)
+
+    assert cache.get("a", "missing") == "missing"
+    assert cache.get("b") == 2
+
+
+@pytest.mark.parametrize("max_size", [None, 2])
+def test_sqlite_cache_is_shared_between_instances(tmp_path, max_size):
+    path = str(tmp_path / "cache.db")
+    SqliteCache(path, max_size=max_size).set("a", {"value": [1, 2]})
+
+    cache = SqliteCache(path, max_size=max_size)
+    assert cache.get("a") == {"value": [1, 2]}
+    assert cache.get("b") is None
+
+
+def test_sqlite_cache_evicts_and_expires(tmp_path):
+    cache = SqliteCache(str(tmp_path / "cache.db"), max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("c", 3)
+    cache.set("d", 4, ttl=-1)
+
+    assert cache.get("a") is None
+    assert cache.get("c") == 3
+    assert cache.get("d") is None
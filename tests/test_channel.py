@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from autoplan.channel import ResultChannel
+from autoplan.models import Plan
+from autoplan.results import FinalResult, PartialPlanResult
+
+
+def _partial(rationale: str) -> PartialPlanResult:
+    return PartialPlanResult(result=Plan(rationale=rationale, steps=[]))
+
+
+@pytest.mark.asyncio
+async def test_partial_plans_coalesce_to_the_latest():
+    channel = ResultChannel(max_size=2)
+
+    for rationale in "abc":
+        channel.put_nowait(_partial(rationale))
+    channel.put_nowait("step")
+    channel.put_nowait(_partial("d"))
+    channel.close()
+
+    items = [item async for item in channel]
+
+    # only the latest snapshot is kept, and the other items are never dropped
+    assert items == ["step", _partial("d")]
+
+
+@pytest.mark.asyncio
+async def test_put_waits_for_the_consumer():
+    channel = ResultChannel(max_size=2)
+
+    await channel.put("a")
+    await channel.put("b")
+
+    # snapshots never wait
+    await asyncio.wait_for(channel.put(_partial("a")), timeout=1)
+    with pytest.raises(asyncio.QueueFull):
+        channel.put_nowait("c")
+
+    put = asyncio.create_task(channel.put(FinalResult(result=_partial("a"))))
+    await asyncio.sleep(0.01)
+    assert not put.done()
+
+    assert await channel.get() == "a"
+    await asyncio.wait_for(put, timeout=1)
+    assert len(channel) == 3
+
+
+@pytest.mark.asyncio
+async def test_close_raises_the_error_after_the_remaining_items():
+    channel = ResultChannel()
+    channel.put_nowait("a")
+    channel.close(ValueError("boom"))
+    # only the first close counts
+    channel.close()
+
+    assert await channel.get() == "a"
+    with pytest.raises(ValueError, match="boom"):
+        await channel.get()
+
+    with pytest.raises(RuntimeError):
+        channel.put_nowait("b")
@@ -0,0 +1,52 @@
+import pytest
+from pydantic import BaseModel
+
+from autoplan import Plan
+from autoplan.execution_context import ExecutionContext
+from autoplan.phases.combine_steps import combine_steps
+from tests.test_generate_plan import _stream_response
+
+
+class Output(BaseModel):
+    title: str
+    summary: str
+
+
+@pytest.mark.asyncio
+async def test_combine_steps_streams_partial_results(monkeypatch):
+    output = Output(title="Nvidia", summary="It went up a lot.")
+    _stream_response(monkeypatch, output.model_dump_json(), chunk_size=4)
+
+    context = ExecutionContext(
+        plan_class=Plan,
+        tools=[],
+        output_model=Output,
+        # report every partial result, however fast they are streamed
+        combine_steps_llm_args={"partial_interval": 0},
+    )
+    partial_results = []
+
+    result = await combine_steps(context, ["prompt"], 0.0, partial_results.append)
+
+    assert result == output
+    assert type(result) is Output
+    # the summary grows as it is generated, and the complete result isn't reported as partial
+    summaries = [r.summary for r in partial_results if r.summary is not None]
+    assert len(summaries) > 1
+    assert summaries == sorted(summaries, key=len)
+    assert all(type(r) is not Output for r in partial_results)
+
+
+@pytest.mark.asyncio
+async def test_combine_steps_throttles_partial_results(monkeypatch):
+    output = Output(title="Nvidia", summary="It went up a lot." * 20)
+    _stream_response(monkeypatch, output.model_dump_json(), chunk_size=4)
+
+    context = ExecutionContext(plan_class=Plan, tools=[], output_model=Output)
+    partial_results = []
+
+    result = await combine_steps(context, ["prompt"], 0.0, partial_results.append)
+
+    assert result == output
+    # the whole result is streamed well within the default interval
+    assert len(partial_results) == 1
@@ -0,0 +1,128 @@
+import asyncio
+
+import litellm
+import pytest
+from litellm.types.utils import ModelResponse
+from pydantic import BaseModel
+
+import autoplan.llm_utils.stream_structured_completion
+from autoplan import InMemoryCache, set_llm_cache
+from autoplan.llm_utils.completion import acompletion
+from autoplan.llm_utils.stream_structured_completion import (
+    stream_structured_completion,
+)
+from tests.test_generate_plan import _chunk
+
+
+class Answer(BaseModel):
+    text: str
+
+
+calls = []
+
+
+@pytest.fixture(autouse=True)
+def fake_llm(monkeypatch):
+    calls.clear()
+
+    async def fake_acompletion(**kwargs):
+        calls.append(kwargs)
+
+        if not kwargs.get("stream"):
+            return ModelResponse(
+                choices=[{"message": {"role": "assistant", "content": "hello"}}]
+            )
+
+        async def chunks():
+            yield _chunk('{"text": "hel')
+            yield _chunk('lo"}')
+
+        return chunks()
+
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion)
+    monkeypatch.setattr(
+        autoplan.llm_utils.stream_structured_completion, "acompletion", fake_acompletion
+    )
+
+    set_llm_cache(InMemoryCache())
+    yield
+    set_llm_cache(None)
+
+
+async def _stream(**kwargs) -> list[BaseModel]:
+    return [
+        item
+        async for item in stream_structured_completion(
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": "hi"}],
+            response_format=Answer,
+            **kwargs,
+        )
+    ]
+
+
+@pytest.mark.asyncio
+async def test_streamed_responses_are_cached():
+    streamed = await _stream(temperature=0)
+    cached = await _stream(temperature=0)
+
+    assert len(calls) == 1
+    # the cached response is only the complete result
+    assert cached == [Answer(text="hello")] == streamed[-1:]
+
+    # other arguments are another call, and calls can opt out
+    await _stream(temperature=0.5)
+    await _stream(temperature=0, cache=False)
+    assert len(calls) == 3
+
+    # how partial instances are parsed doesn't change the response
+    await _stream(temperature=0, partial_interval=0.05, partial_strings=True)
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_completions_are_cached():
+    messages = [{"role": "user", "content": "hi"}]
+
+    first = await acompletion(model="gpt-4o-mini", messages=messages)
+    second = await acompletion(model="gpt-4o-mini", messages=messages)
+
+    assert len(calls) == 1
+    assert second.choices[0].message.content == "hello"
+    assert second.id == first.id
+
+    await acompletion(model="gpt-4o-mini", messages=messages, cache=False)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_completions_are_cached_by_response_schema():
+    messages = [{"role": "user", "content": "hi"}]
+
+    def answer_class(field_type: type) -> type[BaseModel]:
+        # the same name, with another schema
+        class Answer(BaseModel):
+            text: field_type  # pyright: ignore[reportInvalidTypeForm]
+
+        return Answer
+
+    for response_format in [answer_class(str), answer_class(str), answer_class(int)]:
+        await acompletion(
+            model="gpt-4o-mini", messages=messages, response_format=response_format
+        )
+
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_deterministic_calls_share_a_stream():
+    set_llm_cache(None)
+
+    streams = await asyncio.gather(*(_stream(temperature=0) for _ in range(5)))
+
+    assert len(calls) == 1
+    assert all(stream == streams[0] for stream in streams)
+
+    # calls that aren't deterministic get their own response
+    await asyncio.gather(*(_stream(temperature=1) for _ in range(2)))
+    assert len(calls) == 3
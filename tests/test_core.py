@@ -0,0 +1,468 @@
+import asyncio
+import json
+
+import pytest
+from pydantic import BaseModel
+
+import autoplan.core
+from autoplan import (
+    FailurePolicy,
+    FinalResult,
+    InMemoryCache,
+    PartialFinalResult,
+    Plan,
+    PlanResult,
+    Step,
+    StepFailedError,
+    StepResult,
+    set_global_concurrency_limit,
+    tool,
+    with_planning,
+)
+from autoplan.models import create_plan_class
+from autoplan.tool import PriorToolResult
+
+
+class Output(BaseModel):
+    answer: str
+
+
+def _app(tools, **kwargs):
+    @with_planning(
+        step_class=Step,
+        plan_class=Plan,
+        tools=tools,
+        generate_plan_prompt_generator=lambda context, args: [""],
+        combine_steps_prompt_generator=lambda context, plan, results: results,
+        **kwargs,
+    )
+    async def app(query: str) -> Output:
+        pass
+
+    return app
+
+
+async def _final(app, *args) -> Output:
+    async for r in app(*args):
+        if isinstance(r, FinalResult):
+            return r.result
+    raise AssertionError("no final result")
+
+
+def _tracked():
+    """
+    A tool that records the peak number of concurrent calls.
+    """
+    state = {"running": 0, "peak": 0}
+
+    async def track(name: str) -> str:
+        state["running"] += 1
+        state["peak"] = max(state["peak"], state["running"])
+        await asyncio.sleep(0.01)
+        state["running"] -= 1
+        return name
+
+    return track, state
+
+
+@pytest.mark.asyncio
+async def test_steps_are_combined_in_order(use_plan):
+    @tool
+    async def echo(name: str) -> str:
+        return name
+
+    use_plan(
+        lambda context: [{"tool_call": {"type": "echo", "name": n}} for n in "abc"],
+    )
+
+    result = await _final(_app([echo]), "query")
+
+    assert result.answer == "a,b,c"
+
+
+@pytest.mark.asyncio
+async def test_tool_max_concurrency(use_plan):
+    track, state = _tracked()
+    tracked = tool(max_concurrency=2)(track)
+
+    use_plan(
+        lambda context: [
+            {"tool_call": {"type": "track", "name": str(i)}} for i in range(10)
+        ],
+    )
+
+    steps = [r async for r in _app([tracked])("query") if isinstance(r, StepResult)]
+
+    assert len(steps) == 10
+    assert state["peak"] == 2
+
+
+@pytest.mark.asyncio
+async def test_run_max_concurrency(use_plan):
+    track, state = _tracked()
+
+    use_plan(
+        lambda context: [
+            {"tool_call": {"type": "track", "name": str(i)}} for i in range(10)
+        ],
+    )
+
+    await _final(_app([tool(track)], max_concurrency=3), "query")
+
+    assert state["peak"] == 3
+
+
+@pytest.mark.asyncio
+async def test_global_concurrency_limit_is_shared_between_runs(use_plan):
+    track, state = _tracked()
+    app = _app([tool(track)])
+
+    use_plan(
+        lambda context: [
+            {"tool_call": {"type": "track", "name": str(i)}} for i in range(5)
+        ],
+    )
+
+    set_global_concurrency_limit(4)
+    try:
+        await asyncio.gather(*(_final(app, str(i)) for i in range(3)))
+    finally:
+        set_global_concurrency_limit(None)
+
+    assert state["peak"] == 4
+
+
+@pytest.mark.asyncio
+async def test_pipelined_steps_start_before_planning_finishes(monkeypatch, use_plan):
+    step_started = asyncio.Event()
+    calls = []
+
+    @tool
+    async def echo(name: str) -> str:
+        calls.append(name)
+        step_started.set()
+        return name
+
+    async def generate_plan(context, prompts, temperature, queue, *args):
+        steps = [{"tool_call": {"type": "echo", "name": n}} for n in "ab"]
+        queue.put_nowait(context.plan_class(rationale="", steps=steps[:1]))
+        queue.put_nowait(context.plan_class(rationale="", steps=steps))
+
+        # the first step is complete once the second one appears, so it runs while the plan is generated
+        await asyncio.wait_for(step_started.wait(), timeout=1)
+
+        plan = context.plan_class(rationale="", steps=steps)
+        queue.put_nowait(plan)
+        queue.close()
+        return plan
+
+    use_plan(lambda context: [])
+    monkeypatch.setattr(autoplan.core, "generate_plan", generate_plan)
+
+    result = await _final(_app([echo], pipelined=True), "query")
+
+    assert result.answer == "a,b"
+    # every step is dispatched exactly once
+    assert sorted(calls) == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_cache_hits_are_reported_in_step_results(use_plan):
+    @tool(cache=InMemoryCache())
+    async def echo(name: str) -> str:
+        return name
+
+    use_plan(
+        lambda context: [{"tool_call": {"type": "echo", "name": "a"}}],
+    )
+    app = _app([echo])
+
+    for expected in [False, True]:
+        steps = [r async for r in app("query") if isinstance(r, StepResult)]
+        assert [s.cache_hit for s in steps] == [expected]
+
+
+@pytest.mark.asyncio
+async def test_duplicate_steps_are_reported_once_per_step(use_plan):
+    calls = []
+
+    @tool
+    async def echo(name: str) -> str:
+        calls.append(name)
+        return name
+
+    use_plan(
+        lambda context: [{"tool_call": {"type": "echo", "name": n}} for n in "aba"],
+    )
+
+    results = [r async for r in _app([echo])("query")]
+    steps = [r for r in results if isinstance(r, StepResult)]
+
+    assert sorted(calls) == ["a", "b"]
+    assert sorted(s.result for s in steps) == ["a", "a", "b"]
+    assert results[-1].result.answer == "a,b,a"
+
+
+@pytest.mark.asyncio
+async def test_step_timeout(use_plan):
+    @tool
+    async def slow(name: str) -> str:
+        await asyncio.sleep(10)
+        return name
+
+    @tool(timeout=1)
+    async def fast(name: str) -> str:
+        return name
+
+    use_plan(
+        lambda context: [
+            {"tool_call": {"type": "slow", "name": "a"}},
+            {"tool_call": {"type": "fast", "name": "b"}},
+        ],
+    )
+
+    results = [r async for r in _app([slow, fast], step_timeout=0.01)("query")]
+    steps = sorted(
+        (r for r in results if isinstance(r, StepResult)),
+        key=lambda r: r.step.tool_call.name,
+    )
+
+    assert [s.status for s in steps] == ["failed", "succeeded"]
+    assert steps[0].error == "Timed out after 0.01 seconds"
+    assert results[-1].result.answer == "None,b"
+
+
+@pytest.mark.asyncio
+async def test_closing_the_run_cancels_running_steps(use_plan):
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    @tool
+    async def hang(name: str) -> str:
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return name
+
+    use_plan(
+        lambda context: [{"tool_call": {"type": "hang", "name": "a"}}],
+    )
+
+    run = _app([hang])("query")
+    async for r in run:
+        if isinstance(r, PlanResult):
+            await started.wait()
+            break
+    await run.aclose()
+
+    assert cancelled.is_set()
+
+
+@pytest.mark.asyncio
+async def test_execution_errors_are_raised_to_the_consumer(monkeypatch, use_plan):
+    @tool
+    async def fail(name: str) -> str:
+        raise RuntimeError("boom")
+
+    use_plan(
+        lambda context: [{"tool_call": {"type": "fail", "name": "a"}}],
+    )
+
+    with pytest.raises(StepFailedError):
+        await _final(_app([fail], failure_policy=FailurePolicy.FAIL_FAST), "query")
+
+    async def generate_plan(*args):
+        raise RuntimeError("planner failed")
+
+    monkeypatch.setattr(autoplan.core, "generate_plan", generate_plan)
+
+    with pytest.raises(RuntimeError, match="planner failed"):
+        await _final(_app([fail]), "query")
+
+
+@pytest.mark.asyncio
+async def test_slow_consumer_holds_back_the_run(use_plan):
+    @tool
+    async def echo(name: str) -> str:
+        return name
+
+    use_plan(
+        lambda context: [{"tool_call": {"type": "echo", "name": n}} for n in "abcd"],
+    )
+
+    results = []
+    async for r in _app([echo], result_buffer_size=1)("query"):
+        results.append(r)
+        await asyncio.sleep(0.02)
+
+    # no result is dropped, however slow the consumer is
+    steps = [r for r in results if isinstance(r, StepResult)]
+    assert sorted(s.result for s in steps) == ["a", "b", "c", "d"]
+    assert results[-1].result.answer == "a,b,c,d"
+
+
+@pytest.mark.asyncio
+async def test_failed_steps_are_replanned(monkeypatch, use_plan):
+    calls = []
+
+    @tool(can_use_prior_results=True)
+    async def echo(name: str) -> str:
+        calls.append(name)
+        if name == "fail":
+            raise RuntimeError("boom")
+        return name
+
+    prompts_seen = []
+
+    async def generate_plan(context, prompts, temperature, queue, *args):
+        prompts_seen.append(prompts)
+        if len(prompts) == 1:
+            steps = [
+                {"tool_call": {"type": "echo", "name": "a"}},
+                {"tool_call": {"type": "echo", "name": "fail"}},
+                {
+                    "tool_call": {
+                        "type": "echo",
+                        "name": {"step_index_zero_indexed": 1},
+                    }
+                },
+            ]
+        else:
+            # the replacement uses the result of step 0, and of the first new step (3)
+            steps = [
+                {"tool_call": {"type": "echo", "name": "b"}},
+                {
+                    "tool_call": {
+                        "type": "echo",
+                        "name": {"step_index_zero_indexed": 3},
+                    }
+                },
+            ]
+        plan = context.plan_class(rationale="", steps=steps)
+        queue.put_nowait(plan)
+        queue.close()
+        return plan
+
+    use_plan(lambda context: [])
+    monkeypatch.setattr(autoplan.core, "generate_plan", generate_plan)
+
+    results = [r async for r in _app([echo], max_replans=2)("query")]
+
+    # the completed step isn't executed again, and the replacement isn't replanned
+    assert calls.count("a") == 1
+    assert len(prompts_seen) == 2
+    assert "replacing steps [1, 2]" in prompts_seen[1][1]
+    assert "Step 1 (failed): " in prompts_seen[1][1]
+
+    plans = [r.result for r in results if isinstance(r, PlanResult)]
+    assert [len(p.steps) for p in plans] == [3, 5]
+    assert results[-1].result.answer == "a,None,None,b,b"
+
+
+@pytest.mark.asyncio
+async def test_partial_final_results_are_streamed(monkeypatch, use_plan):
+    @tool
+    async def echo(name: str) -> str:
+        return name
+
+    use_plan(lambda context: [])
+
+    async def combine_steps(context, prompts, temperature, report_partial_result):
+        report_partial_result(context.output_model.model_construct(answer="pa"))
+        return context.output_model(answer="partial")
+
+    monkeypatch.setattr(autoplan.core, "combine_steps", combine_steps)
+
+    results = [r async for r in _app([echo])("query")]
+
+    assert isinstance(results[-2], PartialFinalResult)
+    assert results[-2].result.answer == "pa"
+    assert results[-1].result.answer == "partial"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "max_tokens, expected",
+    [(0, "((0,1,2,3),(4,5,6))"), (None, "0,1,2,3,4,5,6")],
+)
+async def test_large_plans_are_combined_hierarchically(
+    monkeypatch, use_plan, max_tokens, expected
+):
+    @tool
+    async def echo(name: str) -> str:
+        return name
+
+    use_plan(
+        lambda context: [
+            {"tool_call": {"type": "echo", "name": str(n)}} for n in range(7)
+        ],
+    )
+    prompts_seen = []
+
+    async def combine_steps(context, prompts, temperature, *args):
+        prompts_seen.append(prompts)
+        lines = prompts[-1].splitlines()
+        if any(line.startswith("- Part") for line in lines):
+            # a reduction, joining the answers of the parts
+            answers = [
+                json.loads(line.split(": ", 1)[1])["answer"]
+                for line in lines
+                if line.startswith("- Part")
+            ]
+            return context.output_model(answer=f"({','.join(answers)})")
+        return context.output_model(answer=",".join(prompts[1:]))
+
+    monkeypatch.setattr(autoplan.core, "combine_steps", combine_steps)
+
+    @with_planning(
+        step_class=Step,
+        plan_class=Plan,
+        tools=[echo],
+        generate_plan_prompt_generator=lambda context, args: [""],
+        combine_steps_prompt_generator=lambda context, plan, results: [
+            "instructions",
+            *results,
+        ],
+        combine_steps_fan_in=2,
+        combine_steps_max_tokens=max_tokens,
+    )
+    async def app(query: str) -> Output:
+        pass
+
+    result = await _final(app, "query")
+
+    assert result.answer == expected
+    assert all(prompts[0] == "instructions" for prompts in prompts_seen)
+    # 4 groups of steps, 2 reductions of 2 groups and the final one
+    assert len(prompts_seen) == (7 if max_tokens is not None else 1)
+
+
+def test_groups_of_steps_keep_the_steps_they_use():
+    @tool(can_use_prior_results=True)
+    async def echo(name: str) -> str:
+        return name
+
+    plan_class = create_plan_class(Step, Plan, [echo])
+    plan = plan_class(
+        rationale="",
+        steps=[
+            {"tool_call": {"type": "echo", "name": "a"}},
+            {"tool_call": {"type": "echo", "name": "b"}},
+            {"tool_call": {"type": "echo", "name": {"step_index_zero_indexed": 0}}},
+            {"tool_call": {"type": "echo", "name": {"step_index_zero_indexed": 2}}},
+        ],
+    )
+
+    group_plan, indices = autoplan.core._sub_plan(plan, [3])
+
+    assert indices == [0, 2, 3]
+    assert [step.tool_call.name for step in group_plan.steps] == [
+        "a",
+        PriorToolResult(step_index_zero_indexed=0),
+        PriorToolResult(step_index_zero_indexed=1),
+    ]
+    # the plan itself is unchanged
+    assert plan.steps[3].tool_call.name == PriorToolResult(step_index_zero_indexed=2)
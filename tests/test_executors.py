@@ -0,0 +1,128 @@
+import asyncio
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import autoplan.executors
+from autoplan.executors import (
+    SHARED_MEMORY_THRESHOLD,
+    _dump_arguments,
+    _release,
+    get_executor_metrics,
+    offload,
+)
+from autoplan.tool import tool
+
+
+class Blob:
+    """
+    Pickled with an out-of-band buffer, like a NumPy array.
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+    def __reduce_ex__(self, protocol):
+        return Blob, (pickle.PickleBuffer(self.data),)
+
+
+@tool(executor="process")
+async def process_id() -> int:
+    return os.getpid()
+
+
+async def blob_sum(blob: Blob) -> int:
+    return sum(blob.data[:10]) + len(blob.data)
+
+
+blob_sum_in_process = offload(blob_sum, "process")
+
+
+@tool(executor="thread")
+async def blocking_sleep(seconds: float) -> float:
+    time.sleep(seconds)
+    return seconds
+
+
+@pytest.mark.asyncio
+async def test_process_tools_run_in_another_process():
+    assert await process_id()() != os.getpid()
+
+
+@pytest.mark.asyncio
+async def test_large_buffers_are_passed_through_shared_memory():
+    data = bytearray(range(10)) * (SHARED_MEMORY_THRESHOLD // 10 + 1)
+
+    _, segments = _dump_arguments({"blob": Blob(data)})
+    assert len(segments) == 1
+    _release(segments)
+
+    _, segments = _dump_arguments({"blob": Blob(bytearray(10))})
+    assert segments == []
+
+    assert await blob_sum_in_process(blob=Blob(data)) == 45 + len(data)
+
+
+@pytest.mark.asyncio
+async def test_thread_tools_dont_block_the_event_loop():
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker = asyncio.create_task(tick())
+    assert await blocking_sleep(seconds=0.2)() == 0.2
+    ticker.cancel()
+
+    assert ticks >= 5
+
+
+def test_process_tools_must_be_importable():
+    async def local(name: str) -> str:
+        return name
+
+    with pytest.raises(ValueError, match="top level"):
+        tool(local, executor="process")
+
+
+@pytest.mark.asyncio
+async def test_synchronous_tools_run_in_threads():
+    @tool
+    def thread_id() -> int:
+        return threading.get_ident()
+
+    assert await thread_id()() != threading.get_ident()
+
+
+@pytest.mark.asyncio
+async def test_thread_pool_metrics(monkeypatch):
+    monkeypatch.setitem(
+        autoplan.executors._executors, "thread", ThreadPoolExecutor(max_workers=2)
+    )
+    release = threading.Event()
+
+    @tool
+    def wait() -> bool:
+        return release.wait(timeout=1)
+
+    completed = get_executor_metrics("thread").completed
+    calls = [asyncio.create_task(wait()()) for _ in range(5)]
+    await asyncio.sleep(0.05)
+
+    metrics = get_executor_metrics("thread")
+    assert (metrics.max_workers, metrics.running, metrics.queued) == (2, 2, 3)
+    assert metrics.utilization == 1.0
+
+    release.set()
+    assert await asyncio.gather(*calls) == [True] * 5
+
+    metrics = get_executor_metrics("thread")
+    assert (metrics.running, metrics.queued) == (0, 0)
+    assert metrics.completed == completed + 5
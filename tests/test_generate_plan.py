@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+
+import pytest
+
+import autoplan.llm_utils.stream_structured_completion
+from autoplan import InMemoryCache, Plan, Step, tool
+from autoplan.channel import ResultChannel
+from autoplan.execution_context import ExecutionContext
+from autoplan.models import create_plan_class
+from autoplan.phases.generate_plan import generate_plan
+
+
+@tool
+async def echo(name: str) -> str:
+    return name
+
+
+def _chunk(content: str):
+    delta = SimpleNamespace(content=content, tool_calls=None)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+def _stream_response(monkeypatch, output: str, chunk_size: int):
+    async def acompletion(**kwargs):
+        assert kwargs["stream"] is True
+
+        async def chunks():
+            for i in range(0, len(output), chunk_size):
+                yield _chunk(output[i : i + chunk_size])
+
+        return chunks()
+
+    monkeypatch.setattr(
+        autoplan.llm_utils.stream_structured_completion, "acompletion", acompletion
+    )
+
+
+@pytest.mark.asyncio
+async def test_generate_plan_streams_partial_plans(monkeypatch):
+    plan_class = create_plan_class(Step, Plan, [echo])
+    output = plan_class(
+        rationale="because",
+        steps=[{"tool_call": {"type": "echo", "name": n}} for n in "abc"],
+    ).model_dump_json()
+
+    _stream_response(monkeypatch, output, chunk_size=5)
+
+    context = ExecutionContext(
+        plan_class=plan_class,
+        tools=[echo],
+        output_model=Plan,
+        # report every partial plan, however fast they are streamed
+        generate_plan_llm_args={"partial_interval": 0},
+    )
+    # keep every partial plan instead of coalescing them
+    queue = ResultChannel(max_size=1000, is_snapshot=lambda _: False)
+
+    plan = await generate_plan(context, ["prompt"], 0.0, queue)
+
+    items = [item async for item in queue]
+
+    # partial plans grow one step at a time, and the last item is the complete plan
+    step_counts = [len(item.steps or []) for item in items]
+    assert step_counts == sorted(step_counts)
+    assert {0, 1, 2, 3} <= set(step_counts)
+    assert items[-1] == plan
+    assert isinstance(plan, plan_class)
+    assert [step.tool_call.name for step in plan.steps] == ["a", "b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_generate_plan_uses_cache(monkeypatch):
+    plan_class = create_plan_class(Step, Plan, [echo])
+    output = plan_class(
+        rationale="because", steps=[{"tool_call": {"type": "echo", "name": "a"}}]
+    ).model_dump_json()
+
+    _stream_response(monkeypatch, output, chunk_size=5)
+
+    context = ExecutionContext(plan_class=plan_class, tools=[echo], output_model=Plan)
+    cache = InMemoryCache()
+
+    plan = await generate_plan(context, ["prompt"], 0.0, ResultChannel(), cache)
+
+    # the LLM isn't called again for the same prompts
+    _stream_response(monkeypatch, "", chunk_size=5)
+    queue = ResultChannel()
+    cached_plan = await generate_plan(context, ["prompt"], 0.0, queue, cache)
+
+    assert cached_plan == plan
+    assert [item async for item in queue] == [plan]
+
+    # a different prompt is a cache miss
+    with pytest.raises(Exception):
+        await generate_plan(context, ["other prompt"], 0.0, ResultChannel(), cache)
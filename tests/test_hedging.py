@@ -0,0 +1,187 @@
+import asyncio
+
+import pytest
+from pydantic import BaseModel
+
+import autoplan.llm_utils.stream_structured_completion
+from autoplan import HedgingPolicy, set_hedging_policy
+from autoplan.llm_utils.hedging import hedged_call
+from autoplan.llm_utils.stream_structured_completion import (
+    stream_structured_completion,
+)
+from tests.test_generate_plan import _chunk
+
+
+class Answer(BaseModel):
+    text: str
+
+
+def _policy(**kwargs) -> HedgingPolicy:
+    policy = HedgingPolicy(min_delay=0, min_samples=10, **kwargs)
+    for _ in range(10):
+        policy.record("gpt", 0.01)
+        policy.record("gpt", 0.01, streamed=True)
+        policy.start_call()
+    return policy
+
+
+@pytest.fixture(autouse=True)
+def hedging_policy():
+    yield
+    set_hedging_policy(None)
+
+
+def test_hedge_delay_is_the_quantile_of_recent_latencies():
+    policy = HedgingPolicy(quantile=0.9, min_delay=0.5, min_samples=10, window=100)
+
+    for latency in range(1, 10):
+        policy.record("gpt", latency)
+    # not enough calls were observed yet
+    assert policy.hedge_delay("gpt") is None
+
+    for latency in range(10, 201):
+        policy.record("gpt", latency)
+    # only the last 100 calls (101 to 200 seconds) count
+    assert policy.hedge_delay("gpt") == 190
+
+    for _ in range(100):
+        policy.record("gpt", 0.01)
+    assert policy.hedge_delay("gpt") == 0.5
+
+
+def test_streamed_calls_are_timed_separately():
+    policy = HedgingPolicy(min_delay=0, min_samples=10)
+
+    for _ in range(10):
+        # the first token of a streamed call comes well before the whole response of a call
+        policy.record("gpt", 0.5, streamed=True)
+        policy.record("gpt", 20)
+
+    assert policy.hedge_delay("gpt", streamed=True) == 0.5
+    assert policy.hedge_delay("gpt") == 20
+
+
+@pytest.mark.asyncio
+async def test_slow_calls_are_hedged_and_cancelled():
+    set_hedging_policy(_policy(alternate_models={"gpt": "azure/gpt"}))
+    calls = []
+    cancelled = []
+
+    async def call(model: str) -> str:
+        calls.append(model)
+        if model == "gpt":
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(model)
+                raise
+        return model
+
+    assert await hedged_call("gpt", call) == "azure/gpt"
+    await asyncio.sleep(0)
+
+    assert calls == ["gpt", "azure/gpt"]
+    assert cancelled == ["gpt"]
+
+
+@pytest.mark.asyncio
+async def test_calls_cancelled_by_their_caller_are_not_recorded():
+    policy = _policy()
+    set_hedging_policy(policy)
+
+    async def call(model: str) -> str:
+        await asyncio.sleep(10)
+        return model
+
+    task = asyncio.ensure_future(hedged_call("gpt", call))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    # neither the call nor its hedge lost to a response
+    assert list(policy._latencies["gpt", False]) == [0.01] * 10
+
+
+@pytest.mark.asyncio
+async def test_fast_calls_are_not_hedged():
+    set_hedging_policy(_policy())
+    calls = []
+
+    async def call(model: str) -> str:
+        calls.append(model)
+        return model
+
+    assert await hedged_call("gpt", call) == "gpt"
+    assert calls == ["gpt"]
+
+
+@pytest.mark.asyncio
+async def test_hedge_rate_is_capped():
+    policy = _policy(max_hedge_rate=0.25)
+    set_hedging_policy(policy)
+    hedges = 0
+
+    for _ in range(8):
+        calls = []
+
+        async def call(model: str) -> str:
+            calls.append(model)
+            # the first call is slow, its hedge isn't
+            await asyncio.sleep(0.05 if len(calls) == 1 else 0)
+            return model
+
+        await hedged_call("gpt", call)
+        hedges += len(calls) - 1
+        # keep the hedge delay short
+        for _ in range(10):
+            policy.record("gpt", 0.01)
+
+    # the 18 calls allow 4.5 hedges
+    assert hedges == 4
+
+
+@pytest.mark.asyncio
+async def test_streams_are_hedged_until_their_first_token(monkeypatch):
+    policy = _policy()
+    set_hedging_policy(policy)
+    streams = []
+    closed = []
+
+    async def acompletion(**kwargs):
+        first = not streams
+
+        async def chunks():
+            try:
+                if first:
+                    await asyncio.sleep(10)
+                for text in ['{"text": ', '"hedged"}']:
+                    yield _chunk(text)
+            finally:
+                closed.append(first)
+
+        streams.append(chunks())
+        return streams[-1]
+
+    monkeypatch.setattr(
+        autoplan.llm_utils.stream_structured_completion, "acompletion", acompletion
+    )
+
+    items = [
+        item
+        async for item in stream_structured_completion(
+            model="gpt",
+            messages=[{"role": "user", "content": "hi"}],
+            response_format=Answer,
+            cache=False,
+        )
+    ]
+    await asyncio.sleep(0)
+
+    assert len(streams) == 2
+    assert items[-1] == Answer(text="hedged")
+    # both streams are closed, the slow one when it lost
+    assert sorted(closed) == [False, True]
+    # both times to first token are recorded, apart from the latencies of whole responses
+    assert len(policy._latencies["gpt", True]) == 12
+    assert len(policy._latencies["gpt", False]) == 10
@@ -0,0 +1,98 @@
+import json
+
+import httpx
+import pytest
+from pydantic import BaseModel
+
+from autoplan import aclose_http_clients
+from autoplan.llm_utils.create_partial_streaming_completion import (
+    _create_partial_streaming_completion_anthropic,
+    _create_partial_streaming_completion_openai,
+)
+from autoplan.llm_utils.http_clients import get_http_client
+
+
+class Answer(BaseModel):
+    text: str
+
+
+def _respond(request: httpx.Request) -> httpx.Response:
+    delta = {"tool_calls": [{"function": {"arguments": '{"text": "hello"}'}}]}
+    body = f"data: {json.dumps({'choices': [{'delta': delta}]})}\n\ndata: [DONE]\n\n"
+    return httpx.Response(
+        200, headers={"Content-Type": "text/event-stream"}, content=body
+    )
+
+
+@pytest.mark.asyncio
+async def test_caller_clients_are_left_open():
+    client = httpx.AsyncClient(transport=httpx.MockTransport(_respond))
+
+    for _ in range(2):
+        answers = [
+            answer
+            async for answer in _create_partial_streaming_completion_openai(
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": "hi"}],
+                response_format=Answer,
+                api_key="test",
+                httpx_client=client,
+            )
+        ]
+        assert answers[-1].text == "hello"
+
+    assert not client.is_closed
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_clients_are_pooled_by_host():
+    client = get_http_client("https://api.openai.com/v1/chat/completions")
+
+    assert get_http_client("https://api.openai.com/v1/embeddings") is client
+    assert get_http_client("https://api.anthropic.com/v1/messages") is not client
+
+    await aclose_http_clients()
+
+    assert client.is_closed
+    # a new client is created after they are closed
+    assert get_http_client("https://api.openai.com/v1/chat/completions") is not client
+    await aclose_http_clients()
+
+
+def _respond_with_blocks(request: httpx.Request) -> httpx.Response:
+    events = []
+    for text in ['{"text": "a long first answer"}', '{"text": "b"}']:
+        events.append({"type": "content_block_start", "content_block": {"text": ""}})
+        for index in range(0, len(text), 4):
+            events.append(
+                {
+                    "type": "content_block_delta",
+                    "delta": {"text": text[index : index + 4]},
+                }
+            )
+    events.append({"type": "message_stop"})
+    body = "".join(f"data: {json.dumps(event)}\n\n" for event in events)
+    return httpx.Response(
+        200, headers={"Content-Type": "text/event-stream"}, content=body
+    )
+
+
+@pytest.mark.asyncio
+async def test_anthropic_content_blocks_are_all_streamed():
+    client = httpx.AsyncClient(transport=httpx.MockTransport(_respond_with_blocks))
+
+    answers = [
+        answer
+        async for answer in _create_partial_streaming_completion_anthropic(
+            model="claude-3-5-sonnet",
+            messages=[{"role": "user", "content": "hi"}],
+            response_format=Answer,
+            api_key="test",
+            httpx_client=client,
+        )
+    ]
+    await client.aclose()
+
+    # the second block is shorter than the first one, and its results are still delivered
+    assert answers[-1].text == "b"
@@ -0,0 +1,153 @@
+import random
+from typing import Annotated, Literal
+
+import pytest
+from pydantic import BaseModel, Field
+
+from autoplan import Plan, Step, tool
+from autoplan.llm_utils.partial_output import (
+    PartialOutputParser,
+    _parse_output,
+    _Validator,
+)
+from autoplan.models import create_plan_class
+
+
+@tool
+async def search(query: str, limit: int = 10) -> str:
+    return query
+
+
+plan_class = create_plan_class(Step, Plan, [search])
+
+output = plan_class(
+    rationale='Search "twice", then \\ combine',
+    steps=[
+        {"tool_call": {"type": "search", "query": f'q"{i}\\', "limit": 10 + i}}
+        for i in range(5)
+    ],
+).model_dump_json()
+
+
+def _chunks(seed: int) -> list[str]:
+    rng = random.Random(seed)
+    chunks = []
+    index = 0
+    while index < len(output):
+        size = rng.randint(1, 6)
+        chunks.append(output[index : index + size])
+        index += size
+    return chunks
+
+
+@pytest.mark.parametrize("partial_strings", [False, True])
+@pytest.mark.parametrize("seed", range(5))
+def test_parser_returns_the_same_results_as_parsing_everything(seed, partial_strings):
+    parser = PartialOutputParser(plan_class, partial_strings)
+    prefix = ""
+    expected = []
+    results = []
+
+    for chunk in _chunks(seed):
+        prefix += chunk
+        parsed = _parse_output(prefix, plan_class, partial_strings)
+        if parsed is not None and (not expected or parsed != expected[-1]):
+            expected.append(parsed)
+
+        if (result := parser.feed(chunk)) is not None:
+            results.append(result)
+
+    assert results == expected
+    assert parser.result() == plan_class.model_validate_json(output)
+
+
+def test_chunks_inside_strings_are_not_parsed(monkeypatch):
+    validated = []
+
+    validate = _Validator.__call__
+    monkeypatch.setattr(
+        _Validator,
+        "__call__",
+        lambda self, value: validated.append(value) or validate(self, value),
+    )
+
+    parser = PartialOutputParser(plan_class)
+    parser.feed('{"rationale": "a long')
+    validated.clear()
+
+    for _ in range(100):
+        assert parser.feed(" rationale") is None
+    assert validated == []
+
+    assert parser.feed('", "steps": [').rationale == "a long" + " rationale" * 100
+
+
+def test_complete_steps_are_validated_once():
+    parser = PartialOutputParser(plan_class)
+    results = [r for chunk in _chunks(0) if (r := parser.feed(chunk)) is not None]
+
+    plans = [r for r in results if r.steps]
+    # the complete steps of the previous partial plans (all but the last one) are reused as they are
+    for previous, plan in zip(plans, plans[1:]):
+        for step, previous_step in zip(plan.steps, previous.steps[:-1]):
+            assert step is previous_step
+
+
+class Section(BaseModel):
+    title: str
+    scores: list[Annotated[int, Field(lt=50)]] = []
+
+
+class Report(BaseModel):
+    title: str
+    sections: list[Section]
+    tags: list[Literal["a", "b"]] = []
+
+
+report = Report(
+    title='A "report"',
+    sections=[
+        Section(title="one", scores=[1, 2]),
+        # not valid, so it's dropped with what follows it
+        Section.model_construct(title="two", scores=[3, 70, 4]),
+        Section(title="three"),
+    ],
+    tags=["a", "b"],
+).model_dump_json(warnings=False)
+
+
+@pytest.mark.parametrize("partial_strings", [False, True])
+@pytest.mark.parametrize("seed", range(5))
+def test_parser_drops_invalid_items_like_parsing_everything(seed, partial_strings):
+    rng = random.Random(seed)
+    parser = PartialOutputParser(Report, partial_strings)
+    prefix = ""
+    expected = []
+    results = []
+
+    index = 0
+    while index < len(report):
+        chunk = report[index : index + rng.randint(1, 6)]
+        index += len(chunk)
+        prefix += chunk
+
+        parsed = _parse_output(prefix, Report, partial_strings)
+        if parsed is not None and (not expected or parsed != expected[-1]):
+            expected.append(parsed)
+
+        if (result := parser.feed(chunk)) is not None:
+            results.append(result)
+
+    assert results == expected
+    assert [section.title for section in results[-1].sections] == ["one", "two"]
+    assert results[-1].sections[-1].scores == [3]
+
+
+def test_partial_results_are_throttled():
+    parser = PartialOutputParser(plan_class, min_interval=3600)
+
+    results = [parser.feed(chunk) for chunk in _chunks(0)]
+
+    # only the first change is returned within the interval
+    assert len([r for r in results if r is not None]) == 1
+    assert parser.result() == plan_class.model_validate_json(output)
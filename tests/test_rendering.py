@@ -0,0 +1,76 @@
+from pydantic import BaseModel
+
+from autoplan import Plan, Step, render_step_results, tool
+from autoplan.models import create_plan_class
+from autoplan.rendering import count_tokens
+
+
+class Prices(BaseModel):
+    name: str
+    closes: list[float]
+
+    def llm_view(self):
+        return {"name": self.name, "last_close": self.closes[-1]}
+
+
+@tool
+async def download(ticker: str) -> Prices:
+    return Prices(name=ticker, closes=[])
+
+
+@tool(render_result=lambda result: result["title"])
+async def search(query: str) -> dict:
+    return {}
+
+
+@tool
+async def read(url: str) -> str:
+    return url
+
+
+plan_class = create_plan_class(Step, Plan, [download, search, read])
+
+
+def _plan(*tool_calls):
+    return plan_class(
+        rationale="", steps=[{"tool_call": tool_call} for tool_call in tool_calls]
+    )
+
+
+def test_results_are_rendered_as_compact_json():
+    plan = _plan(
+        {"type": "download", "ticker": "NVDA"},
+        {"type": "search", "query": "nvidia"},
+        {"type": "read", "url": "a"},
+    )
+    results = [
+        Prices(name="NVDA", closes=[1.0, 2.0]),
+        {"title": "Nvidia", "body": "..."},
+        None,
+    ]
+
+    assert render_step_results(plan, results) == "\n".join(
+        [
+            'Step 0: download({"ticker":"NVDA"}) -> {"name":"NVDA","last_close":2.0}',
+            'Step 1: search({"query":"nvidia"}) -> "Nvidia"',
+            'Step 2: read({"url":"a"}) -> null',
+        ]
+    )
+
+
+def test_largest_results_are_summarized_to_fit_the_budget():
+    plan = _plan(
+        {"type": "read", "url": "small"},
+        {"type": "read", "url": "large"},
+        {"type": "read", "url": "list"},
+    )
+    results = ["a short page", "word " * 5000, list(range(1000))]
+
+    rendered = render_step_results(plan, results, max_tokens=300)
+    small, large, numbers = rendered.split("\n")
+
+    assert count_tokens(rendered) <= 300
+    # the small result is kept whole, and the others are summarized
+    assert small.endswith('-> "a short page"')
+    assert "more characters" in large
+    assert "more items" in numbers and numbers.endswith("999]")
@@ -0,0 +1,116 @@
+import httpx
+import pytest
+from pydantic import BaseModel
+
+import autoplan.llm_utils.stream_structured_completion
+from autoplan import RetryPolicy, set_retry_policy
+from autoplan.llm_utils.retry import retry_call, start_retry_budget
+from autoplan.llm_utils.stream_structured_completion import (
+    stream_structured_completion,
+)
+from tests.test_generate_plan import _chunk
+
+
+class Answer(BaseModel):
+    title: str
+    text: str
+
+
+@pytest.fixture(autouse=True)
+def retry_policy():
+    set_retry_policy(RetryPolicy(initial_delay=0))
+    yield
+    set_retry_policy(RetryPolicy())
+
+
+def _error(status_code: int, headers: dict | None = None) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(status_code, headers=headers, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+
+def test_transient_errors_are_retried_with_backoff():
+    policy = RetryPolicy(initial_delay=1, max_delay=3, jitter=False)
+
+    assert [policy.delay(_error(503), attempt) for attempt in [1, 2]] == [1, 2]
+    assert policy.delay(httpx.ConnectError("refused"), 1) == 1
+    # the backoff is capped, and the attempts are limited
+    policy.max_attempts = 10
+    assert policy.delay(_error(500), 5) == 3
+    assert policy.delay(_error(500), 10) is None
+    # errors of the request aren't retried
+    assert policy.delay(_error(400), 1) is None
+
+
+def test_retry_after_is_honored():
+    policy = RetryPolicy(max_delay=30)
+
+    assert policy.delay(_error(429, {"retry-after": "7"}), 1) == 7
+    assert policy.delay(_error(429, {"retry-after-ms": "250"}), 1) == 0.25
+    # waiting longer than the maximum delay isn't worth it
+    assert policy.delay(_error(429, {"retry-after": "120"}), 1) is None
+
+
+@pytest.mark.asyncio
+async def test_runs_have_a_retry_budget():
+    set_retry_policy(RetryPolicy(initial_delay=0, max_retries_per_run=1))
+    start_retry_budget()
+
+    def failing_once():
+        errors = [_error(503)]
+
+        async def call():
+            if errors:
+                raise errors.pop()
+            return "ok"
+
+        return call
+
+    assert await retry_call(failing_once()) == "ok"
+
+    # the run used its only retry
+    with pytest.raises(httpx.HTTPStatusError):
+        await retry_call(failing_once())
+
+
+@pytest.mark.asyncio
+async def test_failed_streams_start_over_without_repeating_partial_results(
+    monkeypatch,
+):
+    output = Answer(title="Nvidia", text="It went up a lot.").model_dump_json()
+    attempts = []
+
+    async def acompletion(**kwargs):
+        attempts.append(kwargs)
+        first_attempt = len(attempts) == 1
+
+        async def chunks():
+            for i in range(0, len(output), 3):
+                # the connection drops in the middle of the first attempt
+                if first_attempt and i > len(output) // 2:
+                    raise httpx.RemoteProtocolError("connection closed")
+                yield _chunk(output[i : i + 3])
+
+        return chunks()
+
+    monkeypatch.setattr(
+        autoplan.llm_utils.stream_structured_completion, "acompletion", acompletion
+    )
+
+    items = [
+        item
+        async for item in stream_structured_completion(
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": "hi"}],
+            response_format=Answer,
+            partial_strings=True,
+        )
+    ]
+
+    assert len(attempts) == 2
+    assert items[-1] == Answer.model_validate_json(output)
+    # the partial results keep growing, even across the restart
+    texts = [item.text or "" for item in items]
+    assert texts == sorted(texts, key=len)
+    partials = items[:-1]
+    assert len(set(map(str, partials))) == len(partials)
@@ -0,0 +1,203 @@
+import asyncio
+
+import pytest
+
+from autoplan.models import Step
+from autoplan.results import StepResult
+from autoplan.scheduler import (
+    FailurePolicy,
+    StepFailedError,
+    StepScheduler,
+    failed_step_result,
+)
+from autoplan.tool import PriorToolResult, tool
+
+
+@tool(can_use_prior_results=True)
+async def append(text: str) -> str:
+    return text + "a"
+
+
+def _step(text: str | PriorToolResult) -> Step:
+    return Step(tool_call=append(text=text))
+
+
+def _prior(index: int) -> PriorToolResult:
+    return PriorToolResult(step_index_zero_indexed=index)
+
+
+async def _execute(index: int, step: Step) -> StepResult:
+    return StepResult(step=step, result=await step.tool_call())
+
+
+@pytest.mark.asyncio
+async def test_chain_runs_in_dependency_order():
+    scheduler = StepScheduler(_execute)
+
+    # added in reverse order to check that steps wait for later-added dependencies
+    for index in reversed(range(1, 10)):
+        scheduler.add_step(index, _step(_prior(index - 1)))
+    scheduler.add_step(0, _step(""))
+    scheduler.close()
+
+    results = await scheduler.wait()
+
+    assert [r.result for r in results] == ["a" * i for i in range(1, 11)]
+
+
+@pytest.mark.asyncio
+async def test_step_starts_when_last_dependency_resolves():
+    started = []
+    release = asyncio.Event()
+
+    async def execute(index: int, step: Step) -> StepResult:
+        started.append(index)
+        if index == 0:
+            await release.wait()
+        return await _execute(index, step)
+
+    scheduler = StepScheduler(execute)
+    scheduler.add_step(0, _step(""))
+    scheduler.add_step(1, _step("b"))
+    scheduler.add_step(2, _step(_prior(0)))
+    scheduler.close()
+
+    await asyncio.sleep(0)
+    assert started == [0, 1]
+
+    release.set()
+    results = await scheduler.wait()
+
+    assert started == [0, 1, 2]
+    assert [r.result for r in results] == ["a", "ba", "aa"]
+
+
+@pytest.mark.asyncio
+async def test_circular_dependencies_fail():
+    scheduler = StepScheduler(_execute)
+    scheduler.add_step(0, _step(_prior(1)))
+    scheduler.add_step(1, _step(_prior(0)))
+    scheduler.add_step(2, _step("x"))
+    scheduler.close()
+
+    results = await scheduler.wait()
+
+    assert [r.status for r in results] == ["failed", "failed", "succeeded"]
+    assert "circular" in (results[0].error or "")
+
+
+@pytest.mark.asyncio
+async def test_missing_dependency_fails():
+    scheduler = StepScheduler(_execute)
+    scheduler.add_step(0, _step(_prior(5)))
+    scheduler.close()
+
+    [result] = await scheduler.wait()
+
+    assert result.status == "failed"
+    assert "not part of the plan" in (result.error or "")
+
+
+@tool(can_use_prior_results=True)
+async def fail(text: str) -> str:
+    raise RuntimeError("boom")
+
+
+def _failing_plan(scheduler: StepScheduler):
+    """
+    Step 0 fails, step 1 depends on it, step 2 depends on step 1 and step 3 is independent.
+    """
+    scheduler.add_step(0, Step(tool_call=fail(text="x")))
+    scheduler.add_step(1, _step(_prior(0)))
+    scheduler.add_step(2, _step(_prior(1)))
+    scheduler.add_step(3, _step("y"))
+    scheduler.close()
+
+
+async def _execute_catching(index: int, step: Step) -> StepResult:
+    try:
+        return await _execute(index, step)
+    except Exception as e:
+        return failed_step_result(step, e)
+
+
+@pytest.mark.asyncio
+async def test_skip_dependents_policy():
+    reported = []
+
+    async def report(step_result: StepResult):
+        reported.append(step_result)
+
+    scheduler = StepScheduler(_execute_catching, report=report)
+    _failing_plan(scheduler)
+
+    results = await scheduler.wait()
+
+    assert [r.status for r in results] == ["failed", "skipped", "skipped", "succeeded"]
+    assert results[0].error == "RuntimeError: boom"
+    assert results[2].error == "Skipped because step 1 skipped"
+    assert len(reported) == 4
+
+
+@pytest.mark.asyncio
+async def test_continue_policy():
+    scheduler = StepScheduler(
+        _execute_catching, failure_policy=FailurePolicy.CONTINUE
+    )
+    _failing_plan(scheduler)
+
+    results = await scheduler.wait()
+
+    # step 1 runs with None instead of the failed result, which isn't a valid argument
+    assert [r.status for r in results] == ["failed", "failed", "failed", "succeeded"]
+
+
+@pytest.mark.asyncio
+async def test_fail_fast_policy_cancels_other_steps():
+    cancelled = asyncio.Event()
+
+    async def execute(index: int, step: Step) -> StepResult:
+        if index == 0:
+            # let the independent step start before failing
+            await asyncio.sleep(0.01)
+        if index == 3:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        return await _execute_catching(index, step)
+
+    scheduler = StepScheduler(execute, failure_policy=FailurePolicy.FAIL_FAST)
+    _failing_plan(scheduler)
+
+    with pytest.raises(StepFailedError) as error:
+        await scheduler.wait()
+
+    assert error.value.step_result.error == "RuntimeError: boom"
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_identical_steps_are_executed_once():
+    executed = []
+
+    async def execute(index: int, step: Step) -> StepResult:
+        executed.append(index)
+        return await _execute(index, step)
+
+    scheduler = StepScheduler(execute, deduplicate=True)
+    scheduler.add_step(0, _step("x"))
+    scheduler.add_step(1, _step("x"))
+    # identical once the references to identical steps are resolved
+    scheduler.add_step(2, _step(_prior(0)))
+    scheduler.add_step(3, _step(_prior(1)))
+    scheduler.add_step(4, _step("y"))
+    scheduler.close()
+
+    results = await scheduler.wait()
+
+    assert sorted(executed) == [0, 2, 4]
+    assert [r.result for r in results] == ["xa", "xa", "xaa", "xaa", "ya"]
+    # each step is reported with its own arguments
+    assert results[3].step.tool_call.text == "xa"
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from autoplan import tool
+from autoplan.single_flight import SingleFlight
+
+calls = []
+
+
+async def _slow(value):
+    calls.append(value)
+    await asyncio.sleep(0.02)
+    return value
+
+
+@pytest.fixture(autouse=True)
+def clear_calls():
+    calls.clear()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_calls_are_made_once():
+    flight = SingleFlight()
+
+    results = await asyncio.gather(
+        *(flight.call("a", lambda: _slow("a")) for _ in range(10)),
+        flight.call("b", lambda: _slow("b")),
+    )
+
+    assert results == ["a"] * 10 + ["b"]
+    assert sorted(calls) == ["a", "b"]
+    assert len(flight) == 0
+
+    # the call isn't in flight anymore, so it's made again
+    await flight.call("a", lambda: _slow("a"))
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_calls_are_cancelled_with_their_last_caller():
+    flight = SingleFlight()
+
+    first = asyncio.create_task(flight.call("a", lambda: _slow("a")))
+    second = asyncio.create_task(flight.call("a", lambda: _slow("a")))
+    await asyncio.sleep(0)
+
+    # the other caller still gets the result
+    first.cancel()
+    assert await second == "a"
+
+    third = asyncio.create_task(flight.call("b", lambda: _slow("b")))
+    await asyncio.sleep(0)
+    third.cancel()
+    await asyncio.gather(third, return_exceptions=True)
+    await asyncio.sleep(0)
+
+    assert len(flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_callers_dont_join_abandoned_calls():
+    flight = SingleFlight()
+
+    async def slow_to_stop(value):
+        calls.append(value)
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            # e.g. closing a connection
+            await asyncio.sleep(0.02)
+            raise
+        return value
+
+    first = asyncio.create_task(flight.call("a", lambda: slow_to_stop("a")))
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.gather(first, return_exceptions=True)
+
+    # the abandoned call is still stopping, so a new one is made
+    assert await flight.call("a", lambda: _slow("b")) == "b"
+    assert calls == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_callers_joining_a_stream_get_all_its_items():
+    flight = SingleFlight()
+
+    async def numbers():
+        calls.append("numbers")
+        for number in range(3):
+            await asyncio.sleep(0.01)
+            yield number
+
+    async def consume(delay: float):
+        await asyncio.sleep(delay)
+        return [number async for number in flight.stream("numbers", numbers)]
+
+    # the second consumer joins after the first number was streamed
+    assert await asyncio.gather(consume(0), consume(0.015)) == [[0, 1, 2]] * 2
+    assert calls == ["numbers"]
+
+
+@tool(coalesce=True)
+async def coalesced(ticker: str) -> str:
+    return await _slow(ticker)
+
+
+@tool
+async def not_coalesced(ticker: str) -> str:
+    return await _slow(ticker)
+
+
+@pytest.mark.asyncio
+async def test_tools_can_coalesce_calls():
+    # e.g. the same call made by concurrent runs
+    await asyncio.gather(*(coalesced(ticker="^GSPC")() for _ in range(5)))
+    assert calls == ["^GSPC"]
+
+    calls.clear()
+    await asyncio.gather(*(not_coalesced(ticker="^GSPC")() for _ in range(5)))
+    assert calls == ["^GSPC"] * 5
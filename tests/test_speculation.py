@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+from pydantic import BaseModel
+
+from autoplan import (
+    FinalResult,
+    Plan,
+    Speculator,
+    Step,
+    StepResult,
+    tool,
+    with_planning,
+)
+
+calls = []
+cancelled = []
+
+
+class Output(BaseModel):
+    answer: str
+
+
+@tool
+async def download(ticker: str) -> str:
+    calls.append(ticker)
+    try:
+        await asyncio.sleep(0.05)
+    except asyncio.CancelledError:
+        cancelled.append(ticker)
+        raise
+    if ticker == "FAIL":
+        raise ValueError("unknown ticker")
+    return ticker
+
+
+@pytest.fixture(autouse=True)
+def planned_downloads(use_plan):
+    calls.clear()
+    cancelled.clear()
+
+    use_plan(
+        lambda context: [
+            {"tool_call": {"type": "download", "ticker": ticker}}
+            for ticker in context.application_args["tickers"].split(",")
+        ],
+        # planning takes a while, so speculative calls start first
+        planning_time=0.01,
+    )
+
+
+def _app(speculator: Speculator):
+    @with_planning(
+        step_class=Step,
+        plan_class=Plan,
+        tools=[download],
+        generate_plan_prompt_generator=lambda context, args: [""],
+        combine_steps_prompt_generator=lambda context, plan, results: results,
+        speculator=speculator,
+    )
+    async def app(tickers: str) -> Output:
+        pass
+
+    return app
+
+
+async def _answer(app, tickers: str) -> str:
+    async for r in app(tickers):
+        if isinstance(r, FinalResult):
+            return r.result.answer
+    raise AssertionError("no final result")
+
+
+@pytest.mark.asyncio
+async def test_predicted_calls_are_reused_or_discarded():
+    speculator = Speculator(
+        predict=lambda args: [download(ticker="^GSPC"), download(ticker="^DJI")]
+    )
+
+    assert await _answer(_app(speculator), "^GSPC,NVDA") == "^GSPC,NVDA"
+
+    # the predicted call used by the plan isn't made again, and the other one is cancelled
+    assert sorted(calls) == ["NVDA", "^DJI", "^GSPC"]
+    assert cancelled == ["^DJI"]
+    assert (speculator.hits, speculator.misses) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_calls_are_learned_from_history():
+    speculator = Speculator(max_calls=1)
+    app = _app(speculator)
+
+    for tickers in ["^GSPC,NVDA", "^GSPC,AMZN"]:
+        await _answer(app, tickers)
+    assert speculator.hits == 0
+
+    # ^GSPC was part of every plan, so it starts with the next run
+    assert [call.ticker for call in speculator.predictions({})] == ["^GSPC"]
+    await _answer(app, "^GSPC,MSFT")
+    assert speculator.hits == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_predicted_calls_fail_their_step():
+    speculator = Speculator(predict=lambda args: [download(ticker="FAIL")])
+
+    results = [r async for r in _app(speculator)("FAIL")]
+
+    # the failed call isn't made again
+    assert calls == ["FAIL"]
+    [step_result] = [r for r in results if isinstance(r, StepResult)]
+    assert step_result.status == "failed"
+    assert step_result.error == "ValueError: unknown ticker"
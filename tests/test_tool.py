@@ -0,0 +1,58 @@
+import pytest
+
+from autoplan import DiskCache, InMemoryCache, tool
+from autoplan.tool import _function_to_tool_subclass
+
+
+@pytest.mark.asyncio
+async def test_tool_results_are_cached():
+    calls = []
+
+    @tool(cache=InMemoryCache())
+    async def double(x: int) -> int:
+        calls.append(x)
+        return x * 2
+
+    first = double(x=1)
+    assert await first() == 2
+    assert first._cache_hit is False
+
+    second = double(x=1)
+    assert await second() == 2
+    assert second._cache_hit is True
+
+    assert await double(x=2)() == 4
+    assert calls == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_tool_cache_is_shared_on_disk(tmp_path):
+    async def double(x: int) -> int:
+        return x * 2
+
+    cache = DiskCache(str(tmp_path))
+    await tool(cache=cache)(double)(x=1)()
+
+    # a separate tool class (e.g. in another process) reuses the result
+    other = tool(cache=DiskCache(str(tmp_path)))(double)(x=1)
+    assert await other() == 2
+    assert other._cache_hit is True
+
+
+@pytest.mark.asyncio
+async def test_tool_cache_is_invalidated_when_the_source_changes():
+    cache = InMemoryCache()
+
+    async def version_1(x: int) -> int:
+        return 1
+
+    async def version_2(x: int) -> int:
+        return 2
+
+    version_2.__name__ = "version_1"
+
+    first = _function_to_tool_subclass(version_1, cache=cache)
+    second = _function_to_tool_subclass(version_2, cache=cache)
+
+    assert await first(x=1)() == 1
+    assert await second(x=1)() == 2